@@ -0,0 +1,329 @@
+import json
+import threading
+from typing import Dict, List, Optional, Set
+from backend.tools.tools_sql_connect import db
+from backend.tools.global_context import log_queue_ctx
+from backend.tools.tools_log_bus import AsyncLogQueue
+from backend.books.tools_import_step1_split import execute_split_task
+from backend.books.tools_import_step2_process import execute_process_task, resume_process_task
+from backend.books.tools_import_step3_embed import execute_embed_task
+from config import config
+
+# ==================== 基础配置 ====================
+# 每个任务 = 一本书的一串步骤 (默认 切分 -> AI处理 -> 入库)，持久化在 import_jobs 表
+# 同一本书同时只能有一个排队/运行中的任务；GPU 步骤 (本地大模型/嵌入模型) 与 CPU 步骤分别限并发
+STEP_FUNCS = {
+    "split": execute_split_task,
+    "process": execute_process_task,
+    "resume": resume_process_task,
+    "embed": execute_embed_task,
+}
+STEP_RESOURCE = {"split": "cpu", "process": "gpu", "resume": "gpu", "embed": "gpu"}
+DEFAULT_CHAIN = ["split", "process", "embed"]
+
+GPU_CONCURRENCY = getattr(config, "IMPORT_GPU_CONCURRENCY", 1)
+CPU_CONCURRENCY = getattr(config, "IMPORT_CPU_CONCURRENCY", 2)
+LOG_BUFFER_LINES = 5000   # 每个任务在内存中保留的日志行数 (SSE 断线重连时从这里续读)
+KEEP_FINISHED_LOGS = 50   # 已结束任务的日志最多保留多少个
+DISPATCH_INTERVAL = 2     # 调度线程兜底轮询间隔 (秒)
+
+
+class JobLog:
+    """
+    单个任务的日志缓冲
+    步骤函数通过 log_queue_ctx 把它当队列用 (put "LOG: ..." / "DATA: ...")；
+    读取方用 follow_async 按行号续读 (浏览器刷新后带上次的行号重新连上即可)，
+    新行直接投递到订阅者的事件循环，不占用请求线程
+    """
+
+    def __init__(self, max_lines: int = LOG_BUFFER_LINES):
+        self._lines: List[str] = []
+        self._base = 0  # _lines[0] 的行号
+        self._max = max_lines
+        self._lock = threading.Lock()  # 保护缓冲与订阅列表
+        self._subscribers: List[AsyncLogQueue] = []
+        self.closed = False
+
+    def put(self, msg: str):
+        with self._lock:
+            self._lines.append(msg)
+            overflow = len(self._lines) - self._max
+            if overflow > 0:
+                del self._lines[:overflow]
+                self._base += overflow
+            for sub in self._subscribers:
+                sub.put(msg)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            for sub in self._subscribers:
+                sub.close()
+
+    async def follow_async(self, offset: int = 0, heartbeat: float = 15):
+        """
+        异步续读：先产出 offset 之后的缓冲行，再实时产出新行，直到任务结束
+        产出 (行号, 内容)；空闲超过 heartbeat 秒产出 (None, None) 作为心跳
+        """
+        sub = AsyncLogQueue()
+        with self._lock:
+            # 取快照与登记订阅在同一把锁里，保证不丢行也不重复
+            start = max(offset, self._base)
+            backlog = self._lines[start - self._base:]
+            closed = self.closed
+            if not closed:
+                self._subscribers.append(sub)
+        try:
+            line_no = start
+            for line in backlog:
+                yield line_no, line
+                line_no += 1
+            if closed: return
+            async for line in sub.iter(heartbeat):
+                if line is None:
+                    yield None, None
+                    continue
+                yield line_no, line
+                line_no += 1
+        finally:
+            with self._lock:
+                if sub in self._subscribers:
+                    self._subscribers.remove(sub)
+
+
+class ImportScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._slots = {"gpu": threading.Semaphore(GPU_CONCURRENCY), "cpu": threading.Semaphore(CPU_CONCURRENCY)}
+        self._logs: Dict[int, JobLog] = {}
+        self._logs_lock = threading.Lock()
+        self._running_books: Set[int] = set()
+        self._cancel: Set[int] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._table_ready = False
+
+    # ---------- 表 ----------
+    def ensure_table(self):
+        if self._table_ready: return
+        res = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            job_id INT AUTO_INCREMENT PRIMARY KEY,
+            book_id INT NOT NULL,
+            steps VARCHAR(100) NOT NULL,
+            current_step VARCHAR(20) DEFAULT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            error_msg TEXT,
+            create_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+            start_time DATETIME DEFAULT NULL,
+            finish_time DATETIME DEFAULT NULL,
+            KEY idx_status (status, job_id),
+            KEY idx_book (book_id, status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        self._table_ready = res is not None
+
+    # ---------- 启动 / 提交 / 取消 ----------
+    def start(self):
+        """启动调度线程；上次进程退出时还在运行的任务重新排队 (从中断的步骤继续)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive(): return
+            self.ensure_table()
+            recovered = db.execute_update("UPDATE import_jobs SET status='queued' WHERE status='running'")
+            if recovered:
+                print(f"♻️ [ImportScheduler] {recovered} 个中断的导入任务已重新排队")
+            self._thread = threading.Thread(target=self._dispatch_loop, name="import-scheduler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def submit(self, book_id: int, steps: Optional[List[str]] = None) -> Dict:
+        steps = steps or DEFAULT_CHAIN
+        unknown = [s for s in steps if s not in STEP_FUNCS]
+        if unknown:
+            return {"status": "error", "msg": f"未知步骤: {', '.join(unknown)}"}
+        self.start()
+
+        with self._lock:
+            active = db.execute_query(
+                "SELECT job_id FROM import_jobs WHERE book_id=%s AND status IN ('queued', 'running') LIMIT 1",
+                (book_id,), fetch_one=True
+            )
+            if active:
+                return {"status": "error", "msg": f"该书已有任务在排队或运行 (任务 #{active['job_id']})",
+                        "job_id": active['job_id']}
+
+            conn = db.get_connection()
+            if not conn:
+                return {"status": "error", "msg": "数据库连接失败"}
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO import_jobs (book_id, steps, status) VALUES (%s, %s, 'queued')",
+                                   (book_id, ",".join(steps)))
+                    job_id = cursor.lastrowid
+                    conn.commit()
+            finally:
+                conn.close()
+            self._log_for(job_id).put(f"LOG: 📥 任务 #{job_id} 已排队: {' -> '.join(steps)}")
+
+        self._wake.set()
+        return {"status": "success", "job_id": job_id}
+
+    def cancel(self, job_id: int) -> Dict:
+        """排队中的任务直接取消；运行中的任务在当前步骤结束后停止"""
+        affected = db.execute_update(
+            "UPDATE import_jobs SET status='cancelled', finish_time=NOW() WHERE job_id=%s AND status='queued'",
+            (job_id,)
+        )
+        if affected:
+            log = self._log_for(job_id)
+            log.put("LOG: 🛑 任务已取消")
+            log.put(f"DATA: {json.dumps({'status': 'cancelled'}, ensure_ascii=False)}")
+            log.close()
+            return {"status": "success", "msg": "已取消"}
+
+        job = self.get_job(job_id)
+        if job and job['status'] == 'running':
+            self._cancel.add(job_id)
+            self._log_for(job_id).put("LOG: 🛑 已请求取消，当前步骤结束后停止")
+            return {"status": "success", "msg": "当前步骤结束后停止"}
+        return {"status": "error", "msg": "任务不存在或已结束"}
+
+    # ---------- 查询 ----------
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        self.ensure_table()
+        return db.execute_query("SELECT * FROM import_jobs WHERE job_id=%s", (job_id,), fetch_one=True) or None
+
+    def list_jobs(self, book_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        self.ensure_table()
+        sql = "SELECT * FROM import_jobs"
+        params = []
+        if book_id:
+            sql += " WHERE book_id=%s"
+            params.append(book_id)
+        sql += " ORDER BY job_id DESC LIMIT %s"
+        params.append(limit)
+        return db.execute_query(sql, tuple(params)) or []
+
+    def get_log(self, job_id: int) -> Optional[JobLog]:
+        """
+        运行/排队中的任务返回日志缓冲；进程重启前已结束的任务没有日志，返回 None
+        重启后重新排队的任务在真正运行前还没有缓冲，这里按需创建，运行时会继续写入同一个缓冲
+        """
+        with self._logs_lock:
+            log = self._logs.get(job_id)
+        if log is not None: return log
+        job = self.get_job(job_id)
+        if job and job['status'] in ('queued', 'running'):
+            return self._log_for(job_id)
+        return None
+
+    def _log_for(self, job_id: int) -> JobLog:
+        with self._logs_lock:
+            log = self._logs.get(job_id)
+            if log is None:
+                log = self._logs[job_id] = JobLog()
+            return log
+
+    def _prune_logs(self):
+        """只保留最近 KEEP_FINISHED_LOGS 个已结束任务的日志"""
+        with self._logs_lock:
+            finished = sorted(jid for jid, log in self._logs.items() if log.closed)
+            for jid in finished[:-KEEP_FINISHED_LOGS]:
+                del self._logs[jid]
+
+    # ---------- 调度 ----------
+    def _dispatch_loop(self):
+        while True:
+            self._wake.wait(DISPATCH_INTERVAL)
+            self._wake.clear()
+            try:
+                self._dispatch()
+            except Exception as e:
+                print(f"❌ [ImportScheduler] 调度异常: {e}")
+
+    def _dispatch(self):
+        """按提交顺序启动任务：书本空闲且第一步所需资源有空位才启动 (资源名额交给任务线程)"""
+        queued = db.execute_query("SELECT * FROM import_jobs WHERE status='queued' ORDER BY job_id") or []
+        for job in queued:
+            if job['book_id'] in self._running_books: continue
+            steps = self._remaining_steps(job)
+            if not steps:
+                self._finish(job, "success")
+                continue
+            slot = self._slots[STEP_RESOURCE[steps[0]]]
+            if not slot.acquire(blocking=False): continue
+
+            claimed = db.execute_update(
+                "UPDATE import_jobs SET status='running', start_time=COALESCE(start_time, NOW()) "
+                "WHERE job_id=%s AND status='queued'", (job['job_id'],)
+            )
+            if not claimed:
+                slot.release()
+                continue
+            self._running_books.add(job['book_id'])
+            threading.Thread(target=self._run_job, args=(job, steps, slot),
+                             name=f"import-job-{job['job_id']}", daemon=True).start()
+
+    @staticmethod
+    def _remaining_steps(job: Dict) -> List[str]:
+        """从 current_step (中断时正在执行的步骤) 开始的剩余步骤"""
+        steps = [s for s in (job['steps'] or "").split(",") if s]
+        if job.get('current_step') in steps:
+            steps = steps[steps.index(job['current_step']):]
+        return steps
+
+    def _run_job(self, job: Dict, steps: List[str], first_slot: threading.Semaphore):
+        job_id, book_id = job['job_id'], job['book_id']
+        log = self._log_for(job_id)
+        token = log_queue_ctx.set(log)
+        status, error = "success", None
+        try:
+            for i, step in enumerate(steps):
+                if job_id in self._cancel:
+                    status = "cancelled"
+                    log.put("LOG: 🛑 任务已取消")
+                    break
+
+                db.execute_update("UPDATE import_jobs SET current_step=%s WHERE job_id=%s", (step, job_id))
+                slot = first_slot if i == 0 else self._slots[STEP_RESOURCE[step]]
+                if i > 0:
+                    log.put(f"LOG: ⏳ 等待 {STEP_RESOURCE[step].upper()} 资源: {step}")
+                    slot.acquire()
+                try:
+                    log.put(f"LOG: ▶️ [任务 #{job_id}] 开始步骤: {step}")
+                    res = STEP_FUNCS[step](book_id)
+                finally:
+                    slot.release()
+
+                if isinstance(res, dict) and res.get('status') == 'error':
+                    status, error = "error", f"{step}: {res.get('msg')}"
+                    log.put(f"LOG: ❌ 步骤 {step} 失败: {res.get('msg')}")
+                    break
+                log.put(f"LOG: ✅ 步骤完成: {step}")
+        except Exception as e:
+            status, error = "error", str(e)
+            log.put(f"LOG: ❌ 任务异常: {e}")
+        finally:
+            try: log_queue_ctx.reset(token)
+            except: pass
+            self._finish(job, status, error)
+
+    def _finish(self, job: Dict, status: str, error: Optional[str] = None):
+        job_id = job['job_id']
+        db.execute_update(
+            "UPDATE import_jobs SET status=%s, error_msg=%s, finish_time=NOW() WHERE job_id=%s",
+            (status, error, job_id)
+        )
+        log = self._log_for(job_id)
+        payload = {"status": status, "job_id": job_id}
+        if error: payload["msg"] = error
+        log.put(f"DATA: {json.dumps(payload, ensure_ascii=False)}")
+        log.close()
+        self._prune_logs()
+
+        self._cancel.discard(job_id)
+        self._running_books.discard(job['book_id'])
+        self._wake.set()
+
+
+import_scheduler = ImportScheduler()
@@ -0,0 +1,175 @@
+import json
+import threading
+from typing import Dict, List, Optional
+from backend.tools.tools_sql_connect import db
+
+# ==================== 基础配置 ====================
+# book_process_checkpoint：AI 处理的阅读状态断点 (ReadingState 层级)，与窗口结果同一事务写入
+#   chapter_start = 章节第一个分段的 segment_order，整本顺序处理时为 0
+# book_failed_windows：解析/调用失败 (is_processed=-1) 的窗口重试队列，记录失败时的上下文
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def ensure_tables():
+    global _table_ready
+    if _table_ready: return
+    with _table_lock:
+        if _table_ready: return
+        res1 = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS book_process_checkpoint (
+            book_id INT NOT NULL,
+            chapter_start INT NOT NULL DEFAULT 0,
+            last_segment_order INT NOT NULL,
+            reading_state TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (book_id, chapter_start)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        res2 = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS book_failed_windows (
+            book_id INT NOT NULL,
+            start_order INT NOT NULL,
+            end_order INT NOT NULL,
+            context TEXT,
+            attempts INT NOT NULL DEFAULT 0,
+            last_error VARCHAR(500) DEFAULT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (book_id, start_order)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        _table_ready = res1 is not None and res2 is not None
+
+
+# ==================== 1. 阅读状态断点 ====================
+
+def save_checkpoint(cursor, book_id: int, chapter_start: int, levels: Dict, last_order: int):
+    """在调用方的事务里写断点 (与片段、分段状态一起提交)"""
+    cursor.execute("""
+        INSERT INTO book_process_checkpoint (book_id, chapter_start, last_segment_order, reading_state)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE last_segment_order = VALUES(last_segment_order), reading_state = VALUES(reading_state)
+    """, (book_id, chapter_start, last_order, json.dumps(levels, ensure_ascii=False)))
+
+
+def load_state_before(book_id: int, order: int, lo: int = 0) -> Optional[Dict]:
+    """取 segment_order 在 [lo, order) 之间最近一次断点的层级，没有返回 None"""
+    ensure_tables()
+    row = db.execute_query(
+        "SELECT reading_state FROM book_process_checkpoint "
+        "WHERE book_id=%s AND last_segment_order < %s AND last_segment_order >= %s "
+        "ORDER BY last_segment_order DESC LIMIT 1",
+        (book_id, order, lo), fetch_one=True
+    )
+    if not row or not row.get('reading_state'): return None
+    try:
+        return json.loads(row['reading_state'])
+    except ValueError:
+        return None
+
+
+# ==================== 2. 失败窗口重试队列 ====================
+
+def enqueue_failed(cursor, book_id: int, start_order: int, end_order: int, context: Dict,
+                   attempts: int = 0, error: str = ""):
+    """在调用方的事务里登记一个失败窗口 (同一起点重复登记时覆盖)"""
+    cursor.execute("""
+        INSERT INTO book_failed_windows (book_id, start_order, end_order, context, attempts, last_error)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE end_order = VALUES(end_order), context = VALUES(context),
+                                attempts = VALUES(attempts), last_error = VALUES(last_error)
+    """, (book_id, start_order, end_order, json.dumps(context or {}, ensure_ascii=False), attempts,
+          (error or "")[:500]))
+
+
+def enqueue_orphans(book_id: int):
+    """把没有队列记录的 -1 分段 (例如升级前失败的) 按连续区间补登记，上下文为空"""
+    ensure_tables()
+    failed = db.execute_query(
+        "SELECT segment_order FROM book_segments WHERE book_id=%s AND is_processed=-1 ORDER BY segment_order",
+        (book_id,)
+    ) or []
+    if not failed: return
+    windows = load_failed(book_id)
+
+    def covered(order):
+        return any(w['start_order'] <= order <= w['end_order'] for w in windows)
+
+    runs, run = [], []
+    for r in failed:
+        order = r['segment_order']
+        if covered(order):
+            if run: runs.append(run); run = []
+            continue
+        if run and order != run[-1] + 1:
+            runs.append(run); run = []
+        run.append(order)
+    if run: runs.append(run)
+    if not runs: return
+
+    conn = db.get_connection()
+    if not conn: return
+    try:
+        with conn.cursor() as cursor:
+            for run in runs:
+                enqueue_failed(cursor, book_id, run[0], run[-1], {})
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def load_failed(book_id: int, max_attempts: Optional[int] = None) -> List[Dict]:
+    ensure_tables()
+    sql = "SELECT * FROM book_failed_windows WHERE book_id=%s"
+    params = [book_id]
+    if max_attempts is not None:
+        sql += " AND attempts < %s"
+        params.append(max_attempts)
+    rows = db.execute_query(sql + " ORDER BY start_order", tuple(params)) or []
+    for r in rows:
+        try:
+            r['context'] = json.loads(r['context'] or "{}")
+        except ValueError:
+            r['context'] = {}
+    return rows
+
+
+def remove_failed(book_id: int, start_order: int, attempts: int):
+    """重试结束后删除原队列记录 (如果同一起点已被重新登记，attempts 已变，不会误删)"""
+    db.execute_update(
+        "DELETE FROM book_failed_windows WHERE book_id=%s AND start_order=%s AND attempts=%s",
+        (book_id, start_order, attempts)
+    )
+
+
+# ==================== 3. 其他 ====================
+
+def clear_book(cursor, book_id: int):
+    """重新切分时清空该书的断点与重试队列 (在切分事务里调用)"""
+    cursor.execute("DELETE FROM book_process_checkpoint WHERE book_id=%s", (book_id,))
+    cursor.execute("DELETE FROM book_failed_windows WHERE book_id=%s", (book_id,))
+
+
+def progress_summary(book_id: int) -> Dict:
+    """续跑前的进度概要：各状态分段数、最近断点位置、待重试窗口数"""
+    ensure_tables()
+    seg = db.execute_query(
+        "SELECT COALESCE(SUM(is_processed = 1), 0) AS done, COALESCE(SUM(is_processed = 0), 0) AS pending, "
+        "COALESCE(SUM(is_processed = -1), 0) AS failed FROM book_segments WHERE book_id=%s",
+        (book_id,), fetch_one=True
+    ) or {}
+    cp = db.execute_query(
+        "SELECT MAX(last_segment_order) AS last_order FROM book_process_checkpoint WHERE book_id=%s",
+        (book_id,), fetch_one=True
+    ) or {}
+    queued = db.execute_query(
+        "SELECT COUNT(*) AS cnt FROM book_failed_windows WHERE book_id=%s", (book_id,), fetch_one=True
+    ) or {}
+    return {
+        "done": int(seg.get('done') or 0),
+        "pending": int(seg.get('pending') or 0),
+        "failed": int(seg.get('failed') or 0),
+        "last_order": cp.get('last_order'),
+        "queued_windows": int(queued.get('cnt') or 0),
+    }
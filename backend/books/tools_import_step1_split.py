@@ -1,5 +1,10 @@
 import os
 import sys
+import re
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional
 from docx import Document
 from docx.document import Document as _Document
 from docx.oxml.text.paragraph import CT_P
@@ -15,6 +20,8 @@ if root_dir not in sys.path:
 
 from backend.tools.tools_sql_connect import db
 from backend.tools.global_context import log_queue_ctx
+from backend.books import tools_import_checkpoint as checkpoint
+from config import config
 
 
 def emit(msg):
@@ -65,6 +72,145 @@ class WordParser:
         return chunks
 
 
+# ==================== 流式解析 (大文档) ====================
+# 直接用 iterparse 逐个读取 word/document.xml 中 body 下的段落/表格，读完一个释放一个，
+# 内存占用与文档大小无关；同时记录段落样式名和大纲级别 (1-9，正文为空)，供 AI 处理时切章节使用
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W = f"{{{W_NS}}}"
+SPLIT_WRITE_CHUNK = getattr(config, "BOOK_SPLIT_WRITE_CHUNK", 1000)  # 分段写库每批条数
+
+_HEADING_NAME = re.compile(r"^(?:heading|标题)\s*(\d)$", re.IGNORECASE)
+
+_columns_ready = False
+_columns_lock = threading.Lock()
+
+
+def ensure_segment_columns():
+    """book_segments 补齐 style_name / outline_level 两列 (旧表自动 ALTER)"""
+    global _columns_ready
+    if _columns_ready: return
+    with _columns_lock:
+        if _columns_ready: return
+        rows = db.execute_query(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'book_segments'"
+        )
+        if not rows: return  # 查询失败 (execute_query 返回 [])，下次再检查
+        existing = {r['COLUMN_NAME'] for r in rows}
+        ok = True
+        if 'style_name' not in existing:
+            ok = db.execute_update("ALTER TABLE book_segments ADD COLUMN style_name VARCHAR(100) DEFAULT NULL") is not None and ok
+        if 'outline_level' not in existing:
+            ok = db.execute_update("ALTER TABLE book_segments ADD COLUMN outline_level TINYINT DEFAULT NULL") is not None and ok
+        _columns_ready = ok  # 任一 ALTER 失败 (返回 None) 则下次再检查
+
+
+class StreamingWordParser:
+    def _load_styles(self, zf: zipfile.ZipFile) -> Dict[str, Dict]:
+        """styles.xml 体积很小，整体解析：样式ID -> {name, outline_level}，大纲级别沿 basedOn 继承"""
+        if "word/styles.xml" not in zf.namelist(): return {}
+        root = ET.fromstring(zf.read("word/styles.xml"))
+        raw = {}
+        for st in root.iter(f"{_W}style"):
+            if st.get(f"{_W}type") != "paragraph": continue
+            sid = st.get(f"{_W}styleId")
+            name_el = st.find(f"{_W}name")
+            based_el = st.find(f"{_W}basedOn")
+            lvl_el = st.find(f"{_W}pPr/{_W}outlineLvl")
+            raw[sid] = {
+                "name": name_el.get(f"{_W}val") if name_el is not None else sid,
+                "based_on": based_el.get(f"{_W}val") if based_el is not None else None,
+                "outline": int(lvl_el.get(f"{_W}val")) if lvl_el is not None else None,
+            }
+
+        styles = {}
+        for sid, st in raw.items():
+            outline, cur, seen = st["outline"], st, set()
+            while outline is None and cur.get("based_on") in raw and cur["based_on"] not in seen:
+                seen.add(cur["based_on"])
+                cur = raw[cur["based_on"]]
+                outline = cur["outline"]
+            if outline is None:
+                m = _HEADING_NAME.match(st["name"] or "")
+                if m: outline = int(m.group(1)) - 1
+            styles[sid] = {"name": st["name"], "outline_level": outline + 1 if outline is not None and outline < 9 else None}
+        return styles
+
+    @staticmethod
+    def _paragraph_text(p) -> str:
+        parts = []
+        for el in p.iter():
+            if el.tag == f"{_W}t":
+                parts.append(el.text or "")
+            elif el.tag == f"{_W}tab":
+                parts.append("\t")
+            elif el.tag in (f"{_W}br", f"{_W}cr"):
+                parts.append("\n")
+        return "".join(parts)
+
+    def _table_to_markdown(self, tbl) -> str:
+        rows_data = []
+        width = 0
+        for tr in tbl.findall(f"{_W}tr"):
+            cells = []
+            for tc in tr.findall(f"{_W}tc"):
+                text = "\n".join(self._paragraph_text(p) for p in tc.findall(f"{_W}p")).strip()
+                span_el = tc.find(f"{_W}tcPr/{_W}gridSpan")
+                span = int(span_el.get(f"{_W}val", 1)) if span_el is not None else 1
+                cells.extend([text.replace("\n", "<br>")] * span)  # 与 python-docx 一致：合并单元格重复展示
+            if not rows_data: width = len(cells)
+            rows_data.append(f"| {' | '.join(cells)} |")
+        if not rows_data: return ""
+        header = rows_data[0]
+        separator = "|" + "|".join(["---"] * width) + "|"
+        body = "\n".join(rows_data[1:])
+        return f"\n{header}\n{separator}\n{body}\n"
+
+    def _paragraph_style(self, p, styles: Dict[str, Dict]):
+        ppr = p.find(f"{_W}pPr")
+        style_id = None
+        outline = None
+        if ppr is not None:
+            ps = ppr.find(f"{_W}pStyle")
+            if ps is not None: style_id = ps.get(f"{_W}val")
+            ol = ppr.find(f"{_W}outlineLvl")
+            if ol is not None:
+                lvl = int(ol.get(f"{_W}val"))
+                outline = lvl + 1 if lvl < 9 else None
+        st = styles.get(style_id) or {}
+        if outline is None:
+            outline = st.get("outline_level")
+        return st.get("name") or style_id, outline
+
+    def iter_segments(self, file_path: str) -> Iterator[Dict]:
+        """逐个产出分段：{"content", "style_name", "outline_level"}，切分规则与 WordParser 相同"""
+        with zipfile.ZipFile(file_path) as zf:
+            styles = self._load_styles(zf)
+            with zf.open("word/document.xml") as fp:
+                depth = 0
+                body = None
+                for event, el in ET.iterparse(fp, events=("start", "end")):
+                    if event == "start":
+                        depth += 1
+                        if depth == 2 and el.tag == f"{_W}body": body = el
+                        continue
+
+                    depth -= 1
+                    if depth != 2 or body is None: continue  # 只处理 body 的直接子节点
+
+                    if el.tag == f"{_W}p":
+                        style_name, outline = self._paragraph_style(el, styles)
+                        for line in self._paragraph_text(el).split("\n"):
+                            if line.strip():
+                                yield {"content": line.strip(), "style_name": style_name, "outline_level": outline}
+                    elif el.tag == f"{_W}tbl":
+                        md_table = self._table_to_markdown(el)
+                        if md_table.strip():
+                            yield {"content": f"【表格数据】\n{md_table}", "style_name": None, "outline_level": None}
+                    body.remove(el)  # 释放已处理的节点
+
+
 def execute_split_task(book_id: int):
     emit(f"🔪 [切分] 开始处理 BookID={book_id}...")
 
@@ -73,37 +219,60 @@ def execute_split_task(book_id: int):
 
     file_path = book['file_path']
     emit(f"📖 读取文件: {file_path}")
+    if not os.path.exists(file_path):
+        return {"status": "error", "msg": "文件不存在"}
+
+    parser = StreamingWordParser()
+    sql = ("INSERT INTO book_segments (book_id, book_name, content, segment_order, style_name, outline_level, is_processed) "
+           "VALUES (%s, %s, %s, %s, %s, %s, %s)")
 
-    parser = WordParser()
     try:
-        segments = parser.parse_docx(file_path)
+        checkpoint.ensure_tables()
+        ensure_segment_columns()
+        conn = db.get_connection()
     except Exception as e:
-        return {"status": "error", "msg": f"解析失败: {e}"}
-
-    if not segments:
-        return {"status": "error", "msg": "文档内容为空"}
-
-    emit(f"✅ 解析完成，共 {len(segments)} 个段落。正在写入数据库...")
+        return {"status": "error", "msg": f"数据库错误: {e}"}
+    if not conn:
+        return {"status": "error", "msg": "数据库连接失败"}
 
+    # 边解析边分批写入，整个切分仍在一个事务里 (失败时旧分段保持不变)
+    total = 0
     try:
-        conn = db.get_connection()
         with conn.cursor() as cursor:
             # 清理旧数据
             cursor.execute("DELETE FROM book_segments WHERE book_id=%s", (book_id,))
             cursor.execute("DELETE FROM knowledge_fragments WHERE book_id=%s", (book_id,))
+            checkpoint.clear_book(cursor, book_id)
+
+            chunk = []
+            for seg in parser.iter_segments(file_path):
+                total += 1
+                chunk.append((book_id, book['book_name'], seg['content'], total,
+                              seg['style_name'], seg['outline_level'], 0))
+                if len(chunk) >= SPLIT_WRITE_CHUNK:
+                    cursor.executemany(sql, chunk)
+                    chunk = []
+                    emit(f"   -> 已写入 {total} 个分段...")
+            if chunk:
+                cursor.executemany(sql, chunk)
 
-            # 批量写入
-            sql = "INSERT INTO book_segments (book_id, book_name, content, segment_order, is_processed) VALUES (%s, %s, %s, %s, 0)"
-            params = [(book_id, book['book_name'], seg, i + 1) for i, seg in enumerate(segments)]
-            cursor.executemany(sql, params)
+            if not total:
+                conn.rollback()
+                return {"status": "error", "msg": "文档内容为空"}
 
             # 更新状态
             cursor.execute(
                 "UPDATE import_books SET total_segments=%s, processed_segments=0, total_fragments=0, imported_fragments=0 WHERE book_id=%s",
-                (len(segments), book_id))
+                (total, book_id))
             conn.commit()
 
-        emit(f"🎉 切分入库成功！")
-        return {"status": "success", "msg": f"切分完成，共 {len(segments)} 段"}
+        emit(f"🎉 切分入库成功！共 {total} 个段落")
+        return {"status": "success", "msg": f"切分完成，共 {total} 段"}
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        conn.rollback()
+        return {"status": "error", "msg": f"解析失败: {e}"}
     except Exception as e:
-        return {"status": "error", "msg": f"数据库错误: {e}"}
\ No newline at end of file
+        conn.rollback()
+        return {"status": "error", "msg": f"数据库错误: {e}"}
+    finally:
+        conn.close()
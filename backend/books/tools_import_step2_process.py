@@ -3,6 +3,11 @@ import sys
 import json
 import re
 import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from openai import OpenAI
 
 # 路径修复
@@ -14,6 +19,8 @@ if root_dir not in sys.path:
 from config import config
 from backend.tools.tools_sql_connect import db
 from backend.tools.global_context import log_queue_ctx
+from backend.books import tools_import_checkpoint as checkpoint
+from backend.books.tools_import_step1_split import ensure_segment_columns
 
 
 def repair_json(json_str):
@@ -89,28 +96,23 @@ class ReadingState:
         return " > ".join(ctx) if ctx else "无(根节点)"
 
 
-def execute_process_task(book_id: int):
-    emit(f"🧠 [处理] 开始 BookID={book_id}")
-
-    # 获取书本信息
-    book = db.execute_query("SELECT * FROM import_books WHERE book_id=%s", (book_id,), fetch_one=True)
-    if not book: return {"status": "error", "msg": "书本不存在"}
+# ==================== 基础配置 ====================
+# 章节并行：>1 时按 L1/L2 标题把书切成章节，各章节独立维护 ReadingState 并发处理，按原顺序合并入库
+PROCESS_CONCURRENCY = getattr(config, "BOOK_PROCESS_CONCURRENCY", 1)
+WINDOW_RETRIES = getattr(config, "BOOK_PROCESS_WINDOW_RETRIES", 2)  # 单个窗口调用异常的重试次数，仍失败则标记 -1 进入重试队列
+RETRY_BATCH_SIZE = getattr(config, "BOOK_PROCESS_RETRY_BATCH", 0)    # 重试失败窗口时每批分段数，0=batch_size 的三分之一
+RETRY_LIMIT = getattr(config, "BOOK_PROCESS_RETRY_LIMIT", 3)         # 同一失败窗口最多重试几轮
 
-    batch_size = book.get('batch_size', 15) or 15
-
-    # 初始化 AI 客户端
-    ai_model = config.LOCAL_CHAT_MODEL
-    client = OpenAI(base_url=config.LOCAL_OPENAI_URL_CHAT, api_key="lm-studio")
-    if "kimi" in ai_model.lower():
-        client = OpenAI(base_url=config.KIMI_API_URL, api_key=config.KIMI_API_KEY)
-    elif "doubao" in ai_model.lower():
-        client = OpenAI(base_url=config.VOLCENGINE_API_URL, api_key=config.VOLCENGINE_API_KEY)
+_CN_NUM = "一二三四五六七八九十百千零〇两"
+CHAPTER_PATTERNS = [
+    ("L1", re.compile(rf"^第[{_CN_NUM}\d]+[章篇部](?:\s|$|[：:、])")),
+    ("L2", re.compile(rf"^第[{_CN_NUM}\d]+节(?:\s|$|[：:、])")),
+]
+HEADING_MAX_LEN = 40  # 超过这个长度的段落不当作标题 (正文里也会出现"第X章")
 
-    state = ReadingState()
+_END = object()
 
-    # === Prompt ===
-    # 这里的 Prompt 强调了 JSON 格式和层级识别
-    system_prompt = """
+SYSTEM_PROMPT = """
 你是一个药学文档解析引擎。任务：读取文本，拆解为 JSON 列表。
 
 ### 必须输出的 JSON 结构：
@@ -130,6 +132,403 @@ def execute_process_task(book_id: int):
 - L7/L8: 细分点
 """
 
+
+INSERT_FRAGMENT_SQL = """INSERT INTO knowledge_fragments 
+    (book_id, book_name, source_segment_range, 
+     L1, L2, L3, L4, L5, L6, L7, L8, 
+     combo_title, content, is_embedded)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""  # 全部用占位符，pymysql 才会合并成多行 INSERT
+
+
+class WriteMeter:
+    """片段写入吞吐统计 (按书本累计，进程内)：窗口数、片段数、事务耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[int, Dict] = {}
+
+    def record(self, book_id: int, rows: int, seconds: float):
+        with self._lock:
+            st = self._stats.setdefault(book_id, {"windows": 0, "rows": 0, "seconds": 0.0})
+            st["windows"] += 1
+            st["rows"] += rows
+            st["seconds"] += seconds
+
+    def snapshot(self, book_id: Optional[int] = None) -> Dict:
+        with self._lock:
+            items = {k: dict(v) for k, v in self._stats.items() if book_id is None or k == book_id}
+        for st in items.values():
+            st["seconds"] = round(st["seconds"], 3)
+            st["rows_per_sec"] = round(st["rows"] / st["seconds"], 1) if st["seconds"] > 0 else None
+        return items
+
+
+write_meter = WriteMeter()
+
+
+def _make_client():
+    """初始化 AI 客户端，返回 (client, model)"""
+    ai_model = config.LOCAL_CHAT_MODEL
+    client = OpenAI(base_url=config.LOCAL_OPENAI_URL_CHAT, api_key="lm-studio")
+    if "kimi" in ai_model.lower():
+        client = OpenAI(base_url=config.KIMI_API_URL, api_key=config.KIMI_API_KEY)
+    elif "doubao" in ai_model.lower():
+        client = OpenAI(base_url=config.VOLCENGINE_API_URL, api_key=config.VOLCENGINE_API_KEY)
+    return client, ai_model
+
+
+# ==================== 1. 单个窗口：AI 解析 + 生成片段 ====================
+
+def call_window(client, ai_model: str, segments: List[Dict], state: ReadingState) -> Optional[List[Dict]]:
+    """把一个窗口的分段发给 AI，返回解析出的节点列表；JSON 彻底解析失败返回 None (调用异常直接抛出)"""
+    input_text = "\n".join([s['content'].strip() for s in segments if s['content'].strip()])
+    context_str = state.get_context_str()
+
+    resp = client.chat.completions.create(
+        model=ai_model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"【当前上下文】{context_str}\n\n【待解析文本】\n{input_text}"}
+        ],
+        temperature=0.1
+    )
+    raw_res = resp.choices[0].message.content
+
+    # === DEBUG: 打印 AI 原始返回 ===
+    print(f"\n--- AI 原始返回 (前200字符) ---\n{raw_res[:200]}...\n-----------------------------")
+
+    clean_json = repair_json(re.sub(r'<think>.*?</think>', '', raw_res, flags=re.DOTALL))
+    try:
+        items = json.loads(clean_json)
+        if not isinstance(items, list): items = [items]  # 容错
+    except:
+        # 暴力容错
+        try:
+            items = json.loads(f"[{clean_json}]")
+        except:
+            print("❌ JSON 解析彻底失败")
+            return None
+    return items
+
+
+def build_fragments(items: List[Dict], state: ReadingState) -> List[Dict]:
+    """按顺序推进状态机，把 content 节点连同当时的层级转成待入库片段"""
+    fragments = []
+    for item in items:
+        # 更新状态
+        state.update(item)
+
+        # 只有 content 入库
+        if item.get("type") == "content":
+            # 获取当前内存中的层级
+            lvls = state.get_levels()
+
+            # 组合标题
+            combo = item.get("combo_title", "")
+            if not combo:
+                active = [v for k, v in lvls.items() if v]
+                combo = " / ".join(active[-3:][::-1]) if active else "未分类"
+
+            fragments.append({"levels": lvls, "combo_title": combo, "content": item.get("content")})
+    return fragments
+
+
+def run_window(client, ai_model: str, segments: List[Dict], state: ReadingState) -> Dict:
+    """
+    处理一个窗口 (调用异常按 WINDOW_RETRIES 重试)，返回窗口结果：
+    fragments 为 None 表示失败，此时 state 回滚到窗口开始前，context 记录该上下文供重试队列使用
+    """
+    before = state.get_levels()
+    seg_range = f"{segments[0]['segment_order']}-{segments[-1]['segment_order']}"
+    fragments, error = None, ""
+    for attempt in range(WINDOW_RETRIES + 1):
+        try:
+            items = call_window(client, ai_model, segments, state)
+            if items is None:
+                error = "JSON 解析失败"
+                break
+            fragments = build_fragments(items, state)
+            break
+        except Exception as e:
+            state.levels = dict(before)
+            error = str(e)
+            emit(f"❌ 范围 {seg_range} 发生异常 (第 {attempt + 1} 次): {e}")
+            time.sleep(1)
+    if fragments is None:
+        state.levels = dict(before)
+
+    return {
+        "segment_ids": [s['segment_id'] for s in segments],
+        "seg_range": seg_range,
+        "start": segments[0]['segment_order'],
+        "end": segments[-1]['segment_order'],
+        "fragments": fragments,
+        "context": before,
+        "levels": state.get_levels(),
+        "error": error,
+    }
+
+
+def save_window(book: Dict, win: Dict, chapter_start: Optional[int] = 0, attempts: int = 0):
+    """
+    写入一个窗口的结果，片段 (executemany 一次批量插入)、分段状态、书本计数和阅读断点在同一事务里提交
+    失败窗口标记 -1 并登记到重试队列；chapter_start 为 None 时不写断点 (重试队列的窗口)
+    """
+    checkpoint.ensure_tables()
+    segment_ids = win['segment_ids']
+    fmt = ','.join(['%s'] * len(segment_ids))
+
+    started = time.time()
+    conn = db.get_connection()
+    if not conn:
+        raise RuntimeError("数据库连接失败")
+    try:
+        with conn.cursor() as cursor:
+            if win['fragments'] is None:
+                cursor.execute(f"UPDATE book_segments SET is_processed=-1 WHERE segment_id IN ({fmt})",
+                               tuple(segment_ids))
+                checkpoint.enqueue_failed(cursor, book['book_id'], win['start'], win['end'],
+                                          win['context'], attempts, win['error'])
+            else:
+                rows = [
+                    (book['book_id'], book['book_name'], win['seg_range'],
+                     *[frag['levels'][f"L{i}"] for i in range(1, 9)],
+                     frag['combo_title'], frag['content'], 0)
+                    for frag in win['fragments']
+                ]
+                if rows:
+                    cursor.executemany(INSERT_FRAGMENT_SQL, rows)
+
+                # 提交批次
+                cursor.execute(f"UPDATE book_segments SET is_processed=1 WHERE segment_id IN ({fmt})",
+                               tuple(segment_ids))
+                cursor.execute("UPDATE import_books SET processed_segments = processed_segments + %s, "
+                               "total_fragments = COALESCE(total_fragments, 0) + %s WHERE book_id=%s",
+                               (len(segment_ids), len(rows), book['book_id']))
+
+            if chapter_start is not None:
+                checkpoint.save_checkpoint(cursor, book['book_id'], chapter_start, win['levels'], win['end'])
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if win['fragments'] is None:
+        emit(f"⚠️ 范围 {win['seg_range']} 处理失败 ({win['error']})，已加入重试队列")
+    else:
+        elapsed = time.time() - started
+        write_meter.record(book['book_id'], len(win['fragments']), elapsed)
+        emit(f"✅ 入库成功: {len(win['fragments'])} 条 ({elapsed * 1000:.0f} ms)")
+
+
+def save_or_mark_failed(book: Dict, win: Dict, chapter_start: Optional[int] = 0):
+    """
+    写入窗口结果；入库失败时不重跑 AI，改为把窗口标记 -1 登记到重试队列 (上下文回到窗口开始前)
+    标记也失败 (数据库不可用) 时抛出异常，由调用方结束任务
+    :return: 入库失败时窗口回退后的上下文，成功时 None
+    """
+    try:
+        save_window(book, win, chapter_start=chapter_start)
+        return None
+    except Exception as e:
+        emit(f"❌ 范围 {win['seg_range']} 入库失败: {e}")
+        if win['fragments'] is None: raise  # 本身就是失败窗口，登记失败说明数据库不可用
+        failed = dict(win, fragments=None, levels=dict(win['context']), error=f"入库失败: {e}")
+        save_window(book, failed, chapter_start=chapter_start)
+        return dict(win['context'])
+
+
+# ==================== 2. 章节切分 (并行模式) ====================
+
+def detect_heading(seg: Dict, use_outline: bool = False):
+    """
+    判断分段是否为章/节标题，返回 (层级, 标题) 或 None
+    use_outline=True 时只认切分阶段记录的大纲级别 (1 -> L1，2 -> L2)；
+    否则用廉价的正则：'第X章/篇/部' -> L1，'第X节' -> L2
+    """
+    text = (seg.get('content') or "").strip()
+    if not text or len(text) > HEADING_MAX_LEN: return None
+    if use_outline:
+        level = seg.get('outline_level')
+        return (f"L{level}", text) if level in (1, 2) else None
+    for level, pattern in CHAPTER_PATTERNS:
+        if pattern.match(text):
+            return level, text
+    return None
+
+
+def split_chapters(segments: List[Dict], min_size: int) -> List[Dict]:
+    """
+    按 L1/L2 标题把全书分段切成章节：[{"L1", "L2", "segments"}]
+    文档带大纲级别 (Word 标题样式) 时按大纲切，否则按正则切；
+    切分只依赖分段内容和顺序，重复运行得到同样的章节；
+    不足 min_size 的节会并入同一章的上一节，避免窗口过碎
+    """
+    use_outline = any(s.get('outline_level') in (1, 2) for s in segments)
+    chapters = []
+    current = {"L1": "", "L2": "", "segments": []}
+    l1 = ""
+    for seg in segments:
+        heading = detect_heading(seg, use_outline)
+        if heading and current['segments']:
+            level, title = heading
+            small_section = level == "L2" and len(current['segments']) < min_size
+            if not small_section:
+                chapters.append(current)
+                current = {"L1": l1, "L2": "", "segments": []}
+        if heading:
+            level, title = heading
+            if level == "L1":
+                l1 = title
+                current["L1"], current["L2"] = title, ""
+            elif not current["L2"]:
+                current["L2"] = title
+        current['segments'].append(seg)
+    if current['segments']:
+        chapters.append(current)
+    return chapters
+
+
+def _chapter_state(book_id: int, chapter: Dict) -> ReadingState:
+    """优先恢复本章节内最近的断点，否则以章节自带的 L1/L2 作为初始上下文"""
+    state = ReadingState()
+    pending = [s for s in chapter['segments'] if s['is_processed'] == 0]
+    saved = checkpoint.load_state_before(book_id, pending[0]['segment_order'],
+                                         lo=chapter['segments'][0]['segment_order']) if pending else None
+    if saved:
+        state.levels.update(saved)
+    else:
+        state.levels["L1"] = chapter["L1"]
+        state.levels["L2"] = chapter["L2"]
+    return state
+
+
+def _process_chapter(idx: int, book_id: int, chapter: Dict, batch_size: int, out: queue.Queue):
+    """
+    顺序处理一个章节的全部窗口，每个窗口的结果放进该章节自己的队列
+    窗口划分只取决于章节内未处理的分段和 batch_size，与线程调度无关
+    """
+    client, ai_model = _make_client()
+    state = _chapter_state(book_id, chapter)
+    pending = [s for s in chapter['segments'] if s['is_processed'] == 0]
+    try:
+        for start in range(0, len(pending), batch_size):
+            window = pending[start:start + batch_size]
+            emit(f"🚀 [AI请求] 章节#{idx + 1} 范围: {window[0]['segment_order']}-{window[-1]['segment_order']} "
+                 f"| 上下文: {state.get_context_str()}")
+            out.put(run_window(client, ai_model, window, state))
+    finally:
+        out.put(_END)
+
+
+def execute_process_parallel(book: Dict, batch_size: int, concurrency: int):
+    """章节并行：各章节并发调用 AI，主线程按章节顺序依次落库 (当前章节边出结果边写，后续章节先缓存)"""
+    ensure_segment_columns()
+    all_segments = db.execute_query(
+        "SELECT segment_id, segment_order, content, outline_level, is_processed FROM book_segments "
+        "WHERE book_id=%s ORDER BY segment_order ASC",
+        (book['book_id'],)
+    ) or []
+    chapters = [c for c in split_chapters(all_segments, batch_size)
+                if any(s['is_processed'] == 0 for s in c['segments'])]
+    if not chapters:
+        emit("✅ 全部处理完毕")
+        return
+
+    emit(f"📚 [并行] 共 {len(chapters)} 个待处理章节，并发 {concurrency}")
+    queues = [queue.Queue() for _ in chapters]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for idx, chapter in enumerate(chapters):
+            # 每个任务一份上下文拷贝，子线程的 emit 也能推送到当前请求的日志流
+            pool.submit(contextvars.copy_context().run, _process_chapter,
+                        idx, book['book_id'], chapter, batch_size, queues[idx])
+
+        for idx, out in enumerate(queues):
+            chapter_start = chapters[idx]['segments'][0]['segment_order']
+            while True:
+                win = out.get()
+                if win is _END: break
+                try:
+                    save_or_mark_failed(book, win, chapter_start=chapter_start)
+                except Exception as e:
+                    emit(f"❌ 章节#{idx + 1} 范围 {win['seg_range']} 登记失败窗口也失败: {e}")
+    emit("✅ 全部处理完毕")
+
+
+def retry_failed_windows(book: Dict, batch_size: int):
+    """
+    重试队列：失败窗口按更小的子批次、从失败时的上下文重新处理
+    子批次仍失败的重新登记 (attempts+1)，超过 RETRY_LIMIT 的保留 -1 等人工处理
+    """
+    book_id = book['book_id']
+    checkpoint.enqueue_orphans(book_id)
+    windows = checkpoint.load_failed(book_id, max_attempts=RETRY_LIMIT)
+    if not windows: return
+
+    sub_size = RETRY_BATCH_SIZE or max(1, batch_size // 3)
+    emit(f"🔁 [重试] {len(windows)} 个失败窗口，每批 {sub_size} 个分段")
+    client, ai_model = _make_client()
+
+    for w in windows:
+        segments = db.execute_query(
+            "SELECT * FROM book_segments WHERE book_id=%s AND is_processed=-1 "
+            "AND segment_order BETWEEN %s AND %s ORDER BY segment_order ASC",
+            (book_id, w['start_order'], w['end_order'])
+        ) or []
+        state = ReadingState()
+        state.levels.update(w['context'])
+        try:
+            for i in range(0, len(segments), sub_size):
+                sub = segments[i:i + sub_size]
+                emit(f"🚀 [重试] 范围: {sub[0]['segment_order']}-{sub[-1]['segment_order']} "
+                     f"| 上下文: {state.get_context_str()}")
+                save_window(book, run_window(client, ai_model, sub, state),
+                            chapter_start=None, attempts=w['attempts'] + 1)
+            checkpoint.remove_failed(book_id, w['start_order'], w['attempts'])
+        except Exception as e:
+            emit(f"❌ [重试] 范围 {w['start_order']}-{w['end_order']} 入库失败: {e}")
+
+    left = checkpoint.load_failed(book_id)
+    if left:
+        emit(f"⚠️ 仍有 {len(left)} 个窗口失败，可再次续跑重试 (超过 {RETRY_LIMIT} 轮的需人工检查)")
+
+
+# ==================== 3. 入口 ====================
+
+def execute_process_task(book_id: int, concurrency: Optional[int] = None):
+    emit(f"🧠 [处理] 开始 BookID={book_id}")
+
+    # 获取书本信息
+    book = db.execute_query("SELECT * FROM import_books WHERE book_id=%s", (book_id,), fetch_one=True)
+    if not book: return {"status": "error", "msg": "书本不存在"}
+
+    batch_size = book.get('batch_size', 15) or 15
+    concurrency = concurrency or PROCESS_CONCURRENCY
+
+    if concurrency > 1:
+        execute_process_parallel(book, batch_size, concurrency)
+    else:
+        err = execute_process_serial(book, batch_size)
+        if err: return err
+
+    retry_failed_windows(book, batch_size)
+    db.execute_update("UPDATE import_books SET status='processed' WHERE book_id=%s", (book_id,))
+
+    st = write_meter.snapshot(book_id).get(book_id)
+    if st and st['rows_per_sec']:
+        emit(f"📈 片段写入: {st['rows']} 条 / {st['windows']} 个窗口，{st['rows_per_sec']} 条/秒")
+    return {"status": "ok"}
+
+
+def execute_process_serial(book: Dict, batch_size: int):
+    """逐窗口顺序处理，正常结束返回 None；数据库不可用无法继续时返回错误字典"""
+    book_id = book['book_id']
+    client, ai_model = _make_client()
+    state = ReadingState()
+    restored = False
+
     while True:
         # 1. 拿数据
         segments = db.execute_query(
@@ -140,98 +539,33 @@ def execute_process_task(book_id: int):
             emit("✅ 全部处理完毕")
             break
 
-        segment_ids = [s['segment_id'] for s in segments]
-        seg_range = f"{segments[0]['segment_order']}-{segments[-1]['segment_order']}"
-
-        # 2. 构造输入
-        input_text = "\n".join([s['content'].strip() for s in segments if s['content'].strip()])
-        context_str = state.get_context_str()
+        # 2. 首个窗口前恢复上次停下时的阅读状态
+        if not restored:
+            restored = True
+            saved = checkpoint.load_state_before(book_id, segments[0]['segment_order'])
+            if saved:
+                state.levels.update(saved)
+                emit(f"♻️ 从断点恢复上下文: {state.get_context_str()}")
 
-        emit(f"🚀 [AI请求] 范围: {seg_range} | 上下文: {context_str}")
+        emit(f"🚀 [AI请求] 范围: {segments[0]['segment_order']}-{segments[-1]['segment_order']} "
+             f"| 上下文: {state.get_context_str()}")
 
+        # 3. AI 调用 + 解析 + 入库 (失败窗口标记 -1 并进入重试队列)
+        # 入库失败的窗口同样标记 -1 (不重跑 AI)，否则下一轮会重新选中同一批分段
+        win = run_window(client, ai_model, segments, state)
         try:
-            # 3. AI 调用
-            resp = client.chat.completions.create(
-                model=ai_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"【当前上下文】{context_str}\n\n【待解析文本】\n{input_text}"}
-                ],
-                temperature=0.1
-            )
-            raw_res = resp.choices[0].message.content
-
-            # === DEBUG: 打印 AI 原始返回 ===
-            print(f"\n--- AI 原始返回 (前200字符) ---\n{raw_res[:200]}...\n-----------------------------")
-
-            # 4. 解析 JSON
-            clean_json = repair_json(re.sub(r'<think>.*?</think>', '', raw_res, flags=re.DOTALL))
-            try:
-                items = json.loads(clean_json)
-                if not isinstance(items, list): items = [items]  # 容错
-            except:
-                # 暴力容错
-                try:
-                    items = json.loads(f"[{clean_json}]")
-                except:
-                    print("❌ JSON 解析彻底失败")
-                    # 标记跳过
-                    fmt = ','.join(['%s'] * len(segment_ids))
-                    db.execute_update(f"UPDATE book_segments SET is_processed=-1 WHERE segment_id IN ({fmt})",
-                                      tuple(segment_ids))
-                    continue
-
-            # 5. 入库
-            conn = db.get_connection()
-            with conn.cursor() as cursor:
-                valid_cnt = 0
-                for item in items:
-                    # 更新状态
-                    state.update(item)
-
-                    # 只有 content 入库
-                    if item.get("type") == "content":
-                        # 获取当前内存中的层级
-                        lvls = state.get_levels()
-
-                        # === DEBUG: 打印入库前的关键数据 ===
-                        # 如果这里全是空字符串，说明状态机没更新
-                        # print(f"📝 准备入库: L1={lvls['L1']} | L3={lvls['L3']} | Content={item.get('content')[:20]}")
-
-                        # 组合标题
-                        combo = item.get("combo_title", "")
-                        if not combo:
-                            active = [v for k, v in lvls.items() if v]
-                            combo = " / ".join(active[-3:][::-1]) if active else "未分类"
-
-                        sql = """INSERT INTO knowledge_fragments 
-                                (book_id, book_name, source_segment_range, 
-                                 L1, L2, L3, L4, L5, L6, L7, L8, 
-                                 combo_title, content, is_embedded)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0)"""
-
-                        params = (
-                            book_id, book['book_name'], seg_range,
-                            lvls['L1'], lvls['L2'], lvls['L3'], lvls['L4'],
-                            lvls['L5'], lvls['L6'], lvls['L7'], lvls['L8'],
-                            combo, item.get("content")
-                        )
-
-                        cursor.execute(sql, params)
-                        valid_cnt += 1
-
-                # 提交批次
-                fmt = ','.join(['%s'] * len(segment_ids))
-                cursor.execute(f"UPDATE book_segments SET is_processed=1 WHERE segment_id IN ({fmt})",
-                               tuple(segment_ids))
-                cursor.execute("UPDATE import_books SET processed_segments = processed_segments + %s WHERE book_id=%s",
-                               (len(segments), book_id))
-                conn.commit()
-                emit(f"✅ 入库成功: {valid_cnt} 条")
-
+            rolled_back = save_or_mark_failed(book, win)
         except Exception as e:
-            emit(f"❌ 发生异常: {e}")
-            time.sleep(1)
-
-    db.execute_update("UPDATE import_books SET status='processed' WHERE book_id=%s", (book_id,))
-    return {"status": "ok"}
\ No newline at end of file
+            emit(f"❌ 数据库写入失败，处理中止: {e}")
+            return {"status": "error", "msg": f"数据库写入失败: {e}"}
+        if rolled_back is not None:
+            state.levels = rolled_back
+
+
+def resume_process_task(book_id: int, concurrency: Optional[int] = None):
+    """断点续跑：跳过已处理分段、恢复阅读状态继续处理，最后重试失败窗口"""
+    summary = checkpoint.progress_summary(book_id)
+    emit(f"♻️ [续跑] BookID={book_id} 已处理 {summary['done']} 段，待处理 {summary['pending']} 段，"
+         f"失败 {summary['failed']} 段 (重试队列 {summary['queued_windows']} 个窗口)，"
+         f"断点位置: {summary['last_order'] or '无'}")
+    return execute_process_task(book_id, concurrency)
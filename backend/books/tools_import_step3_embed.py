@@ -1,8 +1,15 @@
 import chromadb
 import uuid
+import time
+import queue
+import threading
+import contextvars
+from typing import Dict, List, Optional
 from backend.tools.tools_sql_connect import db
 from backend.tools.tools_call_ai import call_ai_emb
 from backend.tools.global_context import log_queue_ctx
+from backend.knowledge.metadata_index import metadata_index
+from backend.knowledge import overview_stats
 from config import config
 
 
@@ -15,6 +22,319 @@ def emit(msg):
 DB_PATH = getattr(config, "VECTOR_DB_PATH_MEDIC", "G:/KnowledgeBase/vectorizer_medic")
 EMBEDDING_DIM = 4096
 
+# ==================== 流水线配置 ====================
+# 预取线程 (MySQL 分页) -> 多个向量化线程 (自适应批大小) -> 写入线程 (Chroma 大批 upsert + 进度计数)
+EMBED_WORKERS = getattr(config, "EMBED_IMPORT_WORKERS", 2)
+BATCH_SIZE = getattr(config, "EMBED_BATCH_SIZE", 32)
+BATCH_MIN = getattr(config, "EMBED_BATCH_MIN", 4)
+BATCH_MAX = getattr(config, "EMBED_BATCH_MAX", 128)
+BATCH_TARGET_SECONDS = getattr(config, "EMBED_BATCH_TARGET_SECONDS", 8)
+FETCH_PAGE = getattr(config, "EMBED_FETCH_PAGE", 200)
+WRITE_BATCH = getattr(config, "EMBED_WRITE_BATCH", 256)
+
+_END = object()  # 队列结束标记
+
+
+# ==================== 1. 片段 -> 向量文本/元数据 ====================
+
+def build_item(frag: Dict, book_name: str) -> Dict:
+    """把一条 knowledge_fragments 记录转成入库所需的 id / 向量文本 / 元数据"""
+    # 1. 构造向量文本
+    combo_title = (frag.get('combo_title') or '').strip()
+
+    # 兜底逻辑：如果 combo_title 为空，尝试从 L 层级拼凑
+    if not combo_title:
+        parts = []
+        for i in range(1, 9):
+            val = frag.get(f'L{i}')
+            if val: parts.append(val)
+        combo_title = parts[-1] if parts else "无标题"
+
+    vector_text = f"{combo_title}：\n{frag['content']}"
+
+    # 2. 构造完整路径 (用于展示)
+    path_parts = []
+    l_levels = {}
+    for i in range(1, 9):
+        key = f"L{i}"
+        val = frag.get(key, "")
+        l_levels[key] = val  # 存入 metadata，即使为空
+        if val:
+            path_parts.append(val)
+
+    full_path = " / ".join(path_parts)
+
+    # 3. 生成固定 UUID (便于去重)
+    stable_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"fragment_{frag['fragment_id']}"))
+
+    # 4. 构造元数据 (适配 L1-L8)
+    meta = {
+        "来源文件": book_name,
+        "组合标题": combo_title,
+        "完整路径": full_path,
+        "片段内容": frag['content'],
+        "字数": len(frag['content']),
+        "db_fragment_id": frag['fragment_id'],
+        **l_levels  # 动态解包 L1-L8
+    }
+    return {"id": stable_uuid, "doc": vector_text, "meta": meta, "fragment_id": frag['fragment_id']}
+
+
+# ==================== 2. 自适应批大小 ====================
+
+class AdaptiveBatchSize:
+    """
+    按单批向量化耗时调整批大小：明显快于目标就翻倍，慢于目标就减半，失败也减半
+    多个向量化线程共享同一个实例
+    """
+
+    def __init__(self, initial: int = BATCH_SIZE, minimum: int = BATCH_MIN,
+                 maximum: int = BATCH_MAX, target_seconds: float = BATCH_TARGET_SECONDS):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target = target_seconds
+        self._size = min(max(initial, self.minimum), self.maximum)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+    def record(self, n: int, seconds: float):
+        with self._lock:
+            if n < self._size: return  # 尾批不满，耗时不代表当前批大小
+            if seconds < self.target / 2:
+                self._size = min(self.maximum, self._size * 2)
+            elif seconds > self.target:
+                self._size = max(self.minimum, self._size // 2)
+
+    def shrink(self):
+        with self._lock:
+            self._size = max(self.minimum, self._size // 2)
+
+
+# ==================== 3. 流水线 ====================
+
+class EmbedPipeline:
+    def __init__(self, book: Dict, collection, col_name: str):
+        self.book = book
+        self.book_id = book['book_id']
+        self.collection = collection
+        self.col_name = col_name
+
+        self.batch_size = AdaptiveBatchSize()
+        self.fetch_q = queue.Queue(maxsize=FETCH_PAGE * 2)   # 预取一页之外最多再缓冲一页
+        self.write_q = queue.Queue(maxsize=EMBED_WORKERS * 2)
+        self.stop_event = threading.Event()
+
+        self.total = 0
+        self.done = 0
+        self.written = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self._count_lock = threading.Lock()
+        self._started = time.time()
+
+    # ---------- 工具 ----------
+    def _put(self, q: queue.Queue, item) -> bool:
+        """阻塞放入，流水线被终止时放弃并返回 False"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _abort(self, msg: str):
+        if self.error is None:
+            self.error = msg
+        self.stop_event.set()
+
+    # ---------- 进度计数 ----------
+    def init_progress(self):
+        """开工前统计一次总数与已入库数，之后只做增量累加"""
+        res = db.execute_query(
+            "SELECT COUNT(*) AS total, COALESCE(SUM(is_embedded = 1), 0) AS done "
+            "FROM knowledge_fragments WHERE book_id=%s",
+            (self.book_id,), fetch_one=True
+        ) or {}
+        self.total = int(res.get('total') or 0)
+        self.done = int(res.get('done') or 0)
+        db.execute_update(
+            "UPDATE import_books SET total_fragments=%s, imported_fragments=%s WHERE book_id=%s",
+            (self.total, self.done, self.book_id)
+        )
+
+    def remaining(self) -> Optional[int]:
+        """结束后复核仍未入库的片段数；查询失败返回 None"""
+        res = db.execute_query(
+            "SELECT COUNT(*) AS cnt FROM knowledge_fragments WHERE book_id=%s AND is_embedded=0",
+            (self.book_id,), fetch_one=True
+        )
+        if not res: return None
+        return int(res.get('cnt') or 0)
+
+    # ---------- 阶段 1：预取 ----------
+    def fetch_loop(self):
+        """
+        按 fragment_id 游标分页读取未入库片段，转换后放入 fetch_q
+        查询失败与读到末页都返回 []，这里无法区分，由 run() 结束后复核剩余数
+        """
+        last_id = 0
+        try:
+            while not self.stop_event.is_set():
+                rows = db.execute_query(
+                    "SELECT * FROM knowledge_fragments "
+                    "WHERE book_id=%s AND is_embedded=0 AND fragment_id > %s "
+                    "ORDER BY fragment_id LIMIT %s",
+                    (self.book_id, last_id, FETCH_PAGE)
+                )
+                for frag in rows:
+                    if not self._put(self.fetch_q, build_item(frag, self.book['book_name'])):
+                        return
+                if len(rows) < FETCH_PAGE:
+                    return
+                last_id = rows[-1]['fragment_id']
+        except Exception as e:
+            self._abort(f"读取片段异常: {e}")
+        finally:
+            for _ in range(EMBED_WORKERS):
+                if not self._put(self.fetch_q, _END): break
+
+    # ---------- 阶段 2：向量化 ----------
+    def _take_batch(self):
+        """取一批片段：第一条阻塞等待，其余有多少取多少 (不超过当前批大小)，返回 (items, 是否已到结尾)"""
+        first = None
+        while first is None:
+            if self.stop_event.is_set(): return [], True
+            try:
+                first = self.fetch_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        if first is _END: return [], True
+
+        items, limit = [first], self.batch_size.size
+        while len(items) < limit:
+            try:
+                item = self.fetch_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END: return items, True
+            items.append(item)
+        return items, False
+
+    def _embed(self, items: List[Dict]) -> List[Dict]:
+        """向量化一批，失败时对半拆分重试，单条仍失败的计入 failed (保持 is_embedded=0，下次重跑)"""
+        if not items or self.stop_event.is_set(): return []
+        start = time.time()
+        try:
+            embeddings = call_ai_emb([it['doc'] for it in items], dimensions=EMBEDDING_DIM, use_cache=False)
+        except Exception as e:
+            emit(f"   ⚠️ 向量化异常: {e}")
+            embeddings = []
+
+        if embeddings and len(embeddings) == len(items):
+            self.batch_size.record(len(items), time.time() - start)
+            for it, emb in zip(items, embeddings):
+                it['embedding'] = emb
+            return items
+
+        self.batch_size.shrink()
+        if len(items) == 1:
+            with self._count_lock:
+                self.failed += 1
+            emit(f"   ❌ 片段 {items[0]['fragment_id']} 向量化失败，已跳过")
+            return []
+        mid = len(items) // 2
+        return self._embed(items[:mid]) + self._embed(items[mid:])
+
+    def embed_loop(self):
+        finished = False
+        while not finished and not self.stop_event.is_set():
+            items, finished = self._take_batch()
+            done = self._embed(items)
+            if done and not self._put(self.write_q, done):
+                return
+
+    # ---------- 阶段 3：写入 ----------
+    def _flush(self, items: List[Dict]):
+        ids = [it['id'] for it in items]
+        metadatas = [it['meta'] for it in items]
+        frag_db_ids = [it['fragment_id'] for it in items]
+
+        deltas = overview_stats.source_deltas(self.collection, ids, metadatas)
+        self.collection.upsert(ids=ids, documents=[it['doc'] for it in items],
+                               embeddings=[it['embedding'] for it in items], metadatas=metadatas)
+        metadata_index.upsert(self.col_name, ids, metadatas)
+        overview_stats.apply_deltas(self.col_name, deltas)
+
+        fmt = ','.join(['%s'] * len(frag_db_ids))
+        res = db.execute_update(f"UPDATE knowledge_fragments SET is_embedded=1 WHERE fragment_id IN ({fmt})",
+                                tuple(frag_db_ids))
+        if res is None:
+            # 向量已写入 Chroma (upsert 可重复)，标记失败时中止，重跑入库会补上标记
+            raise RuntimeError("更新片段入库标记失败")
+        db.execute_update("UPDATE import_books SET imported_fragments = imported_fragments + %s WHERE book_id=%s",
+                          (len(items), self.book_id))
+
+        self.written += len(items)
+        self.done += len(items)
+        rate = self.written / max(time.time() - self._started, 1e-6)
+        emit(f"   -> 已入库 {self.done}/{self.total} 条 ({rate:.1f} 条/秒，当前批大小 {self.batch_size.size})")
+
+    def write_loop(self):
+        """攒够 WRITE_BATCH 条或上游暂时没有新结果时写一次"""
+        buffer: List[Dict] = []
+        try:
+            while True:
+                try:
+                    batch = self.write_q.get(timeout=0.5 if buffer else None)
+                except queue.Empty:
+                    self._flush(buffer)
+                    buffer = []
+                    continue
+                if batch is _END: break
+                buffer.extend(batch)
+                while len(buffer) >= WRITE_BATCH:
+                    self._flush(buffer[:WRITE_BATCH])
+                    buffer = buffer[WRITE_BATCH:]
+            if buffer and not self.stop_event.is_set():
+                self._flush(buffer)
+        except Exception as e:
+            emit(f"   ❌ 入库异常: {e}")
+            self._abort(str(e))
+            # 继续取走队列里的结果，避免向量化线程阻塞在 put 上
+            while self.write_q.get() is not _END:
+                pass
+
+    # ---------- 调度 ----------
+    def run(self) -> Dict:
+        self.init_progress()
+        if self.done >= self.total:
+            return {"written": 0, "failed": 0, "error": None}
+        emit(f"   -> 待入库 {self.total - self.done} 条，{EMBED_WORKERS} 路并发向量化")
+
+        def spawn(fn, name):
+            # 每个线程一份上下文拷贝，让子线程的 emit 也能推送到当前请求的日志流
+            t = threading.Thread(target=contextvars.copy_context().run, args=(fn,), name=name, daemon=True)
+            t.start()
+            return t
+
+        writer = spawn(self.write_loop, f"embed-writer-{self.book_id}")
+        fetcher = spawn(self.fetch_loop, f"embed-fetch-{self.book_id}")
+        workers = [spawn(self.embed_loop, f"embed-worker-{self.book_id}-{i}") for i in range(EMBED_WORKERS)]
+
+        for t in workers:
+            t.join()
+        self.write_q.put(_END)
+        writer.join()
+        self.stop_event.set()  # 写入线程失败时让预取线程尽快退出
+        fetcher.join()
+
+        return {"written": self.written, "failed": self.failed, "error": self.error}
+
 
 def execute_embed_task(book_id: int):
     emit(f"💉 [入库] 开始向量化 BookID={book_id}...")
@@ -29,97 +349,28 @@ def execute_embed_task(book_id: int):
     except Exception as e:
         return {"status": "error", "msg": f"向量库连接失败: {e}"}
 
-    while True:
-        # 批量获取未入库片段
-        fragments = db.execute_query(
-            "SELECT * FROM knowledge_fragments WHERE book_id=%s AND is_embedded=0 LIMIT 10",
-            (book_id,)
-        )
-        if not fragments:
-            emit("✅ 所有片段已入库")
-            break
-
-        ids = []
-        docs = []
-        metadatas = []
-        frag_db_ids = []
-
-        for frag in fragments:
-            # 1. 构造向量文本
-            combo_title = frag.get('combo_title', '').strip()
-
-            # 兜底逻辑：如果 combo_title 为空，尝试从 L 层级拼凑
-            if not combo_title:
-                parts = []
-                for i in range(1, 9):
-                    val = frag.get(f'L{i}')
-                    if val: parts.append(val)
-                combo_title = parts[-1] if parts else "无标题"
-
-            vector_text = f"{combo_title}：\n{frag['content']}"
-
-            # 2. 构造完整路径 (用于展示)
-            path_parts = []
-            l_levels = {}
-            for i in range(1, 9):
-                key = f"L{i}"
-                val = frag.get(key, "")
-                l_levels[key] = val  # 存入 metadata，即使为空
-                if val:
-                    path_parts.append(val)
-
-            full_path = " / ".join(path_parts)
-
-            # 3. 生成固定 UUID (便于去重)
-            stable_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"fragment_{frag['fragment_id']}"))
-            ids.append(stable_uuid)
-
-            docs.append(vector_text)
-
-            # 4. 构造元数据 (适配 L1-L8)
-            meta = {
-                "来源文件": book['book_name'],
-                "组合标题": combo_title,
-                "完整路径": full_path,
-                "片段内容": frag['content'],
-                "字数": len(frag['content']),
-                "db_fragment_id": frag['fragment_id'],
-                **l_levels  # 动态解包 L1-L8
-            }
-            metadatas.append(meta)
-            frag_db_ids.append(frag['fragment_id'])
+    started = time.time()
+    pipeline = EmbedPipeline(book, collection, col_name)
+    result = pipeline.run()
+    elapsed = time.time() - started
 
-        try:
-            emit(f"   -> 正在向量化 {len(docs)} 条片段...")
-            embeddings = call_ai_emb(docs, dimensions=EMBEDDING_DIM)
-            if not embeddings:
-                emit("   ❌ 向量化返回空，跳过本批次")
-                # 避免死循环，标记为错误或跳过 (这里简单处理为继续循环，实际可加错误计数)
-                continue
-
-            # 存入 Chroma
-            collection.upsert(ids=ids, documents=docs, embeddings=embeddings, metadatas=metadatas)
-
-            # 更新数据库状态
-            fmt = ','.join(['%s'] * len(frag_db_ids))
-            db.execute_update(f"UPDATE knowledge_fragments SET is_embedded=1 WHERE fragment_id IN ({fmt})",
-                              tuple(frag_db_ids))
+    if result['error']:
+        emit(f"❌ 入库中断: {result['error']} (本次已写入 {result['written']} 条)")
+        return {"status": "error", "msg": result['error']}
 
-            # 更新书本进度统计
-            db.execute_update(
-                """
-                UPDATE import_books SET 
-                imported_fragments = (SELECT COUNT(*) FROM knowledge_fragments WHERE book_id=%s AND is_embedded=1),
-                total_fragments = (SELECT COUNT(*) FROM knowledge_fragments WHERE book_id=%s)
-                WHERE book_id=%s
-                """,
-                (book_id, book_id, book_id))
-
-        except Exception as e:
-            emit(f"   ❌ 入库异常: {e}")
-            # 遇到严重错误退出循环，防止刷屏日志
-            break
+    # 复核剩余数：预取查询失败时会像读到末页一样提前结束，不能据此认定全部入库
+    remaining = pipeline.remaining()
+    if remaining is None:
+        emit(f"❌ 无法确认剩余未入库片段数 (本次已写入 {result['written']} 条)，请重新执行入库")
+        return {"status": "error", "msg": "复核剩余片段失败"}
+    if remaining > result['failed']:
+        emit(f"❌ 读取片段中断，仍有 {remaining} 条未入库 (本次已写入 {result['written']} 条)，请重新执行入库")
+        return {"status": "error", "msg": f"仍有 {remaining} 条片段未入库"}
+    if remaining:
+        emit(f"⚠️ 入库完成，{remaining} 条向量化失败，可重新执行入库补齐")
+        return {"status": "success", "msg": f"入库完成，{remaining} 条向量化失败"}
 
-    # 任务结束更新状态
+    emit(f"✅ 所有片段已入库 (本次 {result['written']} 条，用时 {elapsed:.1f} 秒)")
+    # 全部入库后才更新状态
     db.execute_update("UPDATE import_books SET status='embedded' WHERE book_id=%s", (book_id,))
-    return {"status": "success", "msg": "入库完成"}
\ No newline at end of file
+    return {"status": "success", "msg": "入库完成"}
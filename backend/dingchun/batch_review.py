@@ -1,7 +1,11 @@
+import asyncio
 import threading
-import time
-from typing import List, Dict
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from config import config
 from backend.tools.tools_sql_connect import db
+from backend.tools.tools_rate_limit import rate_limiter_states
 # 引入具体的AI执行模块
 from backend.dingchun.dingchun import dingchun
 from backend.dingchun.call_other_ai import other_ai
@@ -13,27 +17,35 @@ AI_CONFIG = {
     'dingchun': {
         'db_pattern': '定春%%',  # 修正：定春% -> 定春%%
         'func': lambda qid: dingchun.review_and_save(qid, "LOCAL"),
-        'col': 'dingchun_status'
+        'col': 'dingchun_status',
+        'worker_col': 'dingchun_worker'
     },
     'qwen': {
         'db_pattern': 'Qwen%%',  # 修正
         'func': other_ai.review_by_qwen,
-        'col': 'qwen_status'
+        'col': 'qwen_status',
+        'worker_col': 'qwen_worker'
     },
     'kimi': {
         'db_pattern': 'Kimi%%',  # 修正
         'func': other_ai.review_by_kimi,
-        'col': 'kimi_status'
+        'col': 'kimi_status',
+        'worker_col': 'kimi_worker'
     },
     'doubao': {
         'db_pattern': 'Doubao%%',  # 修正
         'func': other_ai.review_by_doubao,
-        'col': 'doubao_status'
+        'col': 'doubao_status',
+        'worker_col': 'doubao_worker'
     }
 }
 
-STOP_FLAG = False
-WORKER_THREADS = []
+# 每个 AI 的并发数 (本地 GPU 通常只能 1 路，远程 API 可以开大)
+CONCURRENCY = getattr(config, "BATCH_REVIEW_CONCURRENCY", {})
+DEFAULT_CONCURRENCY = 1
+CLAIM_RETRIES = 5  # 认领题目时数据库异常的连续重试次数 (指数退避，最长 60 秒)，仍失败则该 AI 的 Worker 池退出
+
+WORKER_POOLS: Dict[str, "AIWorkerPool"] = {}
 
 
 def init_database():
@@ -45,11 +57,25 @@ def init_database():
         qwen_status VARCHAR(20) DEFAULT 'WAIT',
         kimi_status VARCHAR(20) DEFAULT 'WAIT',
         doubao_status VARCHAR(20) DEFAULT 'WAIT',
+        dingchun_worker VARCHAR(64) DEFAULT NULL,
+        qwen_worker VARCHAR(64) DEFAULT NULL,
+        kimi_worker VARCHAR(64) DEFAULT NULL,
+        doubao_worker VARCHAR(64) DEFAULT NULL,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
     """
     db.execute_update(sql)
 
+    # 旧表补齐认领标记列 (worker token)
+    rows = db.execute_query(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'batch_task_progress'"
+    ) or []
+    existing = {r['COLUMN_NAME'] for r in rows}
+    for cfg in AI_CONFIG.values():
+        if existing and cfg['worker_col'] not in existing:
+            db.execute_update(f"ALTER TABLE batch_task_progress ADD COLUMN {cfg['worker_col']} VARCHAR(64) DEFAULT NULL")
+
 
 # ==================== 1. 任务初始化 (SQL 魔法) ====================
 
@@ -57,19 +83,13 @@ def start_new_batch(start_id: int, end_id: int, selected_ais: List[str]):
     """
     基于数据库子查询直接初始化任务表，自动识别 'DONE' 和 'SKIP'
     """
-    global STOP_FLAG, WORKER_THREADS
-
-    # 1. 停止旧线程
-    STOP_FLAG = True
-    for t in WORKER_THREADS:
-        if t.is_alive():
-            t.join(timeout=1)
-    WORKER_THREADS = []
-    STOP_FLAG = False
+    # 1. 停止旧调度 (不等待进行中的题目，它们写回时会因 worker token 不匹配被忽略)
+    _stop_all_pools()
 
     # 2. 初始化环境
     init_database()
     db.execute_update("TRUNCATE TABLE batch_task_progress")
+    progress_tracker.reload()
 
     # 3. 检查题目是否存在
     check_sql = "SELECT COUNT(*) as cnt FROM pharmacist_questions WHERE question_id BETWEEN %s AND %s"
@@ -117,13 +137,14 @@ def start_new_batch(start_id: int, end_id: int, selected_ais: List[str]):
     except Exception as e:
         print(f"❌ SQL执行错误: {e}")
         return {"status": "error", "msg": f"数据库初始化失败: {str(e)}"}
+    progress_tracker.reload()
 
-    # 5. 启动 Worker 线程
+    # 5. 启动各 AI 的 Worker 池
     for ai_name in selected_ais:
-        t = threading.Thread(target=_worker_loop, args=(ai_name,))
-        t.daemon = True
-        t.start()
-        WORKER_THREADS.append(t)
+        if ai_name not in AI_CONFIG: continue
+        pool = AIWorkerPool(ai_name, CONCURRENCY.get(ai_name, DEFAULT_CONCURRENCY))
+        WORKER_POOLS[ai_name] = pool
+        pool.start()
 
     return {
         "status": "success",
@@ -133,79 +154,272 @@ def start_new_batch(start_id: int, end_id: int, selected_ais: List[str]):
     }
 
 
+def _stop_all_pools():
+    for pool in WORKER_POOLS.values():
+        pool.stop()
+    WORKER_POOLS.clear()
+
+
 def stop_batch():
-    global STOP_FLAG
-    STOP_FLAG = True
+    """优雅停止：不再认领新题，进行中的题目跑完后各自写回状态"""
+    _stop_all_pools()
     return {"status": "success", "msg": "停止信号已发送"}
 
 
 def get_current_progress(page=1, page_size=20):
-    # 1. 统计各AI完成数
-    stats = {}
-    for ai in ['dingchun', 'qwen', 'kimi', 'doubao']:
-        col = AI_CONFIG[ai]['col']
-        sql = f"SELECT COUNT(*) as cnt FROM batch_task_progress WHERE {col} = 'DONE'"
-        res = db.execute_query(sql, fetch_one=True)
-        stats[ai] = res['cnt'] if res else 0
-
-    # 2. 总条数
-    total_res = db.execute_query("SELECT COUNT(*) as total FROM batch_task_progress", fetch_one=True)
-    total = total_res['total'] if total_res else 0
-
-    # 3. 列表数据 (关联查询题干)
+    # 1. 统计数来自内存计数器 (不再每次轮询都扫表)
+    snap = progress_tracker.snapshot()
+
+    # 2. 列表数据 (关联查询题干)
     offset = (page - 1) * page_size
     sql_list = f"""
-        SELECT p.*, left(q.stem, 20) as stem_preview 
+        SELECT p.question_id, p.dingchun_status, p.qwen_status, p.kimi_status, p.doubao_status,
+               p.updated_at, left(q.stem, 20) as stem_preview 
         FROM batch_task_progress p
         LEFT JOIN pharmacist_questions q ON p.question_id = q.question_id
         ORDER BY p.question_id ASC 
         LIMIT %s OFFSET %s
     """
-    rows = db.execute_query(sql_list, (page_size, offset))
+    rows = db.execute_query(sql_list, (page_size, offset)) if snap['total'] else []
 
     return {
         "status": "success",
-        "total": total,
-        "stats": stats,
+        "version": snap['version'],
+        "page": page,
+        "total": snap['total'],
+        "stats": {ai: c['DONE'] for ai, c in snap['counts'].items()},
+        "counts": snap['counts'],
         "rows": rows
     }
 
 
-# ==================== 2. Worker 线程 ====================
+def wait_progress_change(since: str, timeout: float) -> bool:
+    """长轮询：阻塞到进度版本号不等于 since 或超时，返回是否有变化"""
+    return progress_tracker.wait_for_change(since, timeout)
 
-def _worker_loop(ai_name: str):
-    config = AI_CONFIG[ai_name]
-    col_name = config['col']
-    ai_func = config['func']
 
-    print(f"🤖 [{ai_name}] Worker 启动...")
+async def wait_progress_change_async(since: str, timeout: float) -> bool:
+    """长轮询 (异步版)：等待期间只占一个协程，不占线程池"""
+    return await progress_tracker.wait_for_change_async(since, timeout)
 
-    while not STOP_FLAG:
-        # 1. 抢任务: 只找 WAIT
-        sql_find = f"SELECT question_id FROM batch_task_progress WHERE {col_name} = 'WAIT' ORDER BY question_id ASC LIMIT 1"
-        task = db.execute_query(sql_find, fetch_one=True)
 
-        if not task:
-            time.sleep(2)
-            check = db.execute_query(sql_find, fetch_one=True)
-            if not check:
-                print(f"🤖 [{ai_name}] 任务完成，线程待机。")
-                break
-            continue
+def get_rate_limits():
+    """远程服务商限流状态 (令牌随时间回填，不参与进度版本号，单独查询)"""
+    return {"status": "success", "data": rate_limiter_states()}
 
-        qid = task['question_id']
 
-        # 2. 标记 DOING
-        db.execute_update(f"UPDATE batch_task_progress SET {col_name} = 'DOING' WHERE question_id = %s", (qid,))
+# ==================== 进度计数器 ====================
+
+STATUSES = ['WAIT', 'DOING', 'DONE', 'ERROR', 'SKIP']
+
+
+class ProgressTracker:
+    """
+    批量审题进度计数器 (内存)
+    - 新批次初始化 / 服务重启后首次访问时，用一条条件求和 SQL 建立基准
+    - 之后由 Worker 在认领、写回状态时增量维护，轮询统计不再查库
+    - version 每次变更都会变化，用作 ETag / 长轮询的版本号
+    """
 
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._counts = None
+        self._total = 0
+        self._batch_id = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._async_waiters = set()  # (事件循环, asyncio.Event)，版本变化时跨线程唤醒
+
+    @property
+    def version(self) -> str:
+        return f"{self._batch_id}-{self._seq}"
+
+    def reload(self):
+        """重新从进度表汇总 (一次扫描)"""
+        sums = ", ".join(
+            f"SUM({cfg['col']} = '{st}') AS {ai}_{st}"
+            for ai, cfg in AI_CONFIG.items() for st in STATUSES
+        )
+        res = db.execute_query(f"SELECT COUNT(*) AS total, {sums} FROM batch_task_progress", fetch_one=True) or {}
+        counts = {ai: {st: int(res.get(f"{ai}_{st}") or 0) for st in STATUSES} for ai in AI_CONFIG}
+        with self._cond:
+            self._counts = counts
+            self._total = int(res.get('total') or 0)
+            self._batch_id = uuid.uuid4().hex[:8]
+            self._seq = 0
+            self._notify()
+
+    def move(self, ai_name: str, old: str, new: str, n: int = 1):
+        """n 条记录的状态从 old 变为 new"""
+        if n <= 0: return
+        with self._cond:
+            if self._counts is None: return  # 尚未建立基准，下次访问时会整体汇总
+            c = self._counts[ai_name]
+            c[old] = max(0, c[old] - n)
+            c[new] += n
+            self._seq += 1
+            self._notify()
+
+    def _notify(self):
+        """持有 _cond 时调用：唤醒同步等待者与各事件循环里的异步等待者"""
+        self._cond.notify_all()
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # 事件循环已关闭
+                self._async_waiters.discard((loop, event))
+
+    def snapshot(self) -> Dict:
+        if self._counts is None:
+            self.reload()
+        with self._cond:
+            return {
+                "version": self.version,
+                "total": self._total,
+                "counts": {ai: dict(c) for ai, c in self._counts.items()},
+            }
+
+    def wait_for_change(self, since: str, timeout: float) -> bool:
+        if self._counts is None:
+            self.reload()
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version != since, timeout=timeout)
+
+    async def wait_for_change_async(self, since: str, timeout: float) -> bool:
+        if self._counts is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.reload)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            if self.version != since: return True
+            self._async_waiters.add(waiter)
         try:
-            # 3. 执行
-            ai_func(qid)  # 写入 question_review_details
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        return self.version != since
 
-            # 4. 标记 DONE
-            db.execute_update(f"UPDATE batch_task_progress SET {col_name} = 'DONE' WHERE question_id = %s", (qid,))
-        except Exception as e:
-            print(f"❌ [{ai_name}] ID {qid} 失败: {e}")
-            db.execute_update(f"UPDATE batch_task_progress SET {col_name} = 'ERROR' WHERE question_id = %s", (qid,))
 
-        time.sleep(0.5)
\ No newline at end of file
+progress_tracker = ProgressTracker()
+
+
+# ==================== 2. Worker 池 ====================
+
+class AIWorkerPool:
+    """
+    单个 AI 的调度器
+    - 调度线程按空闲槽位数一次性认领 N 道题 (UPDATE ... LIMIT N + worker token，多进程也不会重复认领)
+    - 认领到的题交给线程池并发执行，槽位用信号量控制，不再固定 sleep
+    - stop() 后不再认领新题，进行中的题跑完正常写回
+    """
+
+    def __init__(self, ai_name: str, concurrency: int):
+        cfg = AI_CONFIG[ai_name]
+        self.ai_name = ai_name
+        self.col = cfg['col']
+        self.worker_col = cfg['worker_col']
+        self.ai_func = cfg['func']
+        self.concurrency = max(1, int(concurrency))
+        self.token = f"{ai_name}-{uuid.uuid4().hex[:12]}"
+
+        self._stop_event = threading.Event()
+        self._slots = threading.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"batch-{ai_name}")
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+
+    def start(self):
+        print(f"🤖 [{self.ai_name}] Worker 池启动，并发 {self.concurrency}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._slots.release()  # 唤醒可能在等待槽位的调度线程
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def _claim(self, n: int) -> Optional[List[int]]:
+        """原子认领 n 道 WAIT 题目，返回认领到的题号；没有可认领的返回 []，数据库异常返回 None"""
+        affected = db.execute_update(
+            f"UPDATE batch_task_progress SET {self.col} = 'DOING', {self.worker_col} = %s "
+            f"WHERE {self.col} = 'WAIT' ORDER BY question_id ASC LIMIT %s",
+            (self.token, n)
+        )
+        if affected is None:
+            return None
+        if not affected:
+            return []
+        progress_tracker.move(self.ai_name, 'WAIT', 'DOING', affected)
+        rows = db.execute_query(
+            f"SELECT question_id FROM batch_task_progress "
+            f"WHERE {self.col} = 'DOING' AND {self.worker_col} = %s ORDER BY question_id ASC",
+            (self.token,)
+        )
+        if not rows:
+            return None  # 刚认领成功却查不到：查询失败 (已认领的题下一轮会被一起取回)
+        return [r['question_id'] for r in rows]
+
+    def _set_status(self, qid: int, status: str):
+        # 带上 worker token：任务表被新批次重建后，旧批次的迟到结果不会覆盖新状态
+        affected = db.execute_update(
+            f"UPDATE batch_task_progress SET {self.col} = %s "
+            f"WHERE question_id = %s AND {self.worker_col} = %s",
+            (status, qid, self.token)
+        )
+        if affected:
+            progress_tracker.move(self.ai_name, 'DOING', status)
+
+    def _run_one(self, qid: int):
+        try:
+            result = self.ai_func(qid)  # 写入 question_review_details
+            failed = isinstance(result, dict) and result.get('status') == 'error'
+            if failed:
+                print(f"❌ [{self.ai_name}] ID {qid} 失败: {result.get('msg')}")
+            self._set_status(qid, 'ERROR' if failed else 'DONE')
+        except Exception as e:
+            print(f"❌ [{self.ai_name}] ID {qid} 失败: {e}")
+            self._set_status(qid, 'ERROR')
+        finally:
+            self._slots.release()
+
+    def _dispatch_loop(self):
+        in_flight = set()
+        failures = 0
+        try:
+            while not self._stop_event.is_set():
+                # 1. 至少等到一个空闲槽位，再顺手拿走其余空闲槽位
+                self._slots.acquire()
+                if self._stop_event.is_set():
+                    break
+                n = 1
+                while n < self.concurrency and self._slots.acquire(blocking=False):
+                    n += 1
+
+                # 2. 按槽位数认领 (只认领本轮会执行的题，已认领的题不会因停止而滞留在 DOING)
+                claimed = self._claim(n)
+                qids = [q for q in claimed or [] if q not in in_flight]
+                for _ in range(n - len(qids)):
+                    self._slots.release()
+                if claimed is None:
+                    # 数据库异常不等于没有题目：退避后重试，连续失败过多才退出
+                    failures += 1
+                    if failures > CLAIM_RETRIES:
+                        print(f"❌ [{self.ai_name}] 认领题目连续失败 {failures} 次 (数据库异常)，Worker 池退出，可重新启动继续。")
+                        break
+                    wait = min(60, 2 ** failures)
+                    print(f"⚠️ [{self.ai_name}] 认领题目失败，{wait} 秒后重试")
+                    self._stop_event.wait(wait)
+                    continue
+                failures = 0
+                if not qids:
+                    print(f"🤖 [{self.ai_name}] 没有待处理题目，等待进行中的任务结束。")
+                    break
+
+                for qid in qids:
+                    in_flight.add(qid)
+                    self._executor.submit(self._run_one, qid)
+        finally:
+            self._executor.shutdown(wait=True)
+            state = "已停止" if self._stop_event.is_set() else "任务完成"
+            print(f"🤖 [{self.ai_name}] {state}，Worker 池退出。")
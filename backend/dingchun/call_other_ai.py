@@ -13,6 +13,10 @@ import re
 from openai import OpenAI
 from config import config
 from backend.tools.tools_sql_connect import db
+from backend.dingchun.review_store import save_review_record
+from backend.tools.tools_rate_limit import get_rate_limiter
+
+REVIEW_OUTPUT_TOKENS = 1500  # 预估单次审题输出 token 数，用于发请求前占用 TPM 额度
 
 
 class OtherAIReviewer:
@@ -22,21 +26,32 @@ class OtherAIReviewer:
         # 1. Qwen
         self.client_qwen = OpenAI(
             api_key=config.DASHSCOPE_API_KEY,
-            base_url=config.DASHSCOPE_API_URL
+            base_url=config.DASHSCOPE_API_URL,
+            max_retries=0  # 429、网络错误、5xx 都由限流器统一退避重试
         )
 
         # 2. Kimi
         self.client_kimi = OpenAI(
             api_key=config.KIMI_API_KEY,
-            base_url=config.KIMI_API_URL
+            base_url=config.KIMI_API_URL,
+            max_retries=0  # 429、网络错误、5xx 都由限流器统一退避重试
         )
 
         # 3. Doubao
         self.client_doubao = OpenAI(
             api_key=config.VOLCENGINE_API_KEY,
-            base_url=config.VOLCENGINE_API_URL
+            base_url=config.VOLCENGINE_API_URL,
+            max_retries=0  # 429、网络错误、5xx 都由限流器统一退避重试
         )
 
+        # 4. 各服务商限流器
+        limits = getattr(config, "REVIEW_RATE_LIMITS", {})
+        retries = getattr(config, "REVIEW_RATE_LIMIT_RETRIES", 5)
+        self.limiters = {
+            name: get_rate_limiter(name, max_retries=retries, **limits.get(name, {}))
+            for name in ("qwen", "kimi", "doubao")
+        }
+
         # 优化后的 Prompt
         self.system_prompt = """
 ### 角色定义
@@ -104,19 +119,24 @@ class OtherAIReviewer:
 
         print(f"💾 保存 [{ai_name}] 审核结果: {review_result}")
 
-        # ✅ 修复：SQL 增加 review_time 字段
-        sql = """
-        INSERT INTO question_review_details 
-        (question_id, ai_name, review_result, review_content, rag_index, review_time)
-        VALUES (%s, %s, %s, %s, %s, NOW())
-        """
-
-        try:
-            db.execute_update(sql, (q_id, ai_name, review_result, clean_content, ""))
-            return {"status": "success", "result": review_result, "content": clean_content}
-        except Exception as e:
-            print(f"❌ 数据库写入失败: {e}")
-            return {"status": "error", "msg": f"数据库错误: {str(e)}"}
+        # 明细 + 最新结果汇总表在同一事务内写入
+        affected = save_review_record(q_id, ai_name, review_result, clean_content, "")
+        if affected is None:
+            return {"status": "error", "msg": "数据库错误: 审核记录写入失败"}
+        return {"status": "success", "result": review_result, "content": clean_content}
+
+    def _chat(self, provider: str, client, model: str, q_text: str):
+        """经限流器调用对话接口 (预估 token = 提示词字数 + 预估输出)"""
+        est_tokens = len(self.system_prompt) + len(q_text) + REVIEW_OUTPUT_TOKENS
+        resp = self.limiters[provider].call(
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=[{"role": "system", "content": self.system_prompt}, {"role": "user", "content": q_text}],
+                temperature=0.1
+            ),
+            est_tokens=est_tokens
+        )
+        return resp.choices[0].message.content
 
     def review_by_qwen(self, question_id: int):
         print(f"\n🚀 [Qwen] 正在审核题目 ID: {question_id} ...")
@@ -124,12 +144,7 @@ class OtherAIReviewer:
         if not q_text: return {"status": "error", "msg": "题目不存在"}
 
         try:
-            resp = self.client_qwen.chat.completions.create(
-                model=config.DASHSCOPE_MODEL,
-                messages=[{"role": "system", "content": self.system_prompt}, {"role": "user", "content": q_text}],
-                temperature=0.1
-            )
-            content = resp.choices[0].message.content
+            content = self._chat("qwen", self.client_qwen, config.DASHSCOPE_MODEL, q_text)
             return self._save_review_result(question_id, "Qwen", content)
         except Exception as e:
             return {"status": "error", "msg": str(e)}
@@ -140,12 +155,7 @@ class OtherAIReviewer:
         if not q_text: return {"status": "error", "msg": "题目不存在"}
 
         try:
-            resp = self.client_kimi.chat.completions.create(
-                model=config.KIMI_MODEL,
-                messages=[{"role": "system", "content": self.system_prompt}, {"role": "user", "content": q_text}],
-                temperature=0.1
-            )
-            content = resp.choices[0].message.content
+            content = self._chat("kimi", self.client_kimi, config.KIMI_MODEL, q_text)
             return self._save_review_result(question_id, "Kimi", content)
         except Exception as e:
             return {"status": "error", "msg": str(e)}
@@ -156,15 +166,9 @@ class OtherAIReviewer:
         if not q_text: return {"status": "error", "msg": "题目不存在"}
 
         try:
-            resp = self.client_doubao.chat.completions.create(
-                model=config.VOLCENGINE_MODEL,
-                messages=[{"role": "system", "content": self.system_prompt}, {"role": "user", "content": q_text}],
-                temperature=0.1
-            )
-            content = resp.choices[0].message.content
+            content = self._chat("doubao", self.client_doubao, config.VOLCENGINE_MODEL, q_text)
             return self._save_review_result(question_id, "Doubao", content)
         except Exception as e:
             return {"status": "error", "msg": str(e)}
 
-
 other_ai = OtherAIReviewer()
\ No newline at end of file
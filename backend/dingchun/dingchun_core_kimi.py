@@ -17,6 +17,7 @@ from config import config
 
 # 导入工具模块
 from backend.tools.tools_sql_connect import db
+from backend.dingchun.review_store import save_review_record
 # 拼写修正: dingchun -> dingchun
 from backend.dingchun.dingchun_tool_RAG import rag_search_tool
 from backend.tools.global_context import log_queue_ctx
@@ -173,21 +174,14 @@ class ReviewAgentKimi:
         # 5. 存库
         emit(f"💾 [Kimi] 正在保存结果 ({review_result})...")
 
-        # ✅ 修复：必须包含 review_time
-        sql = """
-            INSERT INTO question_review_details 
-            (question_id, ai_name, review_result, review_content, rag_index, review_time) 
-            VALUES (%s, %s, %s, %s, %s, NOW())
-        """
-
         try:
-            affected = db.execute_update(sql, (
+            affected = save_review_record(
                 q_id,
                 "定春(K)",
                 review_result,
                 clean_content,
                 current_rag_log
-            ))
+            )
             if not affected:
                 emit("❌ 数据库写入返回 None")
         except Exception as e:
@@ -19,6 +19,7 @@ from config import config
 
 # === 导入路径更新 ===
 from backend.tools.tools_sql_connect import db
+from backend.dingchun.review_store import save_review_record
 from backend.dingchun.dingchun_tool_RAG import rag_search_tool as core_rag_search
 
 
@@ -132,19 +133,13 @@ class ReviewAgentLocal:
 
         print(f"💾 [Local] 正在保存审核结果...")
 
-        insert_sql = """
-            INSERT INTO question_review_details 
-            (question_id, ai_name, review_result, review_content, rag_index, review_time) 
-            VALUES (%s, %s, %s, %s, %s, NOW())
-        """
-
-        affected = db.execute_update(insert_sql, (
+        affected = save_review_record(
             question_id,
             f"定春(L)",
             review_status,
             clean_content,
             rag_context_extracted
-        ))
+        )
 
         if not affected:
             print("❌ 数据库写入返回 None，请检查上方 SQL 错误日志")
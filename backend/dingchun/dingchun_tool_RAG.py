@@ -10,13 +10,22 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 # ======================
 
+import math
 from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 # 引入底层能力
-from backend.tools.tools_call_ai import call_ai_rerank_review
+from backend.search.rerank_backend import get_rerank_backend
 # 引入 search_tool 中的核心搜索和配置获取函数
-from backend.search.search_tool import ChromaManager, _core_search, get_search_collections
+from backend.search.search_tool import ChromaManager, _core_search_batch, get_search_collections
 # 引入上下文变量
 from backend.tools.global_context import log_queue_ctx
+from config import config
+
+# 重排执行配置
+RERANK_CONCURRENCY = getattr(config, "RERANK_CONCURRENCY", 2)      # 同时进行的重排请求数
+RERANK_TIMEOUT = getattr(config, "RERANK_TIMEOUT", 60)             # 单次重排请求超时 (秒)，超时回退向量顺序
+RERANK_PACK_MAX_DOCS = getattr(config, "RERANK_PACK_MAX_DOCS", 0)  # 合并打包的片段总数上限，0 表示不打包
+RERANK_BACKEND = getattr(config, "DINGCHUN_RERANK_BACKEND", "llm")  # 重排后端: llm / embedding / http
 
 
 def emit_log(msg: str):
@@ -29,6 +38,74 @@ def emit_log(msg: str):
         q.put(f"LOG: {msg}")
 
 
+# ==================== 重排执行器 ====================
+
+def _pack_rerank_jobs(jobs: List[Dict], supports_packing: bool) -> List[List[Dict]]:
+    """
+    把小的重排任务打包：相邻任务的片段总数不超过 RERANK_PACK_MAX_DOCS 时合并为一次请求
+    RERANK_PACK_MAX_DOCS <= 0 或后端不支持打包时，每个任务单独请求
+    """
+    if RERANK_PACK_MAX_DOCS <= 0 or not supports_packing:
+        return [[job] for job in jobs]
+
+    packs, current, current_docs = [], [], 0
+    for job in jobs:
+        n_docs = len(job['candidates'])
+        if current and current_docs + n_docs > RERANK_PACK_MAX_DOCS:
+            packs.append(current)
+            current, current_docs = [], 0
+        current.append(job)
+        current_docs += n_docs
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _run_rerank_phase(jobs: List[Dict], top_n: int) -> Dict[int, List[Dict]]:
+    """
+    并发执行重排，每次请求都有超时
+    :return: {id(job): 重排结果}，超时或失败的任务不在返回值中 (调用方回退到向量顺序)
+    """
+    if not jobs: return {}
+
+    backend = get_rerank_backend(RERANK_BACKEND)
+    packs = _pack_rerank_jobs(jobs, backend.supports_packing)
+    results: Dict[int, List[Dict]] = {}
+
+    def run_pack(pack):
+        # 如果 Agent 没传 rerank_entity，就传 query 本身作为兜底
+        tasks = [{
+            "query": job['q_text'],
+            "documents": [c['vector_text'] for c in job['candidates']],
+            "target_subject": job['r_entity'] if job['r_entity'] else job['q_text'],
+            "candidates": job['candidates']
+        } for job in pack]
+        return backend.rerank(tasks, top_n=top_n, timeout=RERANK_TIMEOUT)
+
+    workers = max(1, min(RERANK_CONCURRENCY, len(packs)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    future_map = {executor.submit(run_pack, pack): pack for pack in packs}
+
+    # 整体兜底时限：排队轮数 × 单次超时 (单次超时由 requests 的 timeout 保证)
+    rounds = math.ceil(len(packs) / workers)
+    overall_deadline = RERANK_TIMEOUT * rounds + 5 if RERANK_TIMEOUT else None
+
+    try:
+        for future in as_completed(future_map, timeout=overall_deadline):
+            pack = future_map[future]
+            try:
+                for job, ranked in zip(pack, future.result()):
+                    results[id(job)] = ranked
+            except Exception as e:
+                emit_log(f"      ❌ 重排异常 ({len(pack)} 组): {e}")
+    except FuturesTimeout:
+        emit_log(f"      ⏱️ 重排整体超时，未完成的任务将使用向量顺序")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
 # ==================== Agent 工具接口 (优化版) ====================
 
 def rag_search_tool(search_requests: List[Dict[str, str]]) -> str:
@@ -54,85 +131,91 @@ def rag_search_tool(search_requests: List[Dict[str, str]]) -> str:
         return err
 
     # -------------------------------------------------------
-    # Phase 1: 向量召回 (串行处理)
+    # Phase 1: 向量召回 (批量：一次向量化 + 每个集合一次查询)
     # -------------------------------------------------------
     pending_rerank_tasks = []
     RECALL_K = 15
 
-    for i, req in enumerate(search_requests):
-        # === [修改点] 参数简化与明确 ===
-        # 1. query: 完整的自然语言搜索句 (例如 "地西泮的适应证是什么？")
-        q_text = req.get("query", "")
+    # === [修改点] 参数简化与明确 ===
+    # 1. query: 完整的自然语言搜索句 (例如 "地西泮的适应证是什么？")
+    # 2. rerank_entity: 辅助重排的实体 (例如 "适应证" 或 "地西泮")
+    #    Agent 只需要传这一个词，告诉 Rerank 模型重点看什么
+    q_texts = [req.get("query", "") for req in search_requests]
+    r_entities = [req.get("rerank_entity", "") for req in search_requests]
 
-        # 2. rerank_entity: 辅助重排的实体 (例如 "适应证" 或 "地西泮")
-        # Agent 只需要传这一个词，告诉 Rerank 模型重点看什么
-        r_entity = req.get("rerank_entity", "")
+    emit_log(f"🔍 [Step 1] 向量召回: {task_count} 个检索请求合并为一次向量化 + 每个集合一次查询")
+
+    try:
+        # 核心检索：所有 q_text 一起查
+        batch_candidates = _core_search_batch(query_texts=q_texts, top_k=RECALL_K)
+    except Exception as e:
+        emit_log(f"      ❌ 检索异常: {e}")
+        batch_candidates = [[] for _ in q_texts]
+
+    for i, req in enumerate(search_requests):
+        q_text = q_texts[i]
+        r_entity = r_entities[i]
+        raw_candidates = batch_candidates[i] if i < len(batch_candidates) else []
 
         # 构造日志描述
         log_desc = f"'{q_text[:20]}...'"
         if r_entity:
             log_desc += f" (辅助: {r_entity})"
 
-        emit_log(f"🔍 [Step 1] ({i + 1}/{task_count}) 检索: {log_desc}")
-
-        try:
-            # 核心检索：直接用完整的 q_text 去查
-            raw_candidates = _core_search(query_text=q_text, top_k=RECALL_K)
-
-            if raw_candidates:
-                processed_candidates = []
-                for cand in raw_candidates:
-                    meta = cand.get('metadata', {}) or {}
-                    content = cand.get('content', '')
-
-                    # 构造重排文本 (标题 + 内容)
-                    combo_title = meta.get('组合标题', '')
-                    if combo_title:
-                        vec_text = f"{combo_title}：\n{content}"
-                    else:
-                        vec_text = content
-                    cand['vector_text'] = vec_text
-
-                    # 构造面包屑路径 (L1-L8)
-                    display_path = meta.get('完整路径', '')
-                    if not display_path:
-                        parts = []
-                        for lvl in range(1, 9):
-                            val = meta.get(f"L{lvl}")
-                            if val and str(val).strip():
-                                parts.append(str(val).strip())
-                        display_path = " > ".join(parts)
-
-                    if not display_path:
-                        display_path = meta.get('来源文件', '未知来源')
-
-                    cand['display_path'] = display_path
-                    processed_candidates.append(cand)
-
-                cand_len = len(processed_candidates)
-                emit_log(f"      ✅ 初筛命中: {cand_len} 条记录")
-
-                pending_rerank_tasks.append({
-                    "req": req,
-                    "candidates": processed_candidates,
-                    "q_text": q_text,
-                    "r_entity": r_entity
-                })
-            else:
-                emit_log(f"      ⚠️ 未找到相关内容")
-
-        except Exception as e:
-            emit_log(f"      ❌ 检索异常: {e}")
+        if raw_candidates:
+            processed_candidates = []
+            for cand in raw_candidates:
+                meta = cand.get('metadata', {}) or {}
+                content = cand.get('content', '')
+
+                # 构造重排文本 (标题 + 内容)
+                combo_title = meta.get('组合标题', '')
+                if combo_title:
+                    vec_text = f"{combo_title}：\n{content}"
+                else:
+                    vec_text = content
+                cand['vector_text'] = vec_text
+
+                # 构造面包屑路径 (L1-L8)
+                display_path = meta.get('完整路径', '')
+                if not display_path:
+                    parts = []
+                    for lvl in range(1, 9):
+                        val = meta.get(f"L{lvl}")
+                        if val and str(val).strip():
+                            parts.append(str(val).strip())
+                    display_path = " > ".join(parts)
+
+                if not display_path:
+                    display_path = meta.get('来源文件', '未知来源')
+
+                cand['display_path'] = display_path
+                processed_candidates.append(cand)
+
+            cand_len = len(processed_candidates)
+            emit_log(f"      ✅ ({i + 1}/{task_count}) {log_desc} 初筛命中: {cand_len} 条记录")
+
+            pending_rerank_tasks.append({
+                "req": req,
+                "candidates": processed_candidates,
+                "q_text": q_text,
+                "r_entity": r_entity
+            })
+        else:
+            emit_log(f"      ⚠️ ({i + 1}/{task_count}) {log_desc} 未找到相关内容")
 
     # -------------------------------------------------------
-    # Phase 2: 语义重排
+    # Phase 2: 语义重排 (并发 + 超时回退)
     # -------------------------------------------------------
     if pending_rerank_tasks:
         emit_log(f"⚖️ [Step 2] 正在进行语义重排 (Rerank)...")
 
     FINAL_TOP_N = 3
 
-    for task in pending_rerank_tasks:
+    rerank_jobs = [t for t in pending_rerank_tasks if len(t['candidates']) > 1]
+    rerank_map = _run_rerank_phase(rerank_jobs, FINAL_TOP_N)
+
+    for task_idx, task in enumerate(pending_rerank_tasks):
         candidates = task['candidates']
         q_text = task['q_text']
         r_entity = task['r_entity']
@@ -142,33 +225,23 @@ def rag_search_tool(search_requests: List[Dict[str, str]]) -> str:
         final_results = []
 
         if len(candidates) > 1:
-            rerank_inputs = [c['vector_text'] for c in candidates]
-
-            # === [修改点] 重排参数 ===
-            # 将 rerank_entity 作为 target_subject 传给模型
-            # 如果 Agent 没传 rerank_entity，就传 query 本身作为兜底
-            target_subject = r_entity if r_entity else q_text
-
-            rerank_scores = call_ai_rerank_review(
-                query=q_text,
-                documents=rerank_inputs,
-                top_n=FINAL_TOP_N,
-                target_subject=target_subject
-            )
-
-            for r in rerank_scores:
-                for c in candidates:
-                    if c['vector_text'] == r['text']:
-                        c_copy = c.copy()
-                        c_copy['score'] = r['score']
-                        final_results.append(c_copy)
-                        break
-
-            if final_results:
-                top_score = final_results[0]['score']
-                res_count = len(final_results)
-                sub_log = f" [关注: {r_entity}]" if r_entity else ""
-                emit_log(f"      ->{sub_log} 重排选出 Top {res_count} (最高分: {top_score:.2f})")
+            rerank_scores = rerank_map.get(id(task))
+
+            if rerank_scores is None:
+                # 超时或异常：退回向量召回顺序
+                final_results = [dict(c, score=c.get('raw_score', 0.0)) for c in candidates[:FINAL_TOP_N]]
+                emit_log(f"      ⏱️ 重排超时/失败，使用向量召回顺序: '{q_text[:20]}'")
+            else:
+                for r in rerank_scores:
+                    c_copy = candidates[r['index']].copy()
+                    c_copy['score'] = r['score']
+                    final_results.append(c_copy)
+
+                if final_results:
+                    top_score = final_results[0]['score']
+                    res_count = len(final_results)
+                    sub_log = f" [关注: {r_entity}]" if r_entity else ""
+                    emit_log(f"      ->{sub_log} 重排选出 Top {res_count} (最高分: {top_score:.2f})")
         else:
             final_results = candidates[:FINAL_TOP_N]
 
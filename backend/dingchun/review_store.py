@@ -0,0 +1,164 @@
+# === 路径修复 ===
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(os.path.dirname(current_dir))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+# ======================
+
+import threading
+from typing import Optional
+from backend.tools.tools_sql_connect import db
+
+# ==================== 配置区 ====================
+# ai_name 前缀 -> AI 家族 (与列表页的四个状态列一一对应)
+AI_FAMILIES = {
+    'dingchun': '定春',
+    'qwen': 'Qwen',
+    'kimi': 'Kimi',
+    'doubao': 'Doubao',
+}
+
+_FAMILY_CASE = "CASE " + " ".join(
+    f"WHEN ai_name LIKE '{prefix}%%' THEN '{family}'" for family, prefix in AI_FAMILIES.items()
+) + " END"
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def ai_family(ai_name: str) -> Optional[str]:
+    """'定春(L)' -> 'dingchun'，'Qwen' -> 'qwen'；不属于四个家族返回 None"""
+    lowered = (ai_name or "").lower()
+    for family, prefix in AI_FAMILIES.items():
+        if lowered.startswith(prefix.lower()):
+            return family
+    return None
+
+
+# ==================== 1. 最新审核结果汇总表 ====================
+
+def ensure_latest_review_table():
+    """
+    确保 question_latest_review 存在：每道题每个 AI 家族只保留最新一条审核结果，
+    列表页用一次 JOIN 取状态，不再对 question_review_details 做相关子查询。
+    首次建表 (或表为空而明细表有数据) 时从明细表回填。
+    """
+    global _table_ready
+    if _table_ready: return
+    with _table_lock:
+        if _table_ready: return
+        db.execute_update("""
+        CREATE TABLE IF NOT EXISTS question_latest_review (
+            question_id INT NOT NULL,
+            ai_family VARCHAR(20) NOT NULL,
+            review_id INT DEFAULT NULL,
+            ai_name VARCHAR(50) DEFAULT NULL,
+            review_result VARCHAR(50) DEFAULT NULL,
+            review_time DATETIME DEFAULT NULL,
+            PRIMARY KEY (question_id, ai_family)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+
+        res = db.execute_query("SELECT COUNT(*) AS cnt FROM question_latest_review", fetch_one=True)
+        ok = bool(res)  # 查询失败时 execute_query 返回 []，下次再检查
+        if res and res['cnt'] == 0:
+            ok = rebuild_latest_review() is not None  # 回填失败已回滚，下次再回填
+        _table_ready = ok
+
+
+def rebuild_latest_review():
+    """
+    按明细表整体重建汇总表 (用于首次回填，或手工改过明细表之后校正)
+    清空与回填在同一事务里，提交前其它连接仍读到旧数据，失败时整体回滚
+    :return: 回填的行数 (int) 或 None (失败)
+    """
+    sql = f"""
+    INSERT INTO question_latest_review (question_id, ai_family, review_id, ai_name, review_result, review_time)
+    SELECT question_id, family, review_id, ai_name, review_result, review_time
+    FROM (
+        SELECT d.*, {_FAMILY_CASE} AS family,
+               ROW_NUMBER() OVER (
+                   PARTITION BY question_id, {_FAMILY_CASE}
+                   ORDER BY review_time DESC, review_id DESC
+               ) AS rn
+        FROM question_review_details d
+    ) t
+    WHERE rn = 1 AND family IS NOT NULL
+    """
+    conn = db.get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM question_latest_review")
+            affected = cursor.execute(sql)
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ [LatestReview] 汇总表重建失败，已回滚: {e}")
+        return None
+    finally:
+        conn.close()
+    print(f"📋 [LatestReview] 汇总表已重建: {affected} 条")
+    return affected
+
+
+# ==================== 2. 写入审核记录 ====================
+
+def save_review_record(question_id: int, ai_name: str, review_result: str,
+                       review_content: str, rag_index: str = ""):
+    """
+    写入一条审核明细，并在同一事务里刷新该题该 AI 家族的最新结果
+    :return: 受影响的行数 (int) 或 None (失败时打印错误，与 db.execute_update 一致)
+    """
+    ensure_latest_review_table()
+    family = ai_family(ai_name)
+
+    conn = db.get_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            affected = cursor.execute("""
+                INSERT INTO question_review_details
+                (question_id, ai_name, review_result, review_content, rag_index, review_time)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+            """, (question_id, ai_name, review_result, review_content, rag_index))
+            review_id = cursor.lastrowid
+
+            if family:
+                cursor.execute("""
+                    INSERT INTO question_latest_review
+                    (question_id, ai_family, review_id, ai_name, review_result, review_time)
+                    VALUES (%s, %s, %s, %s, %s, NOW())
+                    ON DUPLICATE KEY UPDATE
+                        review_id = VALUES(review_id), ai_name = VALUES(ai_name),
+                        review_result = VALUES(review_result), review_time = VALUES(review_time)
+                """, (question_id, family, review_id, ai_name, review_result))
+            conn.commit()
+            return affected
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ 审核记录写入失败: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+# ==================== 3. 列表查询片段 ====================
+
+def latest_status_select() -> str:
+    """列表页 SELECT 中的四个状态列 (配合 latest_status_joins 使用)"""
+    return ",\n        ".join(f"r_{f}.review_result AS status_{f}" for f in AI_FAMILIES)
+
+
+def latest_status_joins(alias: str = "q") -> str:
+    """列表页 FROM 之后的 JOIN：每个家族一次主键等值连接"""
+    return "\n    ".join(
+        f"LEFT JOIN question_latest_review r_{f} "
+        f"ON r_{f}.question_id = {alias}.question_id AND r_{f}.ai_family = '{f}'"
+        for f in AI_FAMILIES
+    )
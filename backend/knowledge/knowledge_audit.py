@@ -12,6 +12,8 @@ if root_dir not in sys.path:
 
 from backend.tools.tools_sql_connect import db
 from backend.tools.tools_call_ai import call_ai_emb
+from backend.knowledge.metadata_index import metadata_index
+from backend.knowledge import overview_stats
 from config import config
 
 
@@ -174,11 +176,14 @@ def execute_batch_embed(fragment_ids: List[int]):
             metadatas.append(meta)
 
         # 4. 向量化
-        embeddings = call_ai_emb(docs, dimensions=4096)
+        embeddings = call_ai_emb(docs, dimensions=4096, use_cache=False)
         if not embeddings: return {"status": "error", "msg": "向量化失败"}
 
         # 5. 写入 (使用 upsert)
+        deltas = overview_stats.source_deltas(collection, ids, metadatas)
         collection.upsert(ids=ids, documents=docs, embeddings=embeddings, metadatas=metadatas)
+        metadata_index.upsert(col_name, ids, metadatas)
+        overview_stats.apply_deltas(col_name, deltas)
 
         # 6. 更新状态
         db.execute_update(f"UPDATE knowledge_fragments SET is_embedded=1 WHERE fragment_id IN ({format_strings})",
@@ -3,9 +3,11 @@ import chromadb
 import uuid
 from typing import Dict, Any, Optional
 from pydantic import BaseModel
-from collections import Counter  # <--- [新增] 用于统计
 from config import config
 from backend.tools.tools_call_ai import call_ai_emb
+from backend.knowledge.metadata_index import metadata_index, INDEX_FIELDS
+from backend.knowledge import overview_stats
+from backend.tools.tools_pagination import encode_cursor, decode_cursor
 
 # ==================== 基础配置 ====================
 DB_PATH = getattr(config, "VECTOR_DB_PATH_MEDIC", "G:/KnowledgeBase/vectorizer_medic")
@@ -37,6 +39,7 @@ class QueryRequest(BaseModel):
     page: int = 1
     page_size: int = 20
     filters: Optional[Dict[str, Any]] = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传了就按游标翻页 (忽略 page)
 
 
 class DocumentRequest(BaseModel):
@@ -69,9 +72,21 @@ def get_metadata_values(collection_name: str):
     return keys
 
 
+def _parse_filter(value) -> tuple:
+    """过滤值语法：'=值' 精确匹配，'^值' 前缀匹配，其余为包含 (不区分大小写)"""
+    v = str(value or "").strip()
+    if v.startswith("="):
+        return "exact", v[1:].strip()
+    if v.startswith("^"):
+        return "prefix", v[1:].strip()
+    return "contains", v
+
+
 def query_documents(req: QueryRequest):
     """
-    分页查询 (逻辑不变)
+    分页查询
+    过滤走 Chroma where / 元数据索引，不再每次读取整个集合的元数据；
+    按游标翻页：id 顺序来自元数据索引，只有本页的正文/元数据才从 Chroma 读取
     """
     client = ChromaAdmin.get_client()
     if not client: return {"status": "error", "msg": "DB未连接"}
@@ -79,34 +94,51 @@ def query_documents(req: QueryRequest):
     try:
         col = client.get_collection(req.collection_name)
 
-        # 1. 获取所有 Metadata 用于过滤
-        all_data = col.get(include=["metadatas"])
-        all_ids = all_data['ids']
-        all_metas = all_data['metadatas']
-
-        matched_ids = []
-
-        if req.filters:
-            valid_filters = {k: v.strip() for k, v in req.filters.items() if v and v.strip()}
-            if not valid_filters:
-                matched_ids = all_ids
+        # 1. 过滤条件分三类：
+        #    精确 (=值)        -> 下推到 Chroma where，只取 id
+        #    包含 / 前缀 (^值)  -> 元数据索引 (内存倒排，结果缓存，翻页不重复计算)
+        #    未建索引字段的包含/前缀 -> 在 where 结果上扫描元数据 (兜底)
+        where_parts, index_filters, scan_filters = [], {}, {}
+        for k, raw in (req.filters or {}).items():
+            mode, kw = _parse_filter(raw)
+            if not kw: continue
+            if mode == "exact":
+                where_parts.append({k: {"$eq": kw}})
+            elif k in INDEX_FIELDS:
+                index_filters[k] = (mode, kw)
             else:
-                for i, meta in enumerate(all_metas):
-                    is_match = True
-                    for k, v in valid_filters.items():
-                        meta_val = str(meta.get(k, ""))
-                        if v.lower() not in meta_val.lower():
-                            is_match = False
-                            break
-                    if is_match:
-                        matched_ids.append(all_ids[i])
-        else:
-            matched_ids = all_ids
-
-        total_count = len(matched_ids)
-        start = (req.page - 1) * req.page_size
-        end = start + req.page_size
-        page_ids = matched_ids[start:end]
+                scan_filters[k] = (mode, kw.lower())
+
+        where = None
+        if where_parts:
+            where = where_parts[0] if len(where_parts) == 1 else {"$and": where_parts}
+
+        candidate_ids = None
+        if scan_filters:
+            scanned = col.get(where=where, include=["metadatas"])
+            candidate_ids = []
+            for doc_id, meta in zip(scanned['ids'], scanned['metadatas']):
+                ok = True
+                for k, (mode, kw) in scan_filters.items():
+                    meta_val = str((meta or {}).get(k, "")).lower()
+                    if not (meta_val.startswith(kw) if mode == "prefix" else kw in meta_val):
+                        ok = False
+                        break
+                if ok:
+                    candidate_ids.append(doc_id)
+        elif where:
+            candidate_ids = col.get(where=where, include=[])['ids']
+
+        # 2. 游标分页 (没有游标时按页码换算偏移，兼容旧调用)，之后只取本页正文
+        res = metadata_index.page(
+            col, req.page_size,
+            after=decode_cursor(req.cursor),
+            offset=(req.page - 1) * req.page_size,
+            filters=index_filters or None,
+            candidate_ids=candidate_ids
+        )
+        page_ids = res['ids']
+        total_count = res['total']
 
         data = []
         if page_ids:
@@ -131,7 +163,9 @@ def query_documents(req: QueryRequest):
             "status": "success",
             "data": data,
             "total": total_count,
-            "page": req.page
+            "page": req.page,
+            "has_more": res['next'] is not None,
+            "next_cursor": encode_cursor(res['next'])
         }
 
     except Exception as e:
@@ -200,12 +234,15 @@ def save_document(req: DocumentRequest):
         # 6. 执行数据库更新
         # documents=[vector_text] -> 确保向量库里的主文档是 "标题+内容"
         if req.doc_id:
+            deltas = overview_stats.source_deltas(col, [req.doc_id], [final_metadata])
             col.update(
                 ids=[req.doc_id],
                 documents=[vector_text],  # 更新 Document 为组合文本
                 embeddings=[emb],  # 更新 向量
                 metadatas=[final_metadata]  # 更新 元数据
             )
+            metadata_index.upsert(req.collection_name, [req.doc_id], [final_metadata])
+            overview_stats.apply_deltas(req.collection_name, deltas)
             msg = "更新成功"
         else:
             new_id = str(uuid.uuid4())
@@ -215,6 +252,8 @@ def save_document(req: DocumentRequest):
                 embeddings=[emb],
                 metadatas=[final_metadata]
             )
+            metadata_index.upsert(req.collection_name, [new_id], [final_metadata])
+            overview_stats.apply_deltas(req.collection_name, overview_stats.source_deltas(col, [], [final_metadata]))
             msg = "新增成功"
 
         return {"status": "success", "msg": msg}
@@ -227,7 +266,10 @@ def delete_document(req: DeleteRequest):
     client = ChromaAdmin.get_client()
     try:
         col = client.get_collection(req.collection_name)
+        deltas = overview_stats.source_deltas(col, [req.doc_id])
         col.delete(ids=[req.doc_id])
+        metadata_index.remove(req.collection_name, [req.doc_id])
+        overview_stats.apply_deltas(req.collection_name, deltas)
         return {"status": "success", "msg": "删除成功"}
     except Exception as e:
         return {"status": "error", "msg": str(e)}
@@ -237,6 +279,8 @@ def delete_document(req: DeleteRequest):
 def get_database_overview():
     """
     获取数据库概览：包含集合列表、每个集合下的来源文件及对应的条目数
+    来源统计读 knowledge_source_stats (由写入方增量维护)，不再读取集合的全部元数据；
+    统计合计与 col.count() 不一致时标记 stats_stale，可调用重算接口修复
     """
     client = ChromaAdmin.get_client()
     if not client:
@@ -244,14 +288,17 @@ def get_database_overview():
 
     try:
         collections = client.list_collections()
+        all_counts = overview_stats.load_counts()
         overview_data = []
 
         for col in collections:
-            # 只获取 metadatas 以提高速度
             try:
-                data = col.get(include=['metadatas'])
-                metadatas = data['metadatas']
-                total_count = len(metadatas)
+                total_count = col.count()
+                counts = all_counts.get(col.name, {})
+                if total_count and not counts:
+                    # 从未统计过 (例如升级前已入库的集合)，首次访问时重算一次
+                    overview_stats.recompute(col)
+                    counts = overview_stats.load_counts().get(col.name, {})
             except Exception as e:
                 # 防止某个集合损坏导致整个接口挂掉
                 overview_data.append({
@@ -261,37 +308,37 @@ def get_database_overview():
                 })
                 continue
 
-            if total_count == 0:
-                overview_data.append({
-                    "collection_name": col.name,
-                    "total_count": 0,
-                    "sources": []
-                })
-                continue
-
-            # 统计来源文件
-            source_counter = Counter()
-            for meta in metadatas:
-                if meta:
-                    # 尝试获取来源文件字段
-                    name = meta.get('来源文件', meta.get('source', ''))
-                    if not name or not name.strip():
-                        name = "未知来源/未分类"
-                    source_counter[name] += 1
-
             # 排序：数量多的在前
             sources_list = [
                 {"name": name, "count": count}
-                for name, count in source_counter.most_common()
+                for name, count in sorted(counts.items(), key=lambda x: x[1], reverse=True)
             ]
 
             overview_data.append({
                 "collection_name": col.name,
                 "total_count": total_count,
-                "sources": sources_list
+                "sources": sources_list,
+                "stats_stale": sum(counts.values()) != total_count
             })
 
         return {"status": "success", "data": overview_data}
 
     except Exception as e:
-        return {"status": "error", "msg": str(e)}
\ No newline at end of file
+        return {"status": "error", "msg": str(e)}
+
+
+def recompute_overview(collection_name: Optional[str] = None):
+    """重算来源统计 (修复用)，不传集合名则重算全部集合"""
+    client = ChromaAdmin.get_client()
+    if not client:
+        return {"status": "error", "msg": "DB未连接"}
+
+    try:
+        if collection_name:
+            cols = [client.get_collection(collection_name)]
+        else:
+            cols = client.list_collections()
+        result = {col.name: overview_stats.recompute(col) for col in cols}
+        return {"status": "success", "data": result}
+    except Exception as e:
+        return {"status": "error", "msg": str(e)}
@@ -0,0 +1,264 @@
+import threading
+from bisect import bisect_right
+from typing import Dict, List, Optional, Iterable
+
+# ==================== 基础配置 ====================
+# 建立索引的元数据字段 (级标检索、知识库管理页的过滤都只用到这些字段)
+INDEX_FIELDS = ["来源文件", "组合标题", "完整路径"] + [f"L{i}" for i in range(1, 9)]
+LOAD_PAGE_SIZE = 5000  # 首次加载时分页读取 Chroma，避免一次性拉取过大
+FILTER_CACHE_SIZE = 64  # 每个集合缓存的过滤结果个数 (翻页时复用，数据变更后清空)
+
+
+def _ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _CollectionIndex:
+    """
+    单个集合的元数据倒排索引
+    同一章节下的大量片段共享相同的 L1-L8/完整路径，所以按"去重后的字段值"建索引：
+    - docs: id -> {字段: 小写值}
+    - value_ids: 字段 -> {小写值: id 集合}
+    - grams: 双字 n-gram -> 包含它的字段值集合，用于快速缩小需要子串校验的值
+    - order: id -> 序号，保证返回顺序与 Chroma 原始顺序一致 (新增的排在最后)
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, str]] = {}
+        self.value_ids: Dict[str, Dict[str, set]] = {f: {} for f in INDEX_FIELDS}
+        self.value_refs: Dict[str, int] = {}
+        self.grams: Dict[str, set] = {}
+        self.order: Dict[str, int] = {}
+        self._seq = 0
+        self._ordered = None  # (按 order 排好的 id 列表, 对应序号列表)，分页用，增删后失效
+        self._filter_cache: Dict[tuple, tuple] = {}  # 过滤条件 -> (id 列表, 序号列表)，任何写入后清空
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _ref_value(self, value: str):
+        self.value_refs[value] = self.value_refs.get(value, 0) + 1
+        if self.value_refs[value] == 1:
+            for g in _ngrams(value, 2):
+                self.grams.setdefault(g, set()).add(value)
+
+    def _unref_value(self, value: str):
+        self.value_refs[value] -= 1
+        if self.value_refs[value] == 0:
+            del self.value_refs[value]
+            for g in _ngrams(value, 2):
+                bucket = self.grams.get(g)
+                if bucket is not None:
+                    bucket.discard(value)
+                    if not bucket:
+                        del self.grams[g]
+
+    def _drop(self, doc_id: str):
+        lowered = self.docs.pop(doc_id, None)
+        if lowered is None: return
+        for f, v in lowered.items():
+            if not v: continue
+            ids = self.value_ids[f][v]
+            ids.discard(doc_id)
+            if not ids:
+                del self.value_ids[f][v]
+                self._unref_value(v)
+
+    def add(self, doc_id: str, meta: Optional[Dict]):
+        self._drop(doc_id)  # 更新时先摘掉旧值，但保留原有顺序
+        self._filter_cache.clear()
+        meta = meta or {}
+        lowered = {f: str(meta.get(f, "") or "").lower() for f in INDEX_FIELDS}
+        self.docs[doc_id] = lowered
+        for f, v in lowered.items():
+            if not v: continue
+            if v not in self.value_ids[f]:
+                self.value_ids[f][v] = set()
+                self._ref_value(v)
+            self.value_ids[f][v].add(doc_id)
+        if doc_id not in self.order:
+            self.order[doc_id] = self._seq
+            self._seq += 1
+            self._ordered = None
+
+    def remove(self, doc_id: str):
+        self._drop(doc_id)
+        self._filter_cache.clear()
+        if self.order.pop(doc_id, None) is not None:
+            self._ordered = None
+
+    def matching_values(self, keyword: str) -> List[str]:
+        """返回包含 keyword 的所有字段值"""
+        if len(keyword) >= 2:
+            buckets = sorted((self.grams.get(g, set()) for g in _ngrams(keyword, 2)), key=len)
+            cands = set(buckets[0])
+            for b in buckets[1:]:
+                cands &= b
+                if not cands: break
+        else:
+            # 单字关键词：字段值的去重数量远小于片段数，直接扫描
+            cands = self.value_refs.keys()
+        return [v for v in cands if keyword in v]
+
+    def ids_matching(self, keyword: str, fields: List[str]) -> set:
+        """任一指定字段包含 keyword 的 id 集合；keyword 为空返回全部"""
+        if not keyword:
+            return set(self.docs.keys())
+        result = set()
+        for v in self.matching_values(keyword):
+            for f in fields:
+                ids = self.value_ids.get(f, {}).get(v)
+                if ids: result |= ids
+        return result
+
+    def sort_ids(self, ids: Iterable[str]) -> List[str]:
+        return sorted(ids, key=lambda i: self.order.get(i, 0))
+
+    def ordered(self):
+        """全部 id 及其序号 (均按序号升序)"""
+        if self._ordered is None:
+            ids = self.sort_ids(self.docs.keys())
+            self._ordered = (ids, [self.order[i] for i in ids])
+        return self._ordered
+
+    def filtered(self, filters: Dict[str, tuple]):
+        """
+        按字段过滤 (多个字段取交集)，返回 (id 列表, 序号列表)，结果按条件缓存
+        :param filters: {字段: (模式, 关键词)}，模式为 contains (包含) / prefix (前缀)，不区分大小写
+        """
+        key = tuple(sorted((f, mode, kw.lower()) for f, (mode, kw) in filters.items()))
+        hit = self._filter_cache.get(key)
+        if hit is not None:
+            return hit
+
+        result = None
+        for field, mode, kw in key:
+            values = self.matching_values(kw)
+            if mode == "prefix":
+                values = [v for v in values if v.startswith(kw)]
+            field_ids = self.value_ids.get(field, {})
+            ids = set()
+            for v in values:
+                ids |= field_ids.get(v, set())
+            result = ids if result is None else result & ids
+            if not result: break
+
+        ids = self.sort_ids(result or ())
+        hit = (ids, [self.order[i] for i in ids])
+        if len(self._filter_cache) >= FILTER_CACHE_SIZE:
+            self._filter_cache.clear()
+        self._filter_cache[key] = hit
+        return hit
+
+
+class MetadataIndex:
+    """
+    元数据索引管理器 (全局单例 metadata_index)
+    首次访问某个集合时从 Chroma 加载一次，之后由写入方 (保存/删除/更新/入库) 同步维护；
+    每次访问会对比 col.count()，发现条数不一致 (例如外部脚本写入) 时自动重建。
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, _CollectionIndex] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._global_lock = threading.Lock()
+
+    def _lock_for(self, col_name: str) -> threading.Lock:
+        with self._global_lock:
+            if col_name not in self._locks:
+                self._locks[col_name] = threading.Lock()
+            return self._locks[col_name]
+
+    def _load(self, col) -> _CollectionIndex:
+        idx = _CollectionIndex()
+        offset = 0
+        while True:
+            batch = col.get(include=["metadatas"], limit=LOAD_PAGE_SIZE, offset=offset)
+            ids = batch['ids']
+            if not ids: break
+            for doc_id, meta in zip(ids, batch['metadatas']):
+                idx.add(doc_id, meta)
+            if len(ids) < LOAD_PAGE_SIZE: break
+            offset += LOAD_PAGE_SIZE
+        print(f"📇 [MetaIndex] 集合 [{col.name}] 索引已加载: {len(idx)} 条")
+        return idx
+
+    def _get(self, col) -> _CollectionIndex:
+        """获取 (必要时加载/重建) 集合索引，调用方需持有该集合的锁"""
+        idx = self._indexes.get(col.name)
+        if idx is None or len(idx) != col.count():
+            idx = self._load(col)
+            self._indexes[col.name] = idx
+        return idx
+
+    # ---------- 查询 ----------
+    def search_any_field(self, col, keyword: str, fields: Optional[List[str]] = None) -> List[str]:
+        """
+        返回任一指定字段包含 keyword (不区分大小写) 的 id 列表
+        :param fields: 参与匹配的字段，默认全部索引字段
+        """
+        fields = fields or INDEX_FIELDS
+        key = (keyword or "").strip().lower()
+        with self._lock_for(col.name):
+            idx = self._get(col)
+            return idx.sort_ids(idx.ids_matching(key, fields))
+
+    def page(self, col, limit: int, after: Optional[Dict] = None, offset: int = 0,
+             filters: Optional[Dict[str, tuple]] = None,
+             candidate_ids: Optional[Iterable[str]] = None) -> Dict:
+        """
+        按 Chroma 原始顺序做游标分页 (只返回 id，正文由调用方按 id 取)
+        :param after: 上一页返回的游标 {"id", "seq"}；该 id 仍在索引中时以它当前的序号为准
+        :param offset: 没有游标时跳过的条数 (兼容按页码跳页)
+        :param filters: 索引字段上的包含/前缀过滤，格式同 _CollectionIndex.filtered
+        :param candidate_ids: 再限定在这些 id 中 (例如 Chroma where 精确过滤的结果)，None 表示不限定
+        :return: {"ids": 本页 id, "total": 总条数, "next": 下一页游标或 None}
+        """
+        with self._lock_for(col.name):
+            idx = self._get(col)
+            ids, seqs = idx.filtered(filters) if filters else idx.ordered()
+            if candidate_ids is not None:
+                allowed = set(candidate_ids)
+                pairs = [(i, q) for i, q in zip(ids, seqs) if i in allowed]
+                ids, seqs = [p[0] for p in pairs], [p[1] for p in pairs]
+
+            if after:
+                seq = idx.order.get(after.get("id"), after.get("seq", -1))
+                start = bisect_right(seqs, seq)
+            else:
+                start = max(0, offset)
+
+            page_ids = ids[start:start + limit]
+            nxt = None
+            if page_ids and start + limit < len(ids):
+                nxt = {"id": page_ids[-1], "seq": idx.order[page_ids[-1]]}
+            return {"ids": page_ids, "total": len(ids), "next": nxt}
+
+    # ---------- 维护 ----------
+    def upsert(self, col_name: str, ids: List[str], metadatas: List[Dict]):
+        """写入方调用：同步新增/更新的元数据 (集合索引尚未加载时忽略，下次加载自然是最新的)"""
+        with self._lock_for(col_name):
+            idx = self._indexes.get(col_name)
+            if idx is None: return
+            for doc_id, meta in zip(ids, metadatas):
+                idx.add(doc_id, meta)
+
+    def remove(self, col_name: str, ids: List[str]):
+        """写入方调用：同步删除"""
+        with self._lock_for(col_name):
+            idx = self._indexes.get(col_name)
+            if idx is None: return
+            for doc_id in ids:
+                idx.remove(doc_id)
+
+    def invalidate(self, col_name: Optional[str] = None):
+        """丢弃索引，下次访问时重建 (不传集合名则全部丢弃)"""
+        with self._global_lock:
+            if col_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(col_name, None)
+
+
+# 实例化一个全局对象，供其他模块直接调用
+metadata_index = MetadataIndex()
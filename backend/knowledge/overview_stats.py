@@ -0,0 +1,132 @@
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from backend.tools.tools_sql_connect import db
+
+# ==================== 基础配置 ====================
+UNKNOWN_SOURCE = "未知来源/未分类"
+RECOMPUTE_PAGE_SIZE = 5000  # 重算时分页读取 Chroma 元数据
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def source_name(meta: Optional[Dict]) -> str:
+    """片段所属的来源文件名 (与概览页的归类规则一致)"""
+    name = (meta or {}).get('来源文件', (meta or {}).get('source', ''))
+    name = str(name or "").strip()
+    return name or UNKNOWN_SOURCE
+
+
+def ensure_stats_table():
+    """
+    knowledge_source_stats：每个集合、每个来源文件的片段数
+    由各写入方 (入库 / 保存 / 删除 / 审核入库) 增量维护，概览页直接读表
+    """
+    global _table_ready
+    if _table_ready: return
+    with _table_lock:
+        if _table_ready: return
+        res = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS knowledge_source_stats (
+            collection_name VARCHAR(255) NOT NULL,
+            source_name VARCHAR(255) NOT NULL,
+            doc_count INT NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (collection_name, source_name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        _table_ready = res is not None
+
+
+# ==================== 1. 增量维护 ====================
+
+def source_deltas(col, ids: Iterable[str], new_metadatas: Optional[List[Dict]] = None) -> Counter:
+    """
+    写入/删除之前调用：按这些 id 的旧元数据 (减) 和新元数据 (加) 算出各来源的增减量
+    upsert 覆盖已有 id、update 改了来源文件，都能算对
+    """
+    deltas = Counter()
+    ids = list(ids)
+    if ids:
+        old = col.get(ids=ids, include=["metadatas"])
+        for meta in old['metadatas']:
+            deltas[source_name(meta)] -= 1
+    for meta in new_metadatas or []:
+        deltas[source_name(meta)] += 1
+    return deltas
+
+
+def apply_deltas(col_name: str, deltas: Counter):
+    """写入成功之后调用：把增减量累加到统计表 (统计失败只打印，不影响业务写入)"""
+    rows = [(col_name, name, n) for name, n in deltas.items() if n]
+    if not rows: return
+    ensure_stats_table()
+
+    conn = db.get_connection()
+    if not conn: return
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO knowledge_source_stats (collection_name, source_name, doc_count)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE doc_count = doc_count + VALUES(doc_count)
+            """, rows)
+            cursor.execute("DELETE FROM knowledge_source_stats WHERE collection_name = %s AND doc_count <= 0",
+                           (col_name,))
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ [OverviewStats] 统计更新失败 ({col_name}): {e}")
+    finally:
+        conn.close()
+
+
+# ==================== 2. 全量重算 ====================
+
+def recompute(col) -> int:
+    """分页读取集合全部元数据，重建该集合的统计，返回片段总数"""
+    ensure_stats_table()
+    counter = Counter()
+    offset = 0
+    while True:
+        batch = col.get(include=["metadatas"], limit=RECOMPUTE_PAGE_SIZE, offset=offset)
+        if not batch['ids']: break
+        for meta in batch['metadatas']:
+            counter[source_name(meta)] += 1
+        if len(batch['ids']) < RECOMPUTE_PAGE_SIZE: break
+        offset += RECOMPUTE_PAGE_SIZE
+
+    conn = db.get_connection()
+    if not conn:
+        raise RuntimeError("数据库连接失败")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM knowledge_source_stats WHERE collection_name = %s", (col.name,))
+            if counter:
+                cursor.executemany(
+                    "INSERT INTO knowledge_source_stats (collection_name, source_name, doc_count) VALUES (%s, %s, %s)",
+                    [(col.name, name, n) for name, n in counter.items()]
+                )
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    total = sum(counter.values())
+    print(f"📊 [OverviewStats] 集合 [{col.name}] 统计已重算: {total} 条 / {len(counter)} 个来源")
+    return total
+
+
+# ==================== 3. 读取 ====================
+
+def load_counts() -> Dict[str, Dict[str, int]]:
+    """{集合名: {来源文件: 片段数}}"""
+    ensure_stats_table()
+    rows = db.execute_query("SELECT collection_name, source_name, doc_count FROM knowledge_source_stats") or []
+    result: Dict[str, Dict[str, int]] = {}
+    for r in rows:
+        result.setdefault(r['collection_name'], {})[r['source_name']] = r['doc_count']
+    return result
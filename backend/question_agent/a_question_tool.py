@@ -15,6 +15,7 @@ if project_root not in sys.path:
 from config import config
 from backend.tools.tools_call_ai import call_ai_emb
 from backend.tools.tools_sql_connect import db
+from backend.search.rerank_backend import get_rerank_backend, rerank_with_deadline
 
 # [新增] 导入全局上下文变量
 from backend.tools.global_context import log_queue_ctx
@@ -23,6 +24,9 @@ from backend.tools.global_context import log_queue_ctx
 DB_PATH = getattr(config, "VECTOR_DB_PATH_MEDIC", "G:/KnowledgeBase/vectorizer_medic")
 EMBEDDING_DIM = getattr(config, "EMBEDDING_DIM", 4096)
 CASE_COLLECTION_NAME = "Case_Question"
+RERANK_BACKEND = getattr(config, "QUESTION_AGENT_RERANK_BACKEND", "none")  # 知识检索重排后端: none / embedding / http / llm
+RECALL_FACTOR = getattr(config, "QUESTION_AGENT_RECALL_FACTOR", 3)         # 重排前召回 top_k 的倍数
+RERANK_TIMEOUT = getattr(config, "RERANK_TIMEOUT", 60)                     # 单次重排超时 (秒)，超时回退向量顺序
 
 
 class QuestionToolbox:
@@ -85,19 +89,25 @@ class QuestionToolbox:
         target_cols = self._get_active_knowledge_collections()
         all_results = []
 
+        # 开启重排时多召回一些，交给重排后端挑选
+        use_rerank = RERANK_BACKEND.lower() != "none"
+        recall_k = top_k * RECALL_FACTOR if use_rerank else top_k
+
         for col_name in target_cols:
             try:
                 col = self.client.get_collection(col_name)
-                res = col.query(query_embeddings=[vec], n_results=top_k,
+                res = col.query(query_embeddings=[vec], n_results=recall_k,
                                 include=["documents", "metadatas", "distances"])
                 if res['documents'] and res['documents'][0]:
                     for i in range(len(res['documents'][0])):
                         score = 1 - res['distances'][0][i]
                         item = {
+                            "id": res['ids'][0][i],
                             "score": score,
                             "content": res['documents'][0][i],
                             "metadata": res['metadatas'][0][i],
-                            "collection": col_name
+                            "collection": col_name,
+                            "source_collection": col_name
                         }
                         all_results.append(item)
             except:
@@ -106,6 +116,22 @@ class QuestionToolbox:
         all_results.sort(key=lambda x: x['score'], reverse=True)
         final_list = all_results[:top_k]
 
+        if use_rerank and len(all_results) > 1:
+            try:
+                task = {
+                    "query": query,
+                    "documents": [item['content'] for item in all_results],
+                    "target_subject": query,
+                    "candidates": all_results
+                }
+                ranked = rerank_with_deadline(get_rerank_backend(RERANK_BACKEND), [task],
+                                              top_n=top_k, timeout=RERANK_TIMEOUT)[0]
+                final_list = [dict(all_results[r['index']], score=r['score']) for r in ranked]
+            except TimeoutError:
+                print(f"⏱️ [Toolbox] 重排超时 ({RERANK_TIMEOUT}s)，使用向量顺序")
+            except Exception as e:
+                print(f"⚠️ [Toolbox] 重排失败，使用向量顺序: {e}")
+
         formatted_output = []
 
         # 🚀 [推送日志]
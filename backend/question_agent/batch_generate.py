@@ -0,0 +1,543 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import config
+from backend.tools.tools_sql_connect import db
+from backend.question_agent.z_common import QuestionPipeline, derive_question_type
+
+# ==================== 基础配置 ====================
+# 批量编题任务：一个任务 = 一组考点 × 同一套出题参数，每个考点是一条子项 (跑一次 QuestionPipeline)
+#   question_gen_jobs   任务表 (参数、状态、累计结果数)
+#   question_gen_items  子项表 (WAIT / DOING / DONE / ERROR，worker token 认领，断点续跑的依据)
+#   question_gen_review 需人工复核的题目 (审核结论 NEEDS_REVIEW)
+# PASS 的题目直接写入 pharmacist_questions；写题与子项置 DONE 在同一事务里分批提交，
+# 进程中途退出时未提交的子项仍是 DOING，续跑时重置为 WAIT 重新生成，不会重复入库也不会丢
+# 同一时间只运行一个任务 (本地 GPU)，其余排队
+
+DEFAULT_CONCURRENCY = getattr(config, "QUESTION_BATCH_CONCURRENCY", 2)
+WRITE_BATCH = getattr(config, "QUESTION_BATCH_WRITE_SIZE", 20)
+FLUSH_INTERVAL = 30      # 缓冲中的结果最多停留多少秒就写库 (秒)
+MAX_TOPICS = 10000       # 单个任务的考点数上限
+INSERT_CHUNK = 1000      # 提交任务时子项分批写入条数
+ITEM_MAX_ATTEMPTS = 3    # 单个考点在一次运行中最多生成几次 (写库失败退回后会重新认领)，续跑时清零
+CLAIM_RETRIES = 5        # 认领考点时数据库异常的连续重试次数 (指数退避，最长 60 秒)
+
+OPTION_COLUMNS = [f"option_{k}" for k in "abcdefghijkl"]
+
+INSERT_QUESTION_SQL = f"""
+    INSERT INTO pharmacist_questions (
+        question_type, case_content, stem,
+        {", ".join(OPTION_COLUMNS)},
+        answer, analysis, source, create_time
+    ) VALUES ({", ".join(["%s"] * (len(OPTION_COLUMNS) + 6))}, NOW())
+"""
+
+
+def question_row(record: Dict, default_source: str = "智能编题") -> tuple:
+    """Agent D 产出的题目记录 -> INSERT_QUESTION_SQL 的参数"""
+    return (
+        record.get('question_type', 'A型题'),
+        record.get('case_content', ''),
+        record.get('stem', ''),
+        *[record.get(col) for col in OPTION_COLUMNS],
+        record.get('answer', ''),
+        record.get('analysis', ''),
+        record.get('source') or default_source,
+    )
+
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def ensure_tables():
+    global _table_ready
+    if _table_ready: return
+    with _table_lock:
+        if _table_ready: return
+        res1 = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS question_gen_jobs (
+            job_id INT AUTO_INCREMENT PRIMARY KEY,
+            params TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            total_items INT NOT NULL DEFAULT 0,
+            pass_count INT NOT NULL DEFAULT 0,
+            review_count INT NOT NULL DEFAULT 0,
+            fail_count INT NOT NULL DEFAULT 0,
+            error_msg TEXT,
+            create_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+            start_time DATETIME DEFAULT NULL,
+            finish_time DATETIME DEFAULT NULL,
+            KEY idx_status (status, job_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        res2 = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS question_gen_items (
+            item_id INT AUTO_INCREMENT PRIMARY KEY,
+            job_id INT NOT NULL,
+            topic VARCHAR(255) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'WAIT',
+            worker VARCHAR(64) DEFAULT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            pass_count INT NOT NULL DEFAULT 0,
+            review_count INT NOT NULL DEFAULT 0,
+            fail_count INT NOT NULL DEFAULT 0,
+            error_msg VARCHAR(500) DEFAULT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_job_status (job_id, status, item_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        res3 = db.execute_update("""
+        CREATE TABLE IF NOT EXISTS question_gen_review (
+            review_id INT AUTO_INCREMENT PRIMARY KEY,
+            job_id INT NOT NULL,
+            item_id INT NOT NULL,
+            topic VARCHAR(255) NOT NULL,
+            review_comment TEXT,
+            record MEDIUMTEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'PENDING',
+            question_id INT DEFAULT NULL,
+            create_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_job_status (job_id, status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        _table_ready = res1 is not None and res2 is not None and res3 is not None
+
+
+# ==================== 1. 单个任务的执行器 ====================
+
+class _JobRunner:
+    """
+    单个任务的调度器 (与批量审题的 AIWorkerPool 同一套路)
+    - 调度线程按空闲槽位数一次认领 N 个子项 (UPDATE ... LIMIT N + worker token)
+    - 子项交给线程池并发跑 QuestionPipeline，结果进缓冲，攒够 WRITE_BATCH 道题或超过 FLUSH_INTERVAL 秒一起写库
+    - stop() 后不再认领；进行中的子项在下一个事件处停下并退回 WAIT，续跑时重新生成
+    """
+
+    def __init__(self, job: Dict, pipeline: QuestionPipeline, on_exit):
+        self.job_id = job['job_id']
+        self.params = json.loads(job['params'] or "{}")
+        self.concurrency = max(1, int(self.params.get('concurrency') or DEFAULT_CONCURRENCY))
+        self.token = f"qgen-{self.job_id}-{uuid.uuid4().hex[:8]}"
+        self._pipeline = pipeline
+        self._on_exit = on_exit
+
+        self._stop_event = threading.Event()
+        self._slots = threading.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"qgen-{self.job_id}")
+        self._thread = threading.Thread(target=self._dispatch_loop, name=f"qgen-job-{self.job_id}", daemon=True)
+
+        self._buffer: List[Dict] = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.time()
+        self._in_flight: set = set()  # 已认领、尚未写库或退回的考点
+        self._in_flight_lock = threading.Lock()
+        self.write_error: Optional[str] = None  # 写库失败过 (对应考点已退回 WAIT)
+
+    def start(self):
+        print(f"📝 [QuestionBatch] 任务 #{self.job_id} 启动，并发 {self.concurrency}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._slots.release()  # 唤醒可能在等待槽位的调度线程
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    # ---------- 认领 / 调度 ----------
+    def _claim(self, n: int) -> Optional[List[Dict]]:
+        """认领至多 n 个 WAIT 考点；没有可认领的返回 []，数据库异常返回 None"""
+        affected = db.execute_update(
+            "UPDATE question_gen_items SET status='DOING', worker=%s, attempts=attempts+1 "
+            "WHERE job_id=%s AND status='WAIT' AND attempts < %s ORDER BY item_id LIMIT %s",
+            (self.token, self.job_id, ITEM_MAX_ATTEMPTS, n)
+        )
+        if affected is None:
+            return None
+        if not affected:
+            return []
+        rows = db.execute_query(
+            "SELECT item_id, topic FROM question_gen_items "
+            "WHERE job_id=%s AND status='DOING' AND worker=%s ORDER BY item_id",
+            (self.job_id, self.token)
+        )
+        if not rows:
+            return None  # 刚认领成功却查不到：查询失败 (已认领的考点下一轮会被一起取回)
+        with self._in_flight_lock:
+            return [r for r in rows if r['item_id'] not in self._in_flight]
+
+    def _dispatch_loop(self):
+        error = None
+        failures = 0
+        try:
+            while not self._stop_event.is_set():
+                self._slots.acquire()
+                if self._stop_event.is_set():
+                    break
+                n = 1
+                while n < self.concurrency and self._slots.acquire(blocking=False):
+                    n += 1
+
+                items = self._claim(n)
+                for _ in range(n - len(items or [])):
+                    self._slots.release()
+                if items is None:
+                    failures += 1
+                    if failures > CLAIM_RETRIES:
+                        error = "认领考点失败 (数据库异常)，可续跑"
+                        break
+                    wait = min(60, 2 ** failures)
+                    print(f"⚠️ [QuestionBatch] 任务 #{self.job_id} 认领考点失败，{wait} 秒后重试")
+                    self._stop_event.wait(wait)
+                    continue
+                failures = 0
+                if not items:
+                    break
+                with self._in_flight_lock:
+                    self._in_flight.update(item['item_id'] for item in items)
+                for item in items:
+                    self._executor.submit(self._run_item, item)
+        except Exception as e:
+            error = str(e)
+            print(f"❌ [QuestionBatch] 任务 #{self.job_id} 调度异常: {e}")
+        finally:
+            self._executor.shutdown(wait=True)
+            self._flush()
+            self._on_exit(self, error)
+
+    # ---------- 单个考点 ----------
+    def _pipeline_params(self, topic: str) -> Dict:
+        p = self.params
+        return {
+            "topic": topic,
+            "type": derive_question_type(p.get('has_case', False), p.get('correct_count', 1)),
+            "correct_count": p.get('correct_count', 1),
+            "total_count": p.get('total_count', 5),
+            "has_case": p.get('has_case', False),
+            "question_count": p.get('question_count', 1),
+        }
+
+    def _run_item(self, item: Dict):
+        result = {"item_id": item['item_id'], "topic": item['topic'], "passed": [], "reviews": [], "fail": 0,
+                  "errors": []}
+        try:
+            generator = self._pipeline.generate_full_question(self._pipeline_params(item['topic']))
+            for event in generator:
+                if self._stop_event.is_set():
+                    generator.close()
+                    self._release(item['item_id'])
+                    return
+                status = event.get('completion')
+                if status == "PASS":
+                    result['passed'].append(event['data'])
+                elif status == "NEEDS_REVIEW":
+                    result['reviews'].append((event['data'], event.get('review_comment', "")))
+                elif status:
+                    result['fail'] += 1
+                elif event.get('status') == 'error':
+                    result['errors'].append(event.get('message', ''))
+        except Exception as e:
+            result['errors'].append(str(e))
+        finally:
+            self._slots.release()
+
+        # 一道题都没产出且有报错 (例如 Agent B 失败) 记为 ERROR，续跑时可选择重试
+        result['status'] = 'ERROR' if result['errors'] and not (result['passed'] or result['reviews'] or result['fail']) \
+            else 'DONE'
+        with self._buffer_lock:
+            self._buffer.append(result)
+            pending = sum(len(r['passed']) + len(r['reviews']) for r in self._buffer)
+        if pending >= WRITE_BATCH or time.time() - self._last_flush >= FLUSH_INTERVAL:
+            self._flush()
+
+    def _release(self, item_id: int, count_attempt: bool = False):
+        """退回进行中的子项：停止时 attempts 不计这次，写库失败时计入 (超过上限本次运行不再认领)"""
+        db.execute_update(
+            "UPDATE question_gen_items SET status='WAIT', worker=NULL, "
+            f"attempts={'attempts' if count_attempt else 'GREATEST(attempts-1, 0)'} "
+            "WHERE item_id=%s AND worker=%s AND status='DOING'",
+            (item_id, self.token)
+        )
+        self._settle(item_id)
+
+    def _settle(self, item_id: int):
+        """考点已写库或退回，移出 in_flight (退回的考点之后可以被重新认领)"""
+        with self._in_flight_lock:
+            self._in_flight.discard(item_id)
+
+    # ---------- 批量写库 ----------
+    def _flush(self):
+        """缓冲中的结果一次事务写入：PASS 题目、复核记录、子项状态、任务累计数"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+            if not batch: return
+
+            questions = [question_row(rec, "批量编题") for r in batch for rec in r['passed']]
+            reviews = [(self.job_id, r['item_id'], r['topic'], comment, json.dumps(rec, ensure_ascii=False))
+                       for r in batch for rec, comment in r['reviews']]
+            n_fail = sum(r['fail'] for r in batch)
+
+            conn = db.get_connection()
+            try:
+                if not conn:
+                    raise RuntimeError("数据库连接失败")
+                with conn.cursor() as cursor:
+                    if questions:
+                        cursor.executemany(INSERT_QUESTION_SQL, questions)
+                    if reviews:
+                        cursor.executemany(
+                            "INSERT INTO question_gen_review (job_id, item_id, topic, review_comment, record) "
+                            "VALUES (%s, %s, %s, %s, %s)", reviews
+                        )
+                    cursor.executemany(
+                        "UPDATE question_gen_items SET status=%s, worker=NULL, pass_count=%s, review_count=%s, "
+                        "fail_count=%s, error_msg=%s WHERE item_id=%s AND worker=%s",
+                        [(r['status'], len(r['passed']), len(r['reviews']), r['fail'],
+                          "; ".join(r['errors'])[:500] or None, r['item_id'], self.token) for r in batch]
+                    )
+                    cursor.execute(
+                        "UPDATE question_gen_jobs SET pass_count=pass_count+%s, review_count=review_count+%s, "
+                        "fail_count=fail_count+%s WHERE job_id=%s",
+                        (len(questions), len(reviews), n_fail, self.job_id)
+                    )
+                    conn.commit()
+                for r in batch:
+                    self._settle(r['item_id'])
+                print(f"💾 [QuestionBatch] 任务 #{self.job_id} 写入 {len(batch)} 个考点: "
+                      f"入库 {len(questions)} 道，待复核 {len(reviews)} 道")
+            except Exception as e:
+                if conn: conn.rollback()
+                print(f"❌ [QuestionBatch] 任务 #{self.job_id} 写库失败，{len(batch)} 个考点退回待生成: {e}")
+                self.write_error = f"写库失败，部分考点退回待生成，可续跑: {e}"
+                for r in batch:
+                    self._release(r['item_id'], count_attempt=True)
+            finally:
+                if conn: conn.close()
+
+
+# ==================== 2. 任务管理 ====================
+
+class QuestionBatchManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runner: Optional[_JobRunner] = None
+        self._pipeline: Optional[QuestionPipeline] = None
+
+    def start(self):
+        """服务启动时调用：上次退出时运行中的任务重新排队，中断的子项退回 WAIT"""
+        ensure_tables()
+        with self._lock:
+            if self._runner and self._runner.is_alive(): return
+            recovered = db.execute_update("UPDATE question_gen_jobs SET status='queued' WHERE status='running'")
+            if recovered:
+                db.execute_update(
+                    "UPDATE question_gen_items i JOIN question_gen_jobs j ON i.job_id = j.job_id "
+                    "SET i.status='WAIT', i.worker=NULL WHERE i.status='DOING' AND j.status='queued'"
+                )
+                print(f"♻️ [QuestionBatch] {recovered} 个中断的编题任务已重新排队")
+        self._start_next()
+
+    def submit(self, topics: List[str], params: Dict) -> Dict:
+        topics = list(dict.fromkeys(t.strip()[:255] for t in topics if t and t.strip()))
+        if not topics:
+            return {"status": "error", "msg": "考点列表为空"}
+        if len(topics) > MAX_TOPICS:
+            return {"status": "error", "msg": f"单个任务最多 {MAX_TOPICS} 个考点"}
+        ensure_tables()
+
+        conn = db.get_connection()
+        if not conn:
+            return {"status": "error", "msg": "数据库连接失败"}
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT INTO question_gen_jobs (params, status, total_items) VALUES (%s, 'queued', %s)",
+                               (json.dumps(params, ensure_ascii=False), len(topics)))
+                job_id = cursor.lastrowid
+                for i in range(0, len(topics), INSERT_CHUNK):
+                    cursor.executemany("INSERT INTO question_gen_items (job_id, topic) VALUES (%s, %s)",
+                                       [(job_id, t) for t in topics[i:i + INSERT_CHUNK]])
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return {"status": "error", "msg": f"任务创建失败: {str(e)}"}
+        finally:
+            conn.close()
+
+        self._start_next()
+        return {"status": "success", "job_id": job_id, "total_items": len(topics)}
+
+    def cancel(self, job_id: int) -> Dict:
+        """排队中的任务直接取消；运行中的任务停止认领，进行中的考点退回待生成 (可续跑)"""
+        affected = db.execute_update(
+            "UPDATE question_gen_jobs SET status='cancelled', finish_time=NOW() WHERE job_id=%s AND status='queued'",
+            (job_id,)
+        )
+        if affected:
+            return {"status": "success", "msg": "已取消"}
+        with self._lock:
+            runner = self._runner
+        if runner and runner.job_id == job_id and runner.is_alive():
+            runner.stop()
+            return {"status": "success", "msg": "正在停止，进行中的考点将退回待生成"}
+        return {"status": "error", "msg": "任务不存在或已结束"}
+
+    def resume(self, job_id: int, retry_errors: bool = False) -> Dict:
+        """已取消 / 已结束的任务重新排队，只跑未完成的考点；retry_errors=True 时失败的考点也重跑"""
+        job = self.get_job(job_id)
+        if not job:
+            return {"status": "error", "msg": "任务不存在"}
+        if job['status'] in ('queued', 'running'):
+            return {"status": "error", "msg": "任务已在排队或运行"}
+
+        statuses = ('WAIT', 'DOING', 'ERROR') if retry_errors else ('WAIT', 'DOING')
+        db.execute_update(
+            f"UPDATE question_gen_items SET status='WAIT', worker=NULL, attempts=0 "
+            f"WHERE job_id=%s AND status IN ({', '.join(['%s'] * len(statuses))})",
+            (job_id, *statuses)
+        )
+        db.execute_update(
+            "UPDATE question_gen_jobs SET status='queued', error_msg=NULL, finish_time=NULL WHERE job_id=%s",
+            (job_id,)
+        )
+        self._start_next()
+        return {"status": "success", "msg": "已重新排队"}
+
+    # ---------- 查询 ----------
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        ensure_tables()
+        job = db.execute_query("SELECT * FROM question_gen_jobs WHERE job_id=%s", (job_id,), fetch_one=True)
+        if not job: return None
+        rows = db.execute_query(
+            "SELECT status, COUNT(*) AS cnt FROM question_gen_items WHERE job_id=%s GROUP BY status", (job_id,)
+        ) or []
+        job['items'] = {r['status']: r['cnt'] for r in rows}
+        job['params'] = json.loads(job['params'] or "{}")
+        return job
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        ensure_tables()
+        rows = db.execute_query("SELECT * FROM question_gen_jobs ORDER BY job_id DESC LIMIT %s", (limit,)) or []
+        for r in rows:
+            r['params'] = json.loads(r['params'] or "{}")
+        return rows
+
+    def list_items(self, job_id: int, status: Optional[str] = None, page: int = 1, page_size: int = 50) -> List[Dict]:
+        ensure_tables()
+        sql = ("SELECT item_id, topic, status, attempts, pass_count, review_count, fail_count, error_msg, updated_at "
+               "FROM question_gen_items WHERE job_id=%s")
+        params = [job_id]
+        if status:
+            sql += " AND status=%s"
+            params.append(status)
+        sql += " ORDER BY item_id LIMIT %s OFFSET %s"
+        params += [page_size, (page - 1) * page_size]
+        return db.execute_query(sql, tuple(params)) or []
+
+    # ---------- 人工复核 ----------
+    def list_reviews(self, job_id: Optional[int] = None, status: str = "PENDING", page: int = 1,
+                     page_size: int = 20) -> List[Dict]:
+        ensure_tables()
+        sql = "SELECT * FROM question_gen_review WHERE status=%s"
+        params = [status]
+        if job_id:
+            sql += " AND job_id=%s"
+            params.append(job_id)
+        sql += " ORDER BY review_id LIMIT %s OFFSET %s"
+        params += [page_size, (page - 1) * page_size]
+        rows = db.execute_query(sql, tuple(params)) or []
+        for r in rows:
+            r['record'] = json.loads(r['record'] or "{}")
+        return rows
+
+    def decide_review(self, review_id: int, approve: bool, record: Optional[Dict] = None) -> Dict:
+        """复核通过：(可带人工修改后的 record) 写入题库；驳回：只标记"""
+        ensure_tables()
+        row = db.execute_query("SELECT * FROM question_gen_review WHERE review_id=%s AND status='PENDING'",
+                               (review_id,), fetch_one=True)
+        if not row:
+            return {"status": "error", "msg": "记录不存在或已处理"}
+        if not approve:
+            db.execute_update("UPDATE question_gen_review SET status='REJECTED' WHERE review_id=%s AND status='PENDING'",
+                              (review_id,))
+            return {"status": "success", "msg": "已驳回"}
+
+        record = record or json.loads(row['record'] or "{}")
+        conn = db.get_connection()
+        if not conn:
+            return {"status": "error", "msg": "数据库连接失败"}
+        try:
+            with conn.cursor() as cursor:
+                claimed = cursor.execute(
+                    "UPDATE question_gen_review SET status='APPROVED' WHERE review_id=%s AND status='PENDING'",
+                    (review_id,)
+                )
+                if not claimed:
+                    conn.rollback()
+                    return {"status": "error", "msg": "记录已被处理"}
+                cursor.execute(INSERT_QUESTION_SQL, question_row(record, "批量编题"))
+                question_id = cursor.lastrowid
+                cursor.execute("UPDATE question_gen_review SET question_id=%s WHERE review_id=%s",
+                               (question_id, review_id))
+                conn.commit()
+            return {"status": "success", "msg": "已入库", "question_id": question_id}
+        except Exception as e:
+            conn.rollback()
+            return {"status": "error", "msg": f"数据库错误: {str(e)}"}
+        finally:
+            conn.close()
+
+    # ---------- 调度 ----------
+    def _start_next(self):
+        """当前没有运行中的任务时，按提交顺序启动下一个排队任务"""
+        with self._lock:
+            if self._runner and self._runner.is_alive(): return
+            job = db.execute_query(
+                "SELECT * FROM question_gen_jobs WHERE status='queued' ORDER BY job_id LIMIT 1", fetch_one=True
+            )
+            if not job: return
+            claimed = db.execute_update(
+                "UPDATE question_gen_jobs SET status='running', start_time=COALESCE(start_time, NOW()) "
+                "WHERE job_id=%s AND status='queued'", (job['job_id'],)
+            )
+            if not claimed: return
+            if self._pipeline is None:
+                self._pipeline = QuestionPipeline()
+            self._runner = _JobRunner(job, self._pipeline, self._on_runner_exit)
+            self._runner.start()
+
+    def _on_runner_exit(self, runner: _JobRunner, error: Optional[str]):
+        if not error and not runner.stopped:
+            # 确认没有遗留的 WAIT / DOING 考点才算完成 (写库多次失败、认领异常都会留下)
+            res = db.execute_query(
+                "SELECT COUNT(*) AS cnt FROM question_gen_items WHERE job_id=%s AND status IN ('WAIT', 'DOING')",
+                (runner.job_id,), fetch_one=True
+            )
+            if not res:
+                error = "无法确认剩余考点数，可续跑"
+            elif res['cnt']:
+                error = f"仍有 {res['cnt']} 个考点未完成，可续跑" + (f" ({runner.write_error})" if runner.write_error else "")
+        status = "error" if error else ("cancelled" if runner.stopped else "done")
+        db.execute_update(
+            "UPDATE question_gen_jobs SET status=%s, error_msg=%s, finish_time=NOW() WHERE job_id=%s",
+            (status, error, runner.job_id)
+        )
+        print(f"📝 [QuestionBatch] 任务 #{runner.job_id} 结束: {status}")
+        with self._lock:
+            if self._runner is runner:
+                self._runner = None
+        # 在独立线程里启动下一个任务 (当前还在旧任务的调度线程里)
+        threading.Thread(target=self._start_next, daemon=True).start()
+
+
+question_batch = QuestionBatchManager()
@@ -3,6 +3,10 @@ import os
 import json
 import random
 import string
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Generator
 
 # === 1. 路径与环境配置 ===
@@ -21,6 +25,19 @@ except ImportError as e:
     print(f"❌ 关键模块导入失败: {e}")
     sys.exit(1)
 
+from config import config
+
+QUESTION_CHAIN_CONCURRENCY = getattr(config, "QUESTION_CHAIN_CONCURRENCY", 1)  # 多题时 C→D 链的并发数
+_CHAIN_DONE = object()  # 并行模式下单道题处理结束的标记
+
+
+def derive_question_type(has_case: bool, correct_count: int) -> str:
+    if has_case:
+        return "案例分析题"
+    if correct_count > 1:
+        return "多选题"
+    return "A型题"
+
 
 class QuestionPipeline:
     def __init__(self):
@@ -36,8 +53,8 @@ class QuestionPipeline:
         """
         主流程：
         1. Agent B 生成案例和 N 道题目核心。
-        2. 循环：对每一道题调用 Agent C (干扰项) 和 Agent D (审核)。
-        3. 逐个返回最终结果。
+        2. 对每一道题调用 Agent C (干扰项) 和 Agent D (审核)，并发数 > 1 时多题同时处理。
+        3. 逐个返回最终结果 (带题号 index，并行时按完成先后)。
         """
 
         # [0] 初始化参数
@@ -95,114 +112,171 @@ class QuestionPipeline:
             return
 
         # =================================================================
-        # [循环处理] 对每一道题分别进行：干扰项生成 -> 最终审核
+        # [逐题处理] 对每一道题分别进行：干扰项生成 -> 最终审核
+        # 各题在 Agent B 之后互相独立：并发数 > 1 时 C→D 链放进线程池同时跑，谁先完成先返回
         # =================================================================
 
         total_q = len(questions_list)
+        ctx = {
+            "topic": topic,
+            "q_type": q_type,
+            "distractor_count": distractor_count,
+            "case_content": case_content_global,  # 公共案例
+        }
+        concurrency = params.get('concurrency') or QUESTION_CHAIN_CONCURRENCY
+
+        if concurrency <= 1 or total_q <= 1:
+            for idx, q_core in enumerate(questions_list, 1):
+                for event in self._question_chain(idx, total_q, q_core, ctx):
+                    yield {**event, "index": idx}
+        else:
+            yield {"stage": "Distraction", "stream": f"\n⚡ {total_q} 道题并行处理 (并发 {min(concurrency, total_q)})\n"}
+            yield from self._run_chains_parallel(questions_list, ctx, concurrency)
 
-        for idx, q_core in enumerate(questions_list, 1):
-            prefix = f"[第 {idx}/{total_q} 题]"
+        # 所有题目循环结束
+        yield {"stage": "Done", "status": "final", "message": "🎉 所有题目处理完毕"}
 
-            # --- [2] Agent C: 生成干扰项 (针对当前这一题) ---
-            distraction_input = {
-                "topic": topic,
-                "stem": q_core.get('stem', ''),
-                "correct_options": q_core.get('correct_options', []),
-                "distractor_count": distractor_count,
-                "analysis_overall": q_core.get('knowledge_ref', '')
-            }
+    def _question_chain(self, idx: int, total_q: int, q_core: Dict, ctx: Dict) -> Generator[Dict[str, Any], None, None]:
+        """单道题的 C→D 链：生成干扰项 -> 终审与格式化 -> 输出单题结果"""
+        prefix = f"[第 {idx}/{total_q} 题]"
 
-            yield {"stage": "Distraction", "status": "running", "message": f"➡️ {prefix} 正在生成干扰项..."}
+        # --- [2] Agent C: 生成干扰项 (针对当前这一题) ---
+        distraction_input = {
+            "topic": ctx['topic'],
+            "stem": q_core.get('stem', ''),
+            "correct_options": q_core.get('correct_options', []),
+            "distractor_count": ctx['distractor_count'],
+            "analysis_overall": q_core.get('knowledge_ref', '')
+        }
 
-            distractor_data = {}
-            try:
-                generator = self.distraction_agent.generate_stream(distraction_input)
-                c_output_json_str = None
-
-                for chunk in generator:
-                    if isinstance(chunk, dict):
-                        if chunk.get("type") == "final_json_string":
-                            c_output_json_str = chunk["content"]
-                        elif chunk.get("type") == "process":
-                            # 给日志加前缀，区分是哪道题
-                            yield {"stage": "Distraction", "stream": f"{prefix} {chunk['content']}"}
-                    elif isinstance(chunk, str):
-                        yield {"stage": "Distraction", "stream": f"{prefix} {chunk}"}
-
-                if c_output_json_str:
-                    clean_json = c_output_json_str.replace("```json", "").replace("```", "").strip()
-                    distractor_data = json.loads(clean_json)
-                else:
-                    yield {"stage": "Distraction", "stream": f"\n⚠️ {prefix} Agent C 未返回有效 JSON，使用空干扰项。\n"}
+        yield {"stage": "Distraction", "status": "running", "message": f"➡️ {prefix} 正在生成干扰项..."}
 
-            except Exception as e:
-                yield {"stage": "Distraction", "status": "error", "message": f"❌ {prefix} 干扰项生成失败: {str(e)}"}
-                continue  # 跳过这道题，继续下一道
-
-            # 提取干扰项列表
-            final_distractors = []
-            raw_dist_list = distractor_data.get('distractors', [])
-            for item in raw_dist_list:
-                if isinstance(item, dict):
-                    final_distractors.append(item.get('content', ''))
-                elif isinstance(item, str):
-                    final_distractors.append(item)
-                else:
-                    final_distractors.append(str(item))
+        distractor_data = {}
+        try:
+            generator = self.distraction_agent.generate_stream(distraction_input)
+            c_output_json_str = None
 
-            final_analysis = distractor_data.get('analysis_overall', '')
+            for chunk in generator:
+                if isinstance(chunk, dict):
+                    if chunk.get("type") == "final_json_string":
+                        c_output_json_str = chunk["content"]
+                    elif chunk.get("type") == "process":
+                        # 给日志加前缀，区分是哪道题
+                        yield {"stage": "Distraction", "stream": f"{prefix} {chunk['content']}"}
+                elif isinstance(chunk, str):
+                    yield {"stage": "Distraction", "stream": f"{prefix} {chunk}"}
 
-            # --- [3] Agent D: 终审与格式化 (针对当前这一题) ---
-            final_audit_data = {
-                "topic": topic,
-                "question_type": q_type,
-                "case_content": case_content_global,  # 使用公共案例
-                "stem": q_core.get('stem', ''),
-                "correct_options": q_core.get('correct_options', []),
-                "distractors": final_distractors,
-                "knowledge_ref": q_core.get('knowledge_ref', ''),
-                "analysis_overall": final_analysis
-            }
+            if c_output_json_str:
+                clean_json = c_output_json_str.replace("```json", "").replace("```", "").strip()
+                distractor_data = json.loads(clean_json)
+            else:
+                yield {"stage": "Distraction", "stream": f"\n⚠️ {prefix} Agent C 未返回有效 JSON，使用空干扰项。\n"}
 
-            yield {"stage": "Finalization", "status": "running", "message": f"➡️ {prefix} 最终审核..."}
+        except Exception as e:
+            yield {"stage": "Distraction", "status": "error", "message": f"❌ {prefix} 干扰项生成失败: {str(e)}"}
+            return  # 跳过这道题
+
+        # 提取干扰项列表
+        final_distractors = []
+        raw_dist_list = distractor_data.get('distractors', [])
+        for item in raw_dist_list:
+            if isinstance(item, dict):
+                final_distractors.append(item.get('content', ''))
+            elif isinstance(item, str):
+                final_distractors.append(item)
+            else:
+                final_distractors.append(str(item))
 
-            final_db_record = None
-            final_status = "FAIL"
+        final_analysis = distractor_data.get('analysis_overall', '')
 
-            try:
-                generator = self.final_agent.process_question(final_audit_data)
-
-                for chunk in generator:
-                    if isinstance(chunk, dict):
-                        if chunk.get('final_data'):
-                            final_db_record = chunk.get('final_data')
-                            final_status = chunk.get('audit_status')
-                            break
-
-                            # 打印思考
-                        log = chunk.get('log') or chunk.get('thought')
-                        if log:
-                            yield {"stage": "Finalization", "stream": f"{prefix} {log}"}
-                        elif chunk.get('error'):
-                            yield {"stage": "Finalization", "stream": f"❌ {prefix} Agent D 报错: {chunk['error']}"}
+        # --- [3] Agent D: 终审与格式化 (针对当前这一题) ---
+        final_audit_data = {
+            "topic": ctx['topic'],
+            "question_type": ctx['q_type'],
+            "case_content": ctx['case_content'],  # 使用公共案例
+            "stem": q_core.get('stem', ''),
+            "correct_options": q_core.get('correct_options', []),
+            "distractors": final_distractors,
+            "knowledge_ref": q_core.get('knowledge_ref', ''),
+            "analysis_overall": final_analysis
+        }
 
-            except Exception as e:
-                yield {"stage": "Finalization", "status": "error", "message": f"❌ {prefix} 终审失败: {str(e)}"}
-                continue
+        yield {"stage": "Finalization", "status": "running", "message": f"➡️ {prefix} 最终审核..."}
 
-            # --- [4] 输出单题结果 ---
-            if final_db_record:
-                # 补全案例 (双重保险)
-                if case_content_global:
-                    final_db_record['case_content'] = case_content_global
+        final_db_record = None
+        final_status = "FAIL"
+        review_comment = ""
 
-                msg = f"✅ {prefix} 生成成功" if final_status == "PASS" else f"⚠️ {prefix} 需人工复核"
-                yield {"completion": final_status, "message": msg, "data": final_db_record}
-            else:
-                yield {"stage": "Finalization", "status": "error", "message": f"❌ {prefix} 未能获取最终数据"}
+        try:
+            generator = self.final_agent.process_question(final_audit_data)
 
-        # 所有题目循环结束
-        yield {"stage": "Done", "status": "final", "message": "🎉 所有题目处理完毕"}
+            for chunk in generator:
+                if isinstance(chunk, dict):
+                    if chunk.get('final_data'):
+                        final_db_record = chunk.get('final_data')
+                        final_status = chunk.get('audit_status')
+                        review_comment = chunk.get('review_comment') or ""
+                        break
+
+                        # 打印思考
+                    log = chunk.get('log') or chunk.get('thought')
+                    if log:
+                        yield {"stage": "Finalization", "stream": f"{prefix} {log}"}
+                    elif chunk.get('error'):
+                        yield {"stage": "Finalization", "stream": f"❌ {prefix} Agent D 报错: {chunk['error']}"}
+
+        except Exception as e:
+            yield {"stage": "Finalization", "status": "error", "message": f"❌ {prefix} 终审失败: {str(e)}"}
+            return
+
+        # --- [4] 输出单题结果 ---
+        if final_db_record:
+            # 补全案例 (双重保险)
+            if ctx['case_content']:
+                final_db_record['case_content'] = ctx['case_content']
+
+            msg = f"✅ {prefix} 生成成功" if final_status == "PASS" else f"⚠️ {prefix} 需人工复核"
+            yield {"completion": final_status, "message": msg, "data": final_db_record,
+                   "review_comment": review_comment}
+        else:
+            yield {"stage": "Finalization", "status": "error", "message": f"❌ {prefix} 未能获取最终数据"}
+
+    def _run_chains_parallel(self, questions_list: List[Dict], ctx: Dict, concurrency: int) -> Generator[Dict[str, Any], None, None]:
+        """
+        C→D 链放进有界线程池并发执行，事件按产生顺序汇总返回，均带题号 index
+        每个任务复制当前上下文 (log_queue_ctx)，检索片段仍推到同一个前端流；调用方关闭生成器时通知各链停止
+        """
+        total_q = len(questions_list)
+        events = queue.Queue()
+        cancelled = threading.Event()
+
+        def run_chain(idx: int, q_core: Dict):
+            chain = self._question_chain(idx, total_q, q_core, ctx)
+            try:
+                for event in chain:
+                    if cancelled.is_set(): break
+                    events.put({**event, "index": idx})
+            except Exception as e:
+                events.put({"stage": "Finalization", "status": "error", "index": idx,
+                            "message": f"❌ [第 {idx}/{total_q} 题] 处理异常: {str(e)}"})
+            finally:
+                chain.close()
+                events.put(_CHAIN_DONE)
+
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, total_q), thread_name_prefix="question-chain")
+        try:
+            for idx, q_core in enumerate(questions_list, 1):
+                pool.submit(contextvars.copy_context().run, run_chain, idx, q_core)
+            remaining = total_q
+            while remaining:
+                event = events.get()
+                if event is _CHAIN_DONE:
+                    remaining -= 1
+                    continue
+                yield event
+        finally:
+            cancelled.set()
+            pool.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == "__main__":
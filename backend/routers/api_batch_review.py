@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
 
@@ -42,10 +43,39 @@ def api_stop_batch(req: StopBatchRequest):
     return batch_review.stop_batch()
 
 
+LONG_POLL_MAX_TIMEOUT = 60
+
+
 @router.get("/api/batch/progress")
-def api_get_progress(page: int = 1, page_size: int = 20):
+def api_get_progress(request: Request, response: Response, page: int = 1, page_size: int = 20):
     """
     轮询接口。
-    前端JS每秒调一次，直接用返回的 rows 渲染表格，用 stats 渲染顶部统计。
+    直接用返回的 rows 渲染表格，用 stats 渲染顶部统计。
+    支持 ETag：请求头带 If-None-Match 且进度没有变化时返回 304，不查库。
     """
-    return batch_review.get_current_progress(page, page_size)
\ No newline at end of file
+    etag = f'W/"{batch_review.progress_tracker.snapshot()["version"]}-{page}-{page_size}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return batch_review.get_current_progress(page, page_size)
+
+
+@router.get("/api/batch/progress/wait")
+async def api_wait_progress(since: str = "", timeout: float = 25, page: int = 1, page_size: int = 20):
+    """
+    长轮询接口。
+    since 传上次拿到的 version，进度有变化立即返回完整数据；
+    超时仍无变化返回 {"status": "unchanged"}，前端直接发起下一轮即可。
+    等待在事件循环里进行 (不占线程池)，只有查库取列表时才进线程池。
+    """
+    timeout = max(0.0, min(timeout, LONG_POLL_MAX_TIMEOUT))
+    if not await batch_review.wait_progress_change_async(since, timeout):
+        return {"status": "unchanged", "version": since}
+    return await run_in_threadpool(batch_review.get_current_progress, page, page_size)
+
+
+@router.get("/api/batch/rate_limits")
+def api_get_rate_limits():
+    """远程服务商限流状态：额度随时间回填，不走进度的 ETag / 长轮询，需要时单独轮询"""
+    return batch_review.get_rate_limits()
\ No newline at end of file
@@ -1,5 +1,3 @@
-import queue
-import threading
 import json
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
@@ -16,7 +14,9 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from backend.tools.tools_sql_connect import db
-from backend.tools.global_context import log_queue_ctx
+from backend.tools.tools_call_ai import emb_cache
+from backend.tools.tools_pagination import encode_cursor, decode_cursor
+from backend.tools.tools_log_bus import AsyncLogQueue, start_worker
 from backend.books.tools_import_step1_split import execute_split_task
 from backend.books.tools_import_step2_process import execute_process_task
 from backend.books.tools_import_step3_embed import execute_embed_task
@@ -42,6 +42,7 @@ class BookListRequest(BaseModel):
     page: int = 1
     page_size: int = 100
     status: Optional[str] = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传了就按游标翻页 (忽略 page)
 
 
 # ==================== E. 智能录入接口 ====================
@@ -65,18 +66,29 @@ def api_data_book_list(req: BookListRequest):
     try:
         offset = (req.page - 1) * req.page_size
 
-        # 1. 查询数据
+        # 1. 查询数据 (游标翻页按 book_id 定位，不再 OFFSET)
         sql = "SELECT book_id, book_name, status, total_segments, processed_segments, create_time FROM import_books"
-        params = []
+        conditions, params = [], []
 
         if req.status:
-            sql += " WHERE status = %s"
+            conditions.append("status = %s")
             params.append(req.status)
 
+        cursor = decode_cursor(req.cursor)
+        if cursor and 'id' in cursor:
+            conditions.append("book_id < %s")
+            params.append(cursor['id'])
+            offset = 0
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
         sql += " ORDER BY book_id DESC LIMIT %s OFFSET %s"
-        params.extend([req.page_size, offset])
+        params.extend([req.page_size + 1, offset])
 
-        books = db.execute_query(sql, tuple(params))
+        books = db.execute_query(sql, tuple(params)) or []
+        has_more = len(books) > req.page_size
+        books = books[:req.page_size]
+        next_cursor = encode_cursor({"id": books[-1]['book_id']}) if has_more else None
 
         # 处理时间格式
         for b in books:
@@ -93,7 +105,7 @@ def api_data_book_list(req: BookListRequest):
 
         total = total_res['total'] if total_res else 0
 
-        return {"status": "success", "data": books, "total": total}
+        return {"status": "success", "data": books, "total": total, "has_more": has_more, "next_cursor": next_cursor}
 
     except Exception as e:
         print(f"❌ 获取书本列表失败: {e}")
@@ -121,11 +133,10 @@ def api_import_book_delete(req: BookTaskRequest):
 
 @router.post("/api/import/task/run")
 def api_run_import_task(req: BookTaskRequest, step: str):
-    q = queue.Queue()
+    async def event_stream():
+        log = AsyncLogQueue()
 
-    def event_stream():
         def run_task():
-            token = log_queue_ctx.set(q)
             try:
                 if step == 'split':
                     execute_split_task(req.book_id)
@@ -133,21 +144,25 @@ def api_run_import_task(req: BookTaskRequest, step: str):
                     execute_process_task(req.book_id)
                 elif step == 'embed':
                     execute_embed_task(req.book_id)
-                q.put(f"DATA: {json.dumps({'status': 'success'}, ensure_ascii=False)}")
+                log.put(f"DATA: {json.dumps({'status': 'success'}, ensure_ascii=False)}")
             except Exception as e:
-                q.put(f"DATA: {json.dumps({'status': 'error', 'msg': str(e)}, ensure_ascii=False)}")
-            finally:
-                q.put("[DONE]")
-                try:
-                    log_queue_ctx.reset(token)
-                except:
-                    pass
-
-        t = threading.Thread(target=run_task)
-        t.start()
-        while True:
-            msg = q.get()
-            if msg == "[DONE]": break
+                log.put(f"DATA: {json.dumps({'status': 'error', 'msg': str(e)}, ensure_ascii=False)}")
+
+        start_worker(run_task, log)
+        async for msg in log.iter():
             yield msg + "\n"
 
-    return StreamingResponse(event_stream(), media_type="text/plain")
\ No newline at end of file
+    return StreamingResponse(event_stream(), media_type="text/plain")
+
+# ==================== F. 系统监控接口 ====================
+
+@router.get("/api/system/db_pool")
+def api_db_pool_stats():
+    """数据库连接池监控：连接数、借出次数、等待耗时"""
+    return {"status": "success", "data": db.get_pool_stats()}
+
+
+@router.get("/api/system/emb_cache")
+def api_emb_cache_stats():
+    """查询向量缓存：命中/未命中次数、命中率、当前条数"""
+    return {"status": "success", "data": emb_cache.stats()}
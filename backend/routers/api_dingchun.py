@@ -1,5 +1,3 @@
-import queue
-import threading
 import json
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
@@ -17,7 +15,7 @@ if project_root not in sys.path:
 # === 业务模块导入 ===
 from backend.dingchun.dingchun import dingchun
 from backend.dingchun.call_other_ai import other_ai
-from backend.tools.global_context import log_queue_ctx
+from backend.tools.tools_log_bus import AsyncLogQueue, start_worker
 
 router = APIRouter()
 
@@ -37,28 +35,19 @@ def trigger_review(req: ToolInvokeRequest):
 
     # 1. 定春 (流式)
     if req.ai_type == "dingchun":
-        q = queue.Queue()
+        async def event_stream():
+            # 审题在工作线程里跑，推流只占一个协程 (不再阻塞线程池等 queue.get)
+            log = AsyncLogQueue()
 
-        def event_stream():
             def run_task():
-                token = log_queue_ctx.set(q)
                 try:
                     result = dingchun.review_and_save(q_id, model_type=DINGCHUN_MODE)
-                    q.put(f"DATA: {json.dumps(result, ensure_ascii=False)}")
+                    log.put(f"DATA: {json.dumps(result, ensure_ascii=False)}")
                 except Exception as e:
-                    q.put(f"DATA: {json.dumps({'status': 'error', 'msg': str(e)}, ensure_ascii=False)}")
-                finally:
-                    q.put("[DONE]")
-                    try:
-                        log_queue_ctx.reset(token)
-                    except:
-                        pass
+                    log.put(f"DATA: {json.dumps({'status': 'error', 'msg': str(e)}, ensure_ascii=False)}")
 
-            t = threading.Thread(target=run_task)
-            t.start()
-            while True:
-                msg = q.get()
-                if msg == "[DONE]": break
+            start_worker(run_task, log, name=f"review-{q_id}")
+            async for msg in log.iter():
                 yield msg + "\n"
 
         return StreamingResponse(event_stream(), media_type="text/plain")
@@ -1,10 +1,9 @@
-import queue
-import threading
 import json
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 # === 路径修复 ===
 import sys
@@ -15,10 +14,8 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from backend.tools.tools_sql_connect import db
-from backend.tools.global_context import log_queue_ctx
-from backend.books.tools_import_step1_split import execute_split_task
-from backend.books.tools_import_step2_process import execute_process_task
-from backend.books.tools_import_step3_embed import execute_embed_task
+from backend.books.tools_import_step2_process import write_meter
+from backend.books.import_scheduler import import_scheduler
 
 router = APIRouter()
 
@@ -83,27 +80,93 @@ def api_import_book_delete(req: BookTaskRequest):
         return {"status": "error", "msg": str(e)}
 
 # 4. 执行任务流 (切分、处理、入库)
+# 单步任务也交给导入调度器排队 (同一本书互斥、GPU/CPU 限并发)，这里只负责把任务日志转成文本流
 @router.post("/api/import/task/run")
 def api_run_import_task(req: BookTaskRequest, step: str):
-    q = queue.Queue()
-    def event_stream():
-        def run_task():
-            token = log_queue_ctx.set(q)
-            try:
-                if step == 'split': execute_split_task(req.book_id)
-                elif step == 'process': execute_process_task(req.book_id)
-                elif step == 'embed': execute_embed_task(req.book_id)
-                q.put(f"DATA: {json.dumps({'status': 'success'}, ensure_ascii=False)}")
-            except Exception as e:
-                q.put(f"DATA: {json.dumps({'status': 'error', 'msg': str(e)}, ensure_ascii=False)}")
-            finally:
-                q.put("[DONE]")
-                try: log_queue_ctx.reset(token)
-                except: pass
-        t = threading.Thread(target=run_task)
-        t.start()
-        while True:
-            msg = q.get()
-            if msg == "[DONE]": break
-            yield msg + "\n"
-    return StreamingResponse(event_stream(), media_type="text/plain")
\ No newline at end of file
+    return _submit_and_stream(req.book_id, [step])
+
+# 5. 断点续跑 (AI 处理)
+@router.post("/api/import/task/resume")
+def api_resume_process_task(req: BookTaskRequest):
+    """从上次停下的位置继续 AI 处理：跳过已处理分段、恢复阅读状态，最后重试失败窗口"""
+    return _submit_and_stream(req.book_id, ["resume"])
+
+def _submit_and_stream(book_id: int, steps: List[str]):
+    res = import_scheduler.submit(book_id, steps)
+    async def event_stream():
+        if res['status'] != 'success':
+            yield f"DATA: {json.dumps(res, ensure_ascii=False)}\n"
+            return
+        yield f"JOB: {res['job_id']}\n"
+        async for _, line in _follow_job_log(res['job_id'], 0):
+            yield (line or "") + "\n"  # 心跳为空行，前端会跳过
+    return StreamingResponse(event_stream(), media_type="text/plain")
+
+async def _follow_job_log(job_id: int, offset: int):
+    """
+    逐行产出任务日志 (行号, 内容)，任务结束后停止；空闲时产出 (None, None) 作为心跳
+    订阅在事件循环里等待新行，推流期间不占用线程池
+    """
+    log = await run_in_threadpool(import_scheduler.get_log, job_id)  # 内存里没有缓冲时要查库
+    if log is None:
+        # 进程重启前已结束的任务：内存里没有日志，只返回最终状态
+        job = await run_in_threadpool(import_scheduler.get_job, job_id) or {}
+        payload = {"status": job.get('status', 'error'), "job_id": job_id}
+        if job.get('error_msg'): payload["msg"] = job['error_msg']
+        elif not job: payload["msg"] = "任务不存在"
+        yield offset, f"DATA: {json.dumps(payload, ensure_ascii=False)}"
+        return
+    async for line_no, line in log.follow_async(offset):
+        yield line_no, line
+
+# 6. 片段写入吞吐 (本进程内按书本累计)
+@router.get("/api/import/process/metrics")
+def api_process_write_metrics(book_id: Optional[int] = None):
+    return {"status": "success", "data": write_meter.snapshot(book_id)}
+
+# ==================== 导入任务 (调度器) ====================
+class ImportJobRequest(BaseModel):
+    book_id: int
+    steps: Optional[List[str]] = None  # 默认 split -> process -> embed
+
+# 7. 提交导入任务 (整条流水线或指定步骤)
+@router.post("/api/import/jobs/submit")
+def api_submit_import_job(req: ImportJobRequest):
+    return import_scheduler.submit(req.book_id, req.steps)
+
+# 8. 任务列表 / 详情
+@router.get("/api/import/jobs")
+def api_list_import_jobs(book_id: Optional[int] = None, limit: int = 50):
+    return {"status": "success", "data": import_scheduler.list_jobs(book_id, min(limit, 200))}
+
+@router.get("/api/import/jobs/{job_id}")
+def api_get_import_job(job_id: int):
+    job = import_scheduler.get_job(job_id)
+    if not job: return {"status": "error", "msg": "任务不存在"}
+    return {"status": "success", "data": job}
+
+# 9. 取消任务
+@router.post("/api/import/jobs/{job_id}/cancel")
+def api_cancel_import_job(job_id: int):
+    return import_scheduler.cancel(job_id)
+
+# 10. 任务日志 (SSE，可随时重连)
+@router.get("/api/import/jobs/{job_id}/stream")
+def api_stream_import_job(job_id: int, request: Request, offset: int = 0):
+    """
+    每条日志作为一个 SSE 事件，id 为行号；浏览器刷新后带 offset (或 EventSource 自动带 Last-Event-ID) 重连即可续读
+    data 内容与任务流接口一致 ("LOG: ..." / "DATA: {...}")，DATA 为最后一条
+    """
+    last_id = request.headers.get("last-event-id")
+    if last_id and last_id.isdigit():
+        offset = int(last_id) + 1
+
+    async def event_stream():
+        yield "retry: 3000\n\n"
+        async for line_no, line in _follow_job_log(job_id, offset):
+            if line is None:
+                yield ": ping\n\n"
+                continue
+            yield f"id: {line_no}\ndata: {line}\n\n"
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,11 +1,11 @@
 import sys
 import os
 import json
-import queue
+import threading
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, Generator, Literal
+from typing import Optional, List, Dict, Any, AsyncGenerator, Generator, Literal
 
 # === 路径修复 ===
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,15 +15,17 @@ if project_root not in sys.path:
 
 # 导入 QuestionPipeline 和 工具
 try:
-    from backend.question_agent.z_common import QuestionPipeline
+    from backend.question_agent.z_common import QuestionPipeline, derive_question_type
+    from backend.question_agent.batch_generate import INSERT_QUESTION_SQL, question_row
     from backend.tools.tools_sql_connect import db
-    from backend.tools.global_context import log_queue_ctx
+    from backend.tools.tools_log_bus import AsyncLogQueue, merge, start_worker
 except ImportError as e:
     print(f"FATAL: Agent core or DB tools not found: {e}")
     sys.exit(1)
 
 router = APIRouter()
 pipeline = QuestionPipeline()
+STREAM_HEARTBEAT = 15  # Agent 长时间无输出时的 SSE 心跳间隔 (秒)
 
 
 # === 1. 请求模型定义 ===
@@ -35,80 +37,85 @@ class QuestionParams(BaseModel):
     question_count: int = Field(default=1, description="生成的题目数量")
 
 
-def derive_question_type(has_case: bool, correct_count: int) -> str:
-    if has_case:
-        return "案例分析题"
-    if correct_count > 1:
-        return "多选题"
-    return "A型题"
-
-
-def mixed_stream_generator(pipeline_generator: Generator[Dict, None, None], log_queue: queue.Queue) -> Generator[
-    str, None, None]:
+async def mixed_stream_generator(pipeline_generator: Generator[Dict, None, None]) -> AsyncGenerator[str, None]:
     """
     混合流生成器：负责格式标准化
+    Agent 流水线在工作线程里跑 (log_queue_ctx 指向 tool_log)，主流程事件与工具片段都经异步通道送回，
+    两路同时等待：检索片段一产生就推给前端，不必等 Agent 下一次 yield；长时间无输出时发心跳注释
     """
+    events = AsyncLogQueue()    # Agent 主流程事件
+    tool_log = AsyncLogQueue()  # 工具层推送的检索片段
+    stopped = threading.Event()  # 客户端断开后通知工作线程停止
 
-    def yield_queue_logs():
-        """优先推送工具产生的片段"""
-        while not log_queue.empty():
-            try:
-                log = log_queue.get_nowait()
-                # 工具层已经封装好了 {"type": "snippet", "content": ...}
-                yield f"data: {json.dumps(log, ensure_ascii=False)}\n\n"
-            except queue.Empty:
-                break
-
-    for item in pipeline_generator:
-        # 1. 先把积压的工具日志吐出来
-        yield from yield_queue_logs()
-
-        # 2. 格式化 Agent 主流程数据 (关键修复)
-        # z_common 返回的可能是 {"stage": "...", "stream": "..."}
-        # 前端 JS 需要 {"type": "process", "content": "..."}
-
-        payload = {}
-
-        # 复制原始字段
-        for k, v in item.items():
-            payload[k] = v
-
-        # [核心修复逻辑] 字段映射
-        if "type" not in payload:
-            # 如果没有 type，默认为 process (日志)
-            if "stream" in payload or "stage" in payload:
-                payload["type"] = "process"
-
-        # 将 stream 映射为 content (前端只读 content)
-        if "content" not in payload and "stream" in payload:
-            payload["content"] = payload["stream"]
-
-        # 过滤掉不需要发给前端的 type (防止重复)
-        if payload.get("type") == "snippet":
-            continue
-
+    def run_pipeline():
         try:
-            # 序列化时处理无法 JSON 化的对象
-            safe_payload = {
-                k: str(v) if not isinstance(v, (str, int, float, bool, dict, list, type(None))) else v
-                for k, v in payload.items()
-            }
-            json_data = json.dumps(safe_payload, ensure_ascii=False)
-            yield f"data: {json_data}\n\n"
+            for item in pipeline_generator:
+                if stopped.is_set():
+                    pipeline_generator.close()
+                    break
+                events.put(item)
         except Exception as e:
-            err = {"type": "error", "content": f"JSON序列化失败: {str(e)}"}
-            yield f"data: {json.dumps(err, ensure_ascii=False)}\n\n"
+            events.put({"type": "error", "content": f"流水线异常: {str(e)}"})
+        finally:
+            events.close()
 
-        # 结束标志
-        if item.get("completion"):
-            yield from yield_queue_logs()  # 再次检查遗漏日志
-            # 注意：不立即 break，允许 z_common 继续 yield 下一道题的 completion
-            # 只有当 z_common 明确 yield {"stage": "Done"} 时才算真正结束
-            pass
+    start_worker(run_pipeline, tool_log, name="question-pipeline")
+    try:
+        # tool_log 排在前面：同时就绪时先推片段
+        async for source, item in merge(tool_log, events, heartbeat=STREAM_HEARTBEAT):
+            # 1. 心跳 (SSE 注释行，前端解析时忽略)
+            if source is None:
+                yield ": ping\n\n"
+                continue
+
+            # 工具层已经封装好了 {"type": "snippet", "content": ...}
+            if source == 0:
+                yield f"data: {json.dumps(item, ensure_ascii=False)}\n\n"
+                continue
+
+            # 2. 格式化 Agent 主流程数据 (关键修复)
+            # z_common 返回的可能是 {"stage": "...", "stream": "..."}
+            # 前端 JS 需要 {"type": "process", "content": "..."}
+
+            payload = {}
+
+            # 复制原始字段
+            for k, v in item.items():
+                payload[k] = v
+
+            # [核心修复逻辑] 字段映射
+            if "type" not in payload:
+                # 如果没有 type，默认为 process (日志)
+                if "stream" in payload or "stage" in payload:
+                    payload["type"] = "process"
+
+            # 将 stream 映射为 content (前端只读 content)
+            if "content" not in payload and "stream" in payload:
+                payload["content"] = payload["stream"]
+
+            # 过滤掉不需要发给前端的 type (防止重复)
+            if payload.get("type") == "snippet":
+                continue
 
-    # 循环彻底结束
-    yield from yield_queue_logs()
-    yield "data: [DONE]\n\n"
+            try:
+                # 序列化时处理无法 JSON 化的对象
+                safe_payload = {
+                    k: str(v) if not isinstance(v, (str, int, float, bool, dict, list, type(None))) else v
+                    for k, v in payload.items()
+                }
+                json_data = json.dumps(safe_payload, ensure_ascii=False)
+                yield f"data: {json_data}\n\n"
+            except Exception as e:
+                err = {"type": "error", "content": f"JSON序列化失败: {str(e)}"}
+                yield f"data: {json.dumps(err, ensure_ascii=False)}\n\n"
+
+            # 注意：completion 之后不 break，允许 z_common 继续 yield 下一道题的 completion
+            # 两路通道都关闭 (流水线结束) 才算真正结束
+
+        # 循环彻底结束
+        yield "data: [DONE]\n\n"
+    finally:
+        stopped.set()
 
 
 @router.post("/api/generate/question")
@@ -125,13 +132,10 @@ async def generate_exam_question(params: QuestionParams):
             "question_count": params.question_count
         }
 
-        q = queue.Queue()
-        token = log_queue_ctx.set(q)
-
         generator = pipeline.generate_full_question(pipeline_params)
 
         return StreamingResponse(
-            mixed_stream_generator(generator, q),
+            mixed_stream_generator(generator),
             media_type="text/event-stream"
         )
 
@@ -145,28 +149,8 @@ async def generate_exam_question(params: QuestionParams):
 # ... (save_final_question 保持不变) ...
 @router.post("/api/question/save_to_db")
 def save_final_question(db_record: Dict[str, Any]):
-    sql = """
-    INSERT INTO pharmacist_questions (
-        question_type, case_content, stem, 
-        option_a, option_b, option_c, option_d, option_e, option_f, 
-        option_g, option_h, option_i, option_j, option_k, option_l,
-        answer, analysis, source, create_time
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-    """
     try:
-        params = (
-            db_record.get('question_type', 'A型题'),
-            db_record.get('case_content', ''),
-            db_record.get('stem', ''),
-            db_record.get('option_a'), db_record.get('option_b'), db_record.get('option_c'),
-            db_record.get('option_d'), db_record.get('option_e'), db_record.get('option_f'),
-            db_record.get('option_g'), db_record.get('option_h'), db_record.get('option_i'),
-            db_record.get('option_j'), db_record.get('option_k'), db_record.get('option_l'),
-            db_record.get('answer', ''),
-            db_record.get('analysis', ''),
-            db_record.get('source', '智能编题')
-        )
-        db.execute_update(sql, params)
+        db.execute_update(INSERT_QUESTION_SQL, question_row(db_record))
         return {"status": "success", "message": "入库成功"}
     except Exception as e:
         return {"status": "error", "message": f"数据库错误: {str(e)}"}
\ No newline at end of file
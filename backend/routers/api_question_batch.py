@@ -0,0 +1,86 @@
+from fastapi import APIRouter
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+
+from backend.question_agent.batch_generate import question_batch
+
+router = APIRouter()
+
+
+# --- 请求模型 ---
+class BatchGenerateRequest(BaseModel):
+    topics: List[str] = Field(..., description="考点列表，每个考点生成一组题目")
+    has_case: bool = Field(default=False, description="是否生成案例")
+    correct_count: int = Field(default=1, description="正确选项数")
+    total_count: int = Field(default=5, description="总选项数")
+    question_count: int = Field(default=1, description="每个考点生成的题目数量")
+    concurrency: Optional[int] = Field(default=None, description="同时处理的考点数，默认取配置")
+
+
+class ResumeRequest(BaseModel):
+    retry_errors: bool = False  # 生成失败的考点是否也重跑
+
+
+class ReviewDecision(BaseModel):
+    approve: bool
+    record: Optional[Dict[str, Any]] = None  # 人工修改后的题目，不传则按原记录入库
+
+
+# --- 接口 ---
+
+@router.post("/api/question/batch/submit")
+def api_submit_batch_generate(req: BatchGenerateRequest):
+    """
+    提交批量编题任务 (后台排队执行，同一时间只跑一个任务)
+    PASS 的题目直接分批写入题库，NEEDS_REVIEW 的进入复核列表
+    """
+    params = {
+        "has_case": req.has_case,
+        "correct_count": req.correct_count,
+        "total_count": req.total_count,
+        "question_count": req.question_count,
+        "concurrency": req.concurrency,
+    }
+    return question_batch.submit(req.topics, params)
+
+
+@router.get("/api/question/batch/jobs")
+def api_list_batch_generate_jobs(limit: int = 50):
+    return {"status": "success", "data": question_batch.list_jobs(min(limit, 200))}
+
+
+@router.get("/api/question/batch/jobs/{job_id}")
+def api_get_batch_generate_job(job_id: int):
+    """任务详情：参数、状态、累计入库/复核/失败数、各状态考点数"""
+    job = question_batch.get_job(job_id)
+    if not job: return {"status": "error", "msg": "任务不存在"}
+    return {"status": "success", "data": job}
+
+
+@router.get("/api/question/batch/jobs/{job_id}/items")
+def api_list_batch_generate_items(job_id: int, status: Optional[str] = None, page: int = 1, page_size: int = 50):
+    return {"status": "success",
+            "data": question_batch.list_items(job_id, status, max(page, 1), min(page_size, 200))}
+
+
+@router.post("/api/question/batch/jobs/{job_id}/cancel")
+def api_cancel_batch_generate(job_id: int):
+    return question_batch.cancel(job_id)
+
+
+@router.post("/api/question/batch/jobs/{job_id}/resume")
+def api_resume_batch_generate(job_id: int, req: ResumeRequest):
+    """从中断处继续：已完成的考点跳过，只跑未完成的"""
+    return question_batch.resume(job_id, req.retry_errors)
+
+
+@router.get("/api/question/batch/reviews")
+def api_list_batch_reviews(job_id: Optional[int] = None, status: str = "PENDING", page: int = 1, page_size: int = 20):
+    return {"status": "success",
+            "data": question_batch.list_reviews(job_id, status, max(page, 1), min(page_size, 100))}
+
+
+@router.post("/api/question/batch/reviews/{review_id}")
+def api_decide_batch_review(review_id: int, req: ReviewDecision):
+    """人工复核：通过则写入题库，驳回只做标记"""
+    return question_batch.decide_review(review_id, req.approve, req.record)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
 import sys
 import os
@@ -34,6 +34,7 @@ from backend.knowledge.knowledge_tool import (
     save_document,
     delete_document,
     get_database_overview,
+    recompute_overview,
     QueryRequest as KBQueryRequest,
     DocumentRequest as KBDocumentRequest,
     DeleteRequest as KBDeleteRequest
@@ -82,6 +83,14 @@ def api_get_db_overview():
     """
     return get_database_overview()
 
+@router.post("/api/knowledge/overview/recompute")
+def api_recompute_db_overview(collection: Optional[str] = None):
+    """
+    按集合全部元数据重算来源统计 (统计与实际条数不一致时用于修复)
+    不传 collection 则重算全部集合
+    """
+    return recompute_overview(collection)
+
 @router.get("/api/knowledge/meta_keys")
 def api_get_meta_keys(collection: str = "Pharmacopoeia"):
     return {"status": "success", "data": get_metadata_values(collection)}
@@ -14,6 +14,14 @@ if project_root not in sys.path:
 # === 业务模块导入 ===
 from backend.tools.tools_sql_connect import db
 from backend.tools.tools_structure import add_question_to_db
+from backend.dingchun.review_store import (
+    ensure_latest_review_table,
+    rebuild_latest_review,
+    latest_status_select,
+    latest_status_joins
+)
+from backend.search.question_search import parse_terms, match_clause, build_snippet, ensure_fulltext_index
+from backend.tools.tools_pagination import encode_cursor, decode_cursor
 from backend.knowledge.knowledge_audit import (
     get_book_ranges,
     get_fragments_by_range,
@@ -55,6 +63,7 @@ class ListQueryRequest(BaseModel):
     page: int = 1
     page_size: int = 50
     search_text: Optional[str] = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传了就按游标翻页 (忽略 page)
 
 
 class HistoryQueryRequest(BaseModel):
@@ -126,30 +135,81 @@ def list_questions(req: ListQueryRequest):
     offset = (req.page - 1) * req.page_size
     where_clause = "1=1"
     params = []
+    terms = []
+    pinned = None
+    score_sql, score_params = "0", []
+
     if req.search_text:
-        keyword = f"%{req.search_text}%"
-        if req.search_text.isdigit():
-            where_clause += " AND (question_id = %s OR stem LIKE %s)"
-            params.extend([req.search_text, keyword])
-        else:
-            where_clause += " AND stem LIKE %s"
-            params.append(keyword)
+        # 全文检索 (题干/案例/选项/解析)，按相关度排序
+        terms = parse_terms(req.search_text)
+        if terms:
+            clause = match_clause(terms, "q")
+            where_clause += f" AND {clause['where_sql']}"
+            params.extend(clause['where_params'])
+            score_sql, score_params = clause['score_sql'], clause['score_params']
+        # 纯数字额外按题号精确匹配
+        if req.search_text.strip().isdigit():
+            pinned = int(req.search_text.strip())
+
+    ensure_latest_review_table()
+    select_sql = f"""
+    SELECT q.*, {score_sql} AS score,
+        {latest_status_select()}
+    FROM pharmacist_questions q
+    {latest_status_joins("q")}
+    """
 
+    # 题号命中的题目置顶在第一页并占用一个名额，其余各页 (含游标翻页) 都排除它，总数里计一条
+    pinned_row = None
+    if pinned is not None:
+        pinned_row = db.execute_query(f"{select_sql} WHERE q.question_id = %s",
+                                      tuple(score_params + [pinned]), fetch_one=True) or None
+        if pinned_row:
+            where_clause += " AND q.question_id <> %s"
+            params.append(pinned)
+    n_pinned = 1 if pinned_row else 0
+
+    # 游标翻页：搜索模式按 (相关度, 题号)，普通列表按题号，深页也不需要 OFFSET 扫描
+    cursor = decode_cursor(req.cursor)
+    page_where, page_params = where_clause, list(params)
+    first_page = req.page == 1 and not (cursor and 'id' in cursor)
+    if cursor and 'id' in cursor:
+        if terms:
+            page_where += f" AND ({score_sql} < %s OR ({score_sql} = %s AND q.question_id < %s))"
+            page_params += score_params + [cursor.get('s', 0)] + score_params + [cursor.get('s', 0), cursor['id']]
+        else:
+            page_where += " AND q.question_id < %s"
+            page_params.append(cursor['id'])
+        page_size = req.page_size
+        limit_sql, limit_params = "LIMIT %s", [page_size + 1]
+    else:
+        # 第一页让出置顶的名额，之后各页的 OFFSET 相应前移
+        page_size = req.page_size - n_pinned if first_page else req.page_size
+        offset = max(0, offset - n_pinned)
+        limit_sql, limit_params = "LIMIT %s OFFSET %s", [page_size + 1, offset]
+
+    order_sql = "score DESC, q.question_id DESC" if terms else "q.question_id DESC"
     sql = f"""
-    SELECT q.*,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE '定春%%' ORDER BY review_time DESC LIMIT 1) as status_dingchun,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Qwen%%' ORDER BY review_time DESC LIMIT 1) as status_qwen,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Kimi%%' ORDER BY review_time DESC LIMIT 1) as status_kimi,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Doubao%%' ORDER BY review_time DESC LIMIT 1) as status_doubao
-    FROM pharmacist_questions q
-    WHERE {where_clause}
-    ORDER BY q.question_id DESC LIMIT %s OFFSET %s
+    {select_sql}
+    WHERE {page_where}
+    ORDER BY {order_sql} {limit_sql}
     """
-    rows = db.execute_query(sql, tuple(params + [req.page_size, offset]))
+    rows = db.execute_query(sql, tuple(score_params + page_params + limit_params)) or []
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor({"s": float(last['score'] or 0), "id": last['question_id']} if terms
+                                    else {"id": last['question_id']})
 
-    count_sql = f"SELECT COUNT(*) as total FROM pharmacist_questions WHERE {where_clause}"
+    if pinned_row and first_page:
+        rows.insert(0, pinned_row)
+
+    count_sql = f"SELECT COUNT(*) as total FROM pharmacist_questions q WHERE {where_clause}"
     total_res = db.execute_query(count_sql, tuple(params), fetch_one=True)
-    total = total_res['total'] if total_res else 0
+    total = (total_res['total'] if total_res else 0) + n_pinned
 
     for row in rows:
         # ✅ [修复] 扩展到 12 个选项 (a - l) 用于前端列表预览
@@ -174,7 +234,20 @@ def list_questions(req: ListQueryRequest):
         for key in ['status_dingchun', 'status_qwen', 'status_kimi', 'status_doubao']:
             if not row.get(key): row[key] = '未执行'
 
-    return {"status": "success", "data": rows, "total": total, "page": req.page}
+        row['score'] = float(row.get('score') or 0)
+        if terms:
+            row['snippet'] = build_snippet(row, terms)
+
+    return {"status": "success", "data": rows, "total": total, "page": req.page,
+            "has_more": has_more, "next_cursor": next_cursor}
+
+
+@router.post("/api/data/question/fulltext_index")
+def api_build_fulltext_index():
+    """维护接口：检查/创建题库全文索引 (大表上耗时较长，建好前搜索回退为 LIKE)"""
+    if ensure_fulltext_index():
+        return {"status": "success", "msg": "全文索引可用"}
+    return {"status": "error", "msg": "全文索引不可用，搜索使用 LIKE 匹配"}
 
 
 @router.post("/api/data/review/history")
@@ -207,13 +280,12 @@ def get_review_history(req: HistoryQueryRequest):
 # === 新增：批量状态查询接口 (用于前端批量审题页面) ===
 @router.post("/api/data/batch/status")
 def api_batch_status(req: BatchStatusRequest):
-    sql = """
+    ensure_latest_review_table()
+    sql = f"""
     SELECT q.question_id, left(q.stem, 20) as stem_preview,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE '定春%%' ORDER BY review_time DESC LIMIT 1) as status_dingchun,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Qwen%%' ORDER BY review_time DESC LIMIT 1) as status_qwen,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Kimi%%' ORDER BY review_time DESC LIMIT 1) as status_kimi,
-        (SELECT review_result FROM question_review_details WHERE question_id = q.question_id AND ai_name LIKE 'Doubao%%' ORDER BY review_time DESC LIMIT 1) as status_doubao
+        {latest_status_select()}
     FROM pharmacist_questions q
+    {latest_status_joins("q")}
     WHERE q.question_id BETWEEN %s AND %s
     ORDER BY q.question_id ASC
     """
@@ -221,6 +293,16 @@ def api_batch_status(req: BatchStatusRequest):
     return {"status": "success", "data": data}
 
 
+@router.post("/api/data/review/rebuild_latest")
+def api_rebuild_latest_review():
+    """按审核明细重建最新结果汇总表 (手工修改过 question_review_details 后使用)"""
+    ensure_latest_review_table()
+    affected = rebuild_latest_review()
+    if affected is None:
+        return {"status": "error", "msg": "重建失败，请查看后台日志"}
+    return {"status": "success", "msg": f"已重建 {affected} 条最新审核结果"}
+
+
 # ==================== F. 知识审核接口 (归类为SQL操作) ====================
 
 @router.post("/api/audit/ranges")
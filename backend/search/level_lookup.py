@@ -1,8 +1,8 @@
 import sys
 import os
-import math
 import json
 import chromadb
+import numpy as np
 
 # === 路径修复 ===
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,11 +16,14 @@ from pydantic import BaseModel
 
 # === 导入依赖 ===
 from backend.knowledge.knowledge_tool import ChromaAdmin
+from backend.knowledge.metadata_index import metadata_index
 from backend.tools.tools_call_ai import call_ai_emb
 from backend.tools.tools_sql_connect import db
 from config import config
 
 EMBEDDING_DIM = getattr(config, "EMBEDDING_DIM", 4096)
+TOP_N = 50  # 最终返回条数
+FILTER_FIELDS = ["组合标题", "完整路径"] + [f"L{k}" for k in range(1, 9)]  # 标题过滤匹配的字段
 
 
 # ==================== 请求模型 ====================
@@ -46,35 +49,48 @@ def get_target_collections() -> List[str]:
     return ["Pharmacopoeia_Official"]
 
 
-def calculate_cosine_similarity(vec1: Any, vec2: Any) -> float:
+def batch_cosine_similarity(query_vec: Any, doc_vecs: Any) -> np.ndarray:
     """
-    【修复版】计算余弦相似度
-    修复了 NumPy 数组在 if 判断中的 ambiguous 错误
+    批量计算余弦相似度
+    将所有候选向量堆叠为一个 float32 矩阵，统一归一化后做一次矩阵乘法
+    :param query_vec: 查询向量 (dim,)
+    :param doc_vecs: 候选向量列表或矩阵 (n, dim)
+    :return: 相似度数组 (n,)，维度不匹配或零向量的位置为 0
     """
-    # 1. 安全检查：显式检查 None
-    if vec1 is None or vec2 is None:
-        return 0.0
+    if query_vec is None or doc_vecs is None or len(doc_vecs) == 0:
+        return np.zeros(0, dtype=np.float32)
 
-    # 2. 安全检查：检查长度 (无论 list 还是 numpy array 都有 len)
-    if len(vec1) == 0 or len(vec2) == 0:
-        return 0.0
-
-    # 3. 维度检查
-    if len(vec1) != len(vec2):
-        return 0.0
-
-    # 4. 计算逻辑
+    q = np.asarray(query_vec, dtype=np.float32).ravel()
     try:
-        dot_product = sum(a * b for a, b in zip(vec1, vec2))
-        norm_a = math.sqrt(sum(a * a for a in vec1))
-        norm_b = math.sqrt(sum(b * b for b in vec2))
-
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return dot_product / (norm_a * norm_b)
-    except Exception as e:
-        print(f"⚠️ 相似度计算数值错误: {e}")
-        return 0.0
+        m = np.asarray(doc_vecs, dtype=np.float32)
+    except ValueError:
+        # 向量长度不一致 (混入了其他维度的数据)，逐条对齐，异常行置零
+        m = np.zeros((len(doc_vecs), q.shape[0]), dtype=np.float32)
+        for i, v in enumerate(doc_vecs):
+            if v is not None and len(v) == q.shape[0]:
+                m[i] = np.asarray(v, dtype=np.float32)
+
+    if m.ndim != 2 or m.shape[1] != q.shape[0]:
+        return np.zeros(len(doc_vecs), dtype=np.float32)
+
+    q_norm = np.linalg.norm(q)
+    if q_norm == 0:
+        return np.zeros(m.shape[0], dtype=np.float32)
+
+    m_norms = np.linalg.norm(m, axis=1)
+    m_norms[m_norms == 0] = np.inf  # 零向量得分为 0，且不触发除零警告
+    return (m @ (q / q_norm)) / m_norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """用 argpartition 取分数最高的 k 个下标 (按分数降序)"""
+    if k <= 0 or scores.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if scores.size > k:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
 
 
 # ==================== 核心业务逻辑 ====================
@@ -99,7 +115,8 @@ def execute_level_lookup(req: LevelLookupRequest) -> Dict[str, Any]:
     if not query_emb:
         return {"status": "error", "msg": "AI向量化服务失败"}
 
-    all_results = []
+    # 每个集合只保留 (集合对象, 候选ID, 分数)，文档和元数据等选出 Top N 之后再取
+    scored_cols = []
     total_candidates_count = 0
 
     # 3. 遍历所有集合
@@ -108,33 +125,8 @@ def execute_level_lookup(req: LevelLookupRequest) -> Dict[str, Any]:
             col = client.get_collection(col_name)
             if not col: continue
 
-            # --- 阶段一：基于标题/路径的硬过滤 ---
-            all_data = col.get(include=["metadatas"])
-            all_ids = all_data['ids']
-            all_metas = all_data['metadatas']
-
-            local_candidate_ids = []
-            filter_key = req.title_filter.strip().lower()
-
-            for i, meta in enumerate(all_metas):
-                if not meta: continue
-
-                # 匹配逻辑
-                is_hit = False
-                combo = str(meta.get("组合标题", "")).lower()
-                path = str(meta.get("完整路径", "")).lower()
-
-                if filter_key in combo or filter_key in path:
-                    is_hit = True
-                else:
-                    for k in range(1, 9):
-                        val = str(meta.get(f"L{k}", "")).lower()
-                        if filter_key in val:
-                            is_hit = True
-                            break
-
-                if is_hit:
-                    local_candidate_ids.append(all_ids[i])
+            # --- 阶段一：基于标题/路径的硬过滤 (走内存元数据索引，不再全量拉取) ---
+            local_candidate_ids = metadata_index.search_any_field(col, req.title_filter, fields=FILTER_FIELDS)
 
             count_local = len(local_candidate_ids)
             total_candidates_count += count_local
@@ -142,37 +134,59 @@ def execute_level_lookup(req: LevelLookupRequest) -> Dict[str, Any]:
             if count_local == 0:
                 continue
 
-            # --- 阶段二：语义重排 ---
-            target_data = col.get(
-                ids=local_candidate_ids,
-                include=["embeddings", "documents", "metadatas"]
-            )
-
-            for i in range(len(target_data['ids'])):
-                doc_emb = target_data['embeddings'][i]
-
-                # [关键] 这里传入的 doc_emb 可能是 numpy 数组，现在 calculate_cosine_similarity 已兼容
-                score = calculate_cosine_similarity(query_emb, doc_emb)
+            # --- 阶段二：语义打分 (只取向量，一次矩阵乘法算完整个集合) ---
+            target_data = col.get(ids=local_candidate_ids, include=["embeddings"])
+            scores = batch_cosine_similarity(query_emb, target_data['embeddings'])
 
-                all_results.append({
-                    "id": target_data['ids'][i],
-                    "content": target_data['documents'][i],
-                    "metadata": target_data['metadatas'][i],
-                    "source_collection": col_name,
-                    "score": score,
-                    "score_percent": f"{score:.2%}"
-                })
+            # 集合内先截取 Top N，减少全局合并的数据量
+            keep = top_k_indices(scores, TOP_N)
+            scored_cols.append((col_name, col, [target_data['ids'][i] for i in keep], scores[keep]))
 
         except Exception as e:
             # 这里的 print 有助于捕获具体是哪个集合报了什么错
             print(f"⚠️ 集合 [{col_name}] 处理出错: {e}")
             continue
 
-    # 4. 全局排序
-    all_results.sort(key=lambda x: x['score'], reverse=True)
+    # 4. 全局排序 + 截取 Top 50
+    if scored_cols:
+        all_scores = np.concatenate([item[3] for item in scored_cols])
+        owners = [(ci, j) for ci, item in enumerate(scored_cols) for j in range(len(item[2]))]
+        global_top = [owners[i] for i in top_k_indices(all_scores, TOP_N)]
+    else:
+        global_top = []
 
-    # 5. 截取 Top 50
-    final_top = all_results[:50]
+    # 5. 只为入选的片段拉取文档和元数据
+    picked = {}
+    for ci, (col_name, col, ids, scores) in enumerate(scored_cols):
+        sel = [j for c, j in global_top if c == ci]
+        if not sel: continue
+        try:
+            details = col.get(ids=[ids[j] for j in sel], include=["documents", "metadatas"])
+            detail_map = {
+                details['ids'][i]: (details['documents'][i], details['metadatas'][i])
+                for i in range(len(details['ids']))
+            }
+        except Exception as e:
+            print(f"⚠️ 集合 [{col_name}] 读取详情出错: {e}")
+            continue
+        for j in sel:
+            if ids[j] in detail_map:
+                picked[(ci, j)] = detail_map[ids[j]]
+
+    final_top = []
+    for ci, j in global_top:
+        if (ci, j) not in picked: continue
+        col_name, _, ids, scores = scored_cols[ci]
+        doc, meta = picked[(ci, j)]
+        score = float(scores[j])
+        final_top.append({
+            "id": ids[j],
+            "content": doc,
+            "metadata": meta,
+            "source_collection": col_name,
+            "score": score,
+            "score_percent": f"{score:.2%}"
+        })
 
     return {
         "status": "success",
@@ -0,0 +1,141 @@
+# === 路径修复 ===
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# ======================
+
+import re
+import html
+import threading
+from typing import Dict, List, Optional
+from backend.tools.tools_sql_connect import db
+
+# ==================== 基础配置 ====================
+# 全文索引覆盖的列 (MATCH 的列清单必须与索引完全一致)
+OPTION_COLUMNS = [f"option_{c}" for c in "abcdefghijkl"]
+FT_COLUMNS = ["stem", "case_content", "analysis"] + OPTION_COLUMNS
+FT_INDEX_NAME = "ft_question_text"
+NGRAM_TOKEN_SIZE = 2   # 与 MySQL ngram_token_size 一致 (默认 2)，短于它的关键词走 LIKE
+SNIPPET_WIDTH = 30     # 摘要中命中词前后保留的字数
+
+# 生成摘要时的字段顺序与显示名
+SNIPPET_FIELDS = [("stem", "题干"), ("case_content", "案例"), ("analysis", "解析")] + \
+                 [(col, f"选项{col[-1].upper()}") for col in OPTION_COLUMNS]
+
+_fulltext_ok = None  # None=未检查，True/False=索引可用/不可用
+_index_lock = threading.Lock()  # 保护 _fulltext_ok 的检查 (很快)
+_build_lock = threading.Lock()  # 建索引 (很慢)，与检查分开，建索引期间搜索照常走 LIKE
+
+
+def _index_exists() -> Optional[bool]:
+    """查询索引是否存在，数据库暂不可用 (execute_query 失败返回 []) 时返回 None"""
+    res = db.execute_query(
+        "SELECT COUNT(*) AS cnt FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'pharmacist_questions' AND INDEX_NAME = %s",
+        (FT_INDEX_NAME,), fetch_one=True
+    )
+    if not res: return None
+    return res['cnt'] > 0
+
+
+def fulltext_ready() -> bool:
+    """搜索时调用：只检查全文索引是否已存在 (结果缓存)，不会在请求里建索引"""
+    global _fulltext_ok
+    if _fulltext_ok is not None: return _fulltext_ok
+    with _index_lock:
+        if _fulltext_ok is None:
+            exists = _index_exists()
+            if exists is None: return False  # 下次再检查
+            _fulltext_ok = exists
+        return _fulltext_ok
+
+
+def ensure_fulltext_index() -> bool:
+    """
+    确保 pharmacist_questions 上有 ngram 全文索引 (中文按双字切词)
+    15 列的 ALTER 在大表上会持续较长时间，只在启动时 (后台线程) 或维护接口里调用；
+    数据库不支持 (MySQL < 5.7.6) 时返回 False，搜索回退为 LIKE
+    """
+    global _fulltext_ok
+    with _build_lock:
+        exists = _index_exists()
+        if exists is None: return False
+        if not exists:
+            print(f"🔨 [QuestionSearch] 正在创建全文索引 {FT_INDEX_NAME}，题量大时需要一些时间...")
+            affected = db.execute_update(
+                f"ALTER TABLE pharmacist_questions ADD FULLTEXT INDEX {FT_INDEX_NAME} "
+                f"({', '.join(FT_COLUMNS)}) WITH PARSER ngram"
+            )
+            if affected is None:
+                print("⚠️ [QuestionSearch] 全文索引创建失败，搜索回退为 LIKE")
+                with _index_lock: _fulltext_ok = False
+                return False
+            print(f"✅ [QuestionSearch] 全文索引 {FT_INDEX_NAME} 创建完成")
+        with _index_lock: _fulltext_ok = True
+        return True
+
+
+def start_fulltext_index_build():
+    """服务启动时调用：后台线程检查/创建全文索引，不阻塞启动"""
+    threading.Thread(target=ensure_fulltext_index, name="fulltext-index", daemon=True).start()
+
+
+def parse_terms(text: str) -> List[str]:
+    """按空白拆分关键词，去掉引号/布尔运算符等会干扰 BOOLEAN MODE 的字符"""
+    cleaned = re.sub(r'[+\-<>()~*"@]', " ", text or "")
+    return [t for t in cleaned.split() if t]
+
+
+def match_clause(terms: List[str], alias: str = "q") -> Dict:
+    """
+    构造搜索条件
+    :return: {"score_sql", "score_params", "where_sql", "where_params"}
+             score_sql 为相关度表达式 (LIKE 回退时恒为 0)，where_sql 为过滤条件
+    """
+    cols = ", ".join(f"{alias}.{c}" for c in FT_COLUMNS)
+    use_fulltext = all(len(t) >= NGRAM_TOKEN_SIZE for t in terms) and fulltext_ready()
+
+    if use_fulltext:
+        # 每个词都必须出现 (+)，并按短语匹配 ("...")，避免 ngram 把词拆开后任意双字命中
+        expr = " ".join(f'+"{t}"' for t in terms)
+        match_sql = f"MATCH({cols}) AGAINST (%s IN BOOLEAN MODE)"
+        return {"score_sql": match_sql, "score_params": [expr],
+                "where_sql": match_sql, "where_params": [expr]}
+
+    concat = f"CONCAT_WS(' ', {cols})"
+    return {"score_sql": "0", "score_params": [],
+            "where_sql": "(" + " AND ".join(f"{concat} LIKE %s" for _ in terms) + ")",
+            "where_params": [f"%{t}%" for t in terms]}
+
+
+def build_snippet(row: Dict, terms: List[str], width: int = SNIPPET_WIDTH) -> Optional[Dict]:
+    """
+    在命中的第一个字段里截取关键词上下文，返回 {"field": 显示名, "html": 已转义并用 <mark> 高亮的片段}
+    """
+    if not terms: return None
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+
+    for field, label in SNIPPET_FIELDS:
+        text = str(row.get(field) or "")
+        m = pattern.search(text)
+        if not m: continue
+
+        start = max(0, m.start() - width)
+        end = min(len(text), m.end() + width)
+        piece = text[start:end]
+
+        parts, last = [], 0
+        for hit in pattern.finditer(piece):
+            parts.append(html.escape(piece[last:hit.start()]))
+            parts.append(f"<mark>{html.escape(hit.group(0))}</mark>")
+            last = hit.end()
+        parts.append(html.escape(piece[last:]))
+
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if end < len(text) else ""
+        return {"field": label, "html": prefix + "".join(parts) + suffix}
+    return None
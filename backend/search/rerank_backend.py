@@ -0,0 +1,171 @@
+import sys
+import os
+
+# === 路径修复 ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# ======================
+
+import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import List, Dict, Optional
+from config import config
+
+from backend.tools.tools_call_ai import call_ai_emb, call_ai_rerank_review_packed, apply_rerank_scores
+from backend.search.search_tool import ChromaManager, EMBEDDING_DIM
+from backend.search.level_lookup import batch_cosine_similarity
+
+# ==================== 基础配置 ====================
+RERANK_HTTP_URL = getattr(config, "RERANK_HTTP_URL", "http://127.0.0.1:6325/v1/rerank")
+RERANK_HTTP_MODEL = getattr(config, "RERANK_HTTP_MODEL", getattr(config, "LOCAL_RERANK_MODEL", ""))
+SUBJECT_WEIGHT = 0.3  # 向量重排时 rerank_entity 相似度所占权重
+
+
+# ==================== 重排后端 ====================
+# 所有后端统一接口：
+#   rerank(tasks, top_n, timeout) -> 与 tasks 一一对应的结果列表 [{"text", "score", "index"}, ...]
+#   task = {"query": ..., "documents": [...], "target_subject": ..., "candidates": [召回结果(含 id / source_collection)]}
+# 异常直接抛出，由调用方决定回退策略
+
+class RerankBackend:
+    name = "base"
+    supports_packing = False  # 是否支持把多个任务合并为一次请求
+
+    def rerank(self, tasks: List[Dict], top_n: int = 3, timeout: Optional[float] = None) -> List[List[Dict]]:
+        raise NotImplementedError
+
+
+class LLMRerankBackend(RerankBackend):
+    """对话模型打分 (质量最好，最慢)，即原 call_ai_rerank_review 的逻辑"""
+    name = "llm"
+    supports_packing = True
+
+    def rerank(self, tasks, top_n=3, timeout=None):
+        return call_ai_rerank_review_packed(tasks, top_n=top_n, timeout=timeout)
+
+
+class EmbeddingRerankBackend(RerankBackend):
+    """
+    向量余弦重排 (几乎零成本)
+    直接复用 Chroma 中已存的片段向量，查询向量走 call_ai_emb 缓存；
+    如果有 rerank_entity，按 SUBJECT_WEIGHT 融合其相似度
+    """
+    name = "embedding"
+
+    def _stored_vectors(self, candidates: List[Dict]) -> List[Optional[List[float]]]:
+        by_col: Dict[str, List[str]] = {}
+        for c in candidates:
+            if c.get('id') and c.get('source_collection'):
+                by_col.setdefault(c['source_collection'], []).append(c['id'])
+
+        vec_map = {}
+        for col_name, ids in by_col.items():
+            col = ChromaManager.get_collection(col_name)
+            if not col: continue
+            data = col.get(ids=ids, include=["embeddings"])
+            for doc_id, emb in zip(data['ids'], data['embeddings']):
+                vec_map[(col_name, doc_id)] = emb
+        return [vec_map.get((c.get('source_collection'), c.get('id'))) for c in candidates]
+
+    def rerank(self, tasks, top_n=3, timeout=None):
+        # 所有任务的查询句和重排实体一次性向量化
+        texts = []
+        for task in tasks:
+            texts.append(task['query'])
+            texts.append(task.get('target_subject') or task['query'])
+        query_embs = call_ai_emb(texts, dimensions=EMBEDDING_DIM)
+        if not query_embs:
+            raise RuntimeError("查询向量化失败")
+
+        all_results = []
+        for t_idx, task in enumerate(tasks):
+            docs = task['documents']
+            doc_vecs = self._stored_vectors(task.get('candidates', []))
+            if len(doc_vecs) != len(docs) or any(v is None for v in doc_vecs):
+                # 拿不到库内向量 (例如候选不是从 Chroma 召回的)，现场向量化
+                doc_vecs = call_ai_emb(docs, dimensions=EMBEDDING_DIM)
+                if not doc_vecs:
+                    raise RuntimeError("片段向量化失败")
+
+            q_scores = batch_cosine_similarity(query_embs[2 * t_idx], doc_vecs)
+            s_scores = batch_cosine_similarity(query_embs[2 * t_idx + 1], doc_vecs)
+            scores = (1 - SUBJECT_WEIGHT) * q_scores + SUBJECT_WEIGHT * s_scores
+
+            order = np.argsort(-scores, kind="stable")[:top_n]
+            all_results.append([
+                {"text": docs[i], "score": float(scores[i]), "index": int(i)} for i in order
+            ])
+        return all_results
+
+
+class HttpRerankBackend(RerankBackend):
+    """
+    调用 /v1/rerank 风格的打分接口 (cross-encoder 服务，如 TEI / Jina / vLLM)
+    请求: {"model", "query", "documents", "top_n"}
+    返回: {"results": [{"index": 0, "relevance_score": 0.98}, ...]}
+    本地调试可运行 backend/test/z.stub_rerank_server.py 作为替身服务
+    """
+    name = "http"
+
+    def __init__(self, url: str = RERANK_HTTP_URL, model: str = RERANK_HTTP_MODEL):
+        self.url = url
+        self.model = model
+
+    def rerank(self, tasks, top_n=3, timeout=None):
+        all_results = []
+        for task in tasks:
+            payload = {
+                "model": self.model,
+                "query": task['query'],
+                "documents": task['documents'],
+                "top_n": len(task['documents'])
+            }
+            response = requests.post(self.url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            items = data.get("results", data.get("data", []))
+            scores = [
+                {"index": item.get("index"), "score": item.get("relevance_score", item.get("score", 0.0))}
+                for item in items
+            ]
+            all_results.append(apply_rerank_scores(scores, task['documents'], top_n, task.get('target_subject')))
+        return all_results
+
+
+RERANK_BACKENDS = {
+    "llm": LLMRerankBackend,
+    "embedding": EmbeddingRerankBackend,
+    "http": HttpRerankBackend,
+}
+_instances: Dict[str, RerankBackend] = {}
+
+
+def rerank_with_deadline(backend: RerankBackend, tasks: List[Dict], top_n: int = 3,
+                         timeout: Optional[float] = None) -> List[List[Dict]]:
+    """
+    带整体时限的重排：llm / embedding 后端内部可能有多次请求，timeout 参数管不住总耗时，
+    这里在线程里执行并最多等待 timeout + 5 秒，超时抛 TimeoutError，由调用方回退向量顺序
+    """
+    if not timeout:
+        return backend.rerank(tasks, top_n=top_n, timeout=timeout)
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        return executor.submit(backend.rerank, tasks, top_n, timeout).result(timeout=timeout + 5)
+    except FuturesTimeout:
+        raise TimeoutError(f"重排超过 {timeout + 5}s 未完成")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_rerank_backend(name: str) -> RerankBackend:
+    """按名称获取重排后端 (单例)，未知名称回退为 llm"""
+    key = (name or "llm").lower()
+    if key not in RERANK_BACKENDS:
+        print(f"⚠️ [Rerank] 未知的重排后端 '{name}'，使用 llm")
+        key = "llm"
+    if key not in _instances:
+        _instances[key] = RERANK_BACKENDS[key]()
+    return _instances[key]
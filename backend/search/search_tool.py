@@ -12,13 +12,15 @@ if project_root not in sys.path:
 
 import json
 import chromadb
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from config import config
 
 # [修改导入] 指向新位置 backend.tools
 from backend.tools.tools_call_ai import call_ai_emb
 from backend.tools.tools_sql_connect import db
+from backend.knowledge.metadata_index import metadata_index
 
 
 # ==================== 模型定义 ====================
@@ -34,6 +36,7 @@ class KnowledgeUpdateRequest(BaseModel):
 # ==================== 基础配置 ====================
 DB_PATH = getattr(config, "VECTOR_DB_PATH_MEDIC", "G:/KnowledgeBase/vectorizer_medic")
 EMBEDDING_DIM = getattr(config, "EMBEDDING_DIM", 4096)
+RECALL_WORKERS = getattr(config, "RAG_RECALL_WORKERS", 4)  # 多集合并发检索的线程数
 
 
 # ==================== 辅助函数 ====================
@@ -69,42 +72,90 @@ class ChromaManager:
         return client.get_collection(name=name) if client else None
 
 
-def _core_search(query_text: str, top_k: int = 10) -> List[Dict]:
-    """底层通用检索"""
+def _query_collection(col_name: str, query_embs: List[List[float]], top_k: int) -> List[List[Dict]]:
+    """对单个集合一次性提交多条查询向量，返回每条查询各自的候选列表"""
+    per_query = [[] for _ in query_embs]
+    col = ChromaManager.get_collection(col_name)
+    if not col: return per_query
+    try:
+        results = col.query(
+            query_embeddings=query_embs,
+            n_results=top_k,
+            include=["metadatas", "documents", "distances"]
+        )
+    except:
+        return per_query
+
+    for q_idx in range(len(query_embs)):
+        if not results['metadatas'] or not results['metadatas'][q_idx]: continue
+        for i in range(len(results['metadatas'][q_idx])):
+            score = 1 - results['distances'][q_idx][i]
+            per_query[q_idx].append({
+                "id": results['ids'][q_idx][i],
+                "content": results['documents'][q_idx][i],
+                "metadata": results['metadatas'][q_idx][i],
+                "raw_score": score,
+                "source_collection": col_name,
+                # 保留 vector_text 用于后续重排
+                "vector_text": results['documents'][q_idx][i]
+            })
+    return per_query
+
+
+def _embed_queries(query_texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    查询向量化：先整批请求一次；整批失败时逐条重试，单条失败 (或空查询) 对应位置为 None，
+    不影响其它查询
+    """
+    embs: List[Optional[List[float]]] = [None] * len(query_texts)
+    valid = [i for i, t in enumerate(query_texts) if t and t.strip()]
+    if not valid: return embs
+
+    batch = call_ai_emb([query_texts[i] for i in valid], dimensions=EMBEDDING_DIM)
+    if batch:
+        for i, emb in zip(valid, batch):
+            embs[i] = emb
+        return embs
+
+    print(f"⚠️ [Search] 批量向量化失败，逐条重试 {len(valid)} 条查询")
+    for i in valid:
+        embs[i] = call_ai_emb(query_texts[i], dimensions=EMBEDDING_DIM) or None
+    return embs
+
+
+def _core_search_batch(query_texts: List[str], top_k: int = 10) -> List[List[Dict]]:
+    """
+    批量检索：所有查询只做一次向量化请求，每个集合只查询一次 (携带全部查询向量)，
+    多个集合之间用有界线程池并发。返回值与 query_texts 一一对应，向量化失败的查询结果为空列表。
+    """
+    if not query_texts: return []
     target_cols = get_search_collections()
-    if not target_cols: return []
+    if not target_cols: return [[] for _ in query_texts]
 
-    query_emb = call_ai_emb(query_text, dimensions=EMBEDDING_DIM)
-    if not query_emb: return []
+    all_embs = _embed_queries(list(query_texts))
+    ok_idx = [i for i, emb in enumerate(all_embs) if emb]
+    if not ok_idx: return [[] for _ in query_texts]
+    query_embs = [all_embs[i] for i in ok_idx]
+
+    workers = max(1, min(RECALL_WORKERS, len(target_cols)))
+    if workers == 1:
+        col_results = [_query_collection(name, query_embs, top_k) for name in target_cols]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            col_results = list(pool.map(lambda name: _query_collection(name, query_embs, top_k), target_cols))
+
+    merged = [[] for _ in query_texts]
+    for pos, q_idx in enumerate(ok_idx):
+        all_candidates = [cand for per_query in col_results for cand in per_query[pos]]
+        all_candidates.sort(key=lambda x: x['raw_score'], reverse=True)
+        merged[q_idx] = all_candidates[:top_k]
+    return merged
 
-    all_candidates = []
-    for col_name in target_cols:
-        col = ChromaManager.get_collection(col_name)
-        if not col: continue
-        try:
-            results = col.query(
-                query_embeddings=[query_emb],
-                n_results=top_k,
-                include=["metadatas", "documents", "distances"]
-            )
-            if not results['metadatas'] or not results['metadatas'][0]: continue
-
-            for i in range(len(results['metadatas'][0])):
-                score = 1 - results['distances'][0][i]
-                all_candidates.append({
-                    "id": results['ids'][0][i],
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "raw_score": score,
-                    "source_collection": col_name,
-                    # 保留 vector_text 用于后续重排
-                    "vector_text": results['documents'][0][i]
-                })
-        except:
-            continue
 
-    all_candidates.sort(key=lambda x: x['raw_score'], reverse=True)
-    return all_candidates[:top_k]
+def _core_search(query_text: str, top_k: int = 10) -> List[Dict]:
+    """底层通用检索"""
+    results = _core_search_batch([query_text], top_k=top_k)
+    return results[0] if results else []
 
 
 # ==================== 业务逻辑 (已通用化) ====================
@@ -218,6 +269,7 @@ def update_knowledge_record(doc_id: str, new_content: str) -> bool:
                 embeddings=[new_emb],
                 metadatas=[current_meta]
             )
+            metadata_index.upsert(col_name, [doc_id], [current_meta])
             updated_any = True
             break
         except Exception as e:
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 将项目根目录加入路径，防止报错
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(root_dir)
+
+# ================= 配置区域 =================
+# 替身 /v1/rerank 服务，用于在没有真实 cross-encoder 服务时调试 http 重排后端
+# 打分规则：查询与片段的双字重合比例 (0-1)，结果可预期，便于核对
+HOST = "127.0.0.1"
+PORT = 6325
+
+
+# ===========================================
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def score_pair(query: str, doc: str) -> float:
+    q = _bigrams(query)
+    if not q: return 0.0
+    return round(len(q & _bigrams(doc)) / len(q), 4)
+
+
+class StubRerankHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/rerank", "/rerank"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        query = body.get("query", "")
+        documents = body.get("documents", [])
+        top_n = body.get("top_n") or len(documents)
+
+        results = [{"index": i, "relevance_score": score_pair(query, doc)} for i, doc in enumerate(documents)]
+        results.sort(key=lambda x: x["relevance_score"], reverse=True)
+
+        data = json.dumps({"model": body.get("model", "stub"), "results": results[:top_n]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_stub_server(host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    """后台线程启动替身服务，返回 server 对象 (调用 server.shutdown() 关闭)"""
+    server = ThreadingHTTPServer((host, port), StubRerankHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_http_backend():
+    from backend.search.rerank_backend import HttpRerankBackend
+
+    print("-" * 50)
+    print("🚀 开始测试 http 重排后端...")
+    server = start_stub_server()
+    try:
+        backend = HttpRerankBackend(url=f"http://{HOST}:{PORT}/v1/rerank", model="stub")
+        task = {
+            "query": "地西泮 适应证",
+            "documents": ["阿司匹林：解热镇痛", "地西泮：适应证为焦虑、失眠", "地西泮：不良反应"],
+            "target_subject": "地西泮"
+        }
+        ranked = backend.rerank([task], top_n=2)[0]
+        for r in ranked:
+            print(f"   -> [{r['index']}] {r['score']:.4f} {r['text']}")
+
+        if ranked and ranked[0]['index'] == 1:
+            print("✅ 测试通过")
+        else:
+            print("❌ 排序结果与预期不符")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_http_backend()
@@ -14,6 +14,7 @@ import requests
 from openai import OpenAI
 from typing import List, Dict, Union, Generator, Optional
 from config import config
+from backend.tools.tools_emb_cache import EmbeddingCache
 
 # 定义类型别名，方便阅读
 HistoryType = List[Dict[str, str]]  # [{"role": "user", "content": "..."}]
@@ -126,10 +127,18 @@ def call_ai_chat(
             return f"❌ 线上模型({ai_type})调用失败: {str(e)}"
 
 
-def call_ai_emb(texts: Union[str, List[str]], dimensions: Optional[int] = None) -> Union[
+# 查询向量缓存：相同文本 + 相同模型/维度 直接复用，不再请求嵌入服务
+emb_cache = EmbeddingCache(
+    max_entries=getattr(config, "EMB_CACHE_SIZE", 2048),
+    disk_path=getattr(config, "EMB_CACHE_DISK_PATH", "") or None
+)
+
+
+def call_ai_emb(texts: Union[str, List[str]], dimensions: Optional[int] = None, use_cache: bool = True) -> Union[
     List[float], List[List[float]]]:
     """
     调用本地嵌入模型进行文本向量化。
+    :param use_cache: 是否走查询向量缓存。书本批量入库这类一次性文本建议关闭，避免挤掉热点查询
     """
     api_url = config.LOCAL_API_URL_EMB
     model_name = config.LOCAL_EMB_MODEL
@@ -140,105 +149,177 @@ def call_ai_emb(texts: Union[str, List[str]], dimensions: Optional[int] = None)
 
     # 统一转为列表处理
     input_texts = [texts] if isinstance(texts, str) else texts
+    results: List[Optional[List[float]]] = [None] * len(input_texts)
+
+    # 1. 先查缓存
+    keys = []
+    if use_cache:
+        for i, text in enumerate(input_texts):
+            key = emb_cache.make_key(model_name, dimensions, text)
+            keys.append(key)
+            results[i] = emb_cache.get(key)
+
+    # 2. 未命中的文本 (同一批次内的重复文本只请求一次)
+    pending: Dict[str, List[int]] = {}
+    for i, emb in enumerate(results):
+        if emb is None:
+            pending.setdefault(input_texts[i], []).append(i)
+
+    if pending:
+        payload = {
+            "model": model_name,
+            "input": list(pending.keys())
+        }
+        if dimensions:
+            payload["dimensions"] = dimensions
 
-    payload = {
-        "model": model_name,
-        "input": input_texts
-    }
-    if dimensions:
-        payload["dimensions"] = dimensions
-
-    try:
-        response = requests.post(
-            api_url,
-            headers={"Content-Type": "application/json"},
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        result = response.json()
-
-        # 提取向量数据
-        embeddings = [item["embedding"] for item in result["data"]]
+        try:
+            response = requests.post(
+                api_url,
+                headers={"Content-Type": "application/json"},
+                json=payload,
+                timeout=60
+            )
+            response.raise_for_status()
+            result = response.json()
+
+            # 提取向量数据 (按 index 排序，防止服务端乱序返回)
+            data = sorted(result["data"], key=lambda item: item.get("index", 0))
+            embeddings = [item["embedding"] for item in data]
+
+            for indices, emb in zip(pending.values(), embeddings):
+                for i in indices:
+                    results[i] = emb
+                if use_cache:
+                    emb_cache.put(keys[indices[0]], emb)
 
-        # 根据输入类型还原返回格式
-        return embeddings[0] if isinstance(texts, str) else embeddings
+        except Exception as e:
+            print(f"❌ 向量化调用失败: {str(e)}")
+            return []
 
-    except Exception as e:
-        print(f"❌ 向量化调用失败: {str(e)}")
+    if any(r is None for r in results):
+        print("❌ 向量化返回数量与输入不一致")
         return []
 
-def call_ai_rerank_review(query: str, documents: List[str], top_n: int = 3, target_subject: str = None) -> List[Dict]:
-    """
-    【审题专用】重排序函数
-    """
-    api_url = config.LOCAL_API_URL_CHAT
-    model_name = config.LOCAL_RERANK_MODEL
-    headers = {"Content-Type": "application/json"}
+    # 根据输入类型还原返回格式
+    return results[0] if isinstance(texts, str) else results
 
-    if not api_url or not model_name or not documents:
-        return []
 
-    system_prompt = f"""
-    你是考试题目校验专家。请判断以下 {len(documents)} 个药典片段中，哪些最能验证查询语句（题干或选项）的正确性。
-    请打分（0-10分）。
-    输出格式：仅返回JSON数组：[{{"index": 0, "score": 9.5}}, ...]
-    """
+def _extract_json_array(raw_content: str) -> Optional[str]:
+    """从模型回复中取出 JSON 数组字符串 (兼容 <think> 和 ```json 包裹)"""
+    clean_content = re.sub(r'<think>.*?</think>', '', raw_content, flags=re.DOTALL).strip()
+    json_match = re.search(r"```json\s*(\[.*?\])\s*```", clean_content, re.DOTALL)
+    if json_match:
+        return json_match.group(1)
+    start_idx = clean_content.find('[')
+    end_idx = clean_content.rfind(']')
+    if start_idx != -1 and end_idx != -1:
+        return clean_content[start_idx: end_idx + 1]
+    return None
 
-    payload = {
-        "model": model_name,
-        "messages": [  # ✅ 已修复：必须是 "messages"
-            {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": f"查询验证点：{query}\n待验证片段列表：{documents}"}
-        ],
-        "temperature": 0.0,
-        "stream": False
-    }
 
-    try:
-        response = requests.post(api_url, headers=headers, data=json.dumps(payload), timeout=None)
-        response.raise_for_status()
-        raw_content = response.json()["choices"][0]["message"]["content"]
-
-        clean_content = re.sub(r'<think>.*?</think>', '', raw_content, flags=re.DOTALL).strip()
-        json_match = re.search(r"```json\s*(\[.*?\])\s*```", clean_content, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            start_idx = clean_content.find('[')
-            end_idx = clean_content.rfind(']')
-            if start_idx != -1 and end_idx != -1:
-                json_str = clean_content[start_idx: end_idx + 1]
-            else:
-                return []
+def apply_rerank_scores(scores: List[Dict], documents: List[str], top_n: int, target_subject: str = None) -> List[Dict]:
+    """将模型打分映射回文档，并对药物主体不一致的片段降权"""
+    results = []
+    for item in scores:
+        idx = item.get("index")
+        raw_score = float(item.get("score", 0.0))
 
-        scores: List[Dict] = json.loads(json_str)
+        if isinstance(idx, int) and 0 <= idx < len(documents):
+            doc_text = documents[idx]
+            final_score = raw_score
 
-        results = []
-        scored_indices = set()
+            if target_subject:
+                drug_match = re.search(r"药物：(.*?)(?:\[|\||\s)", doc_text)
 
-        for item in scores:
-            idx = item.get("index")
-            raw_score = float(item.get("score", 0.0))
+                if drug_match:
+                    doc_drug = drug_match.group(1).strip()
+                    if doc_drug and target_subject not in doc_drug and doc_drug not in target_subject:
+                        final_score = raw_score * 0.01
 
-            if isinstance(idx, int) and 0 <= idx < len(documents):
-                doc_text = documents[idx]
-                final_score = raw_score
+            results.append({"text": doc_text, "score": final_score, "index": idx})
 
-                if target_subject:
-                    drug_match = re.search(r"药物：(.*?)(?:\[|\||\s)", doc_text)
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results[:top_n]
 
-                    if drug_match:
-                        doc_drug = drug_match.group(1).strip()
-                        if doc_drug and target_subject not in doc_drug and doc_drug not in target_subject:
-                            final_score = raw_score * 0.01
 
-                results.append({"text": doc_text, "score": final_score, "index": idx})
-                scored_indices.add(idx)
+def _post_rerank(messages: List[Dict], timeout: Optional[float]) -> str:
+    payload = {
+        "model": config.LOCAL_RERANK_MODEL,
+        "messages": messages,
+        "temperature": 0.0,
+        "stream": False
+    }
+    response = requests.post(config.LOCAL_API_URL_CHAT, headers={"Content-Type": "application/json"},
+                             data=json.dumps(payload), timeout=timeout)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
 
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:top_n]
 
+def call_ai_rerank_review(query: str, documents: List[str], top_n: int = 3, target_subject: str = None,
+                          timeout: Optional[float] = None) -> List[Dict]:
+    """
+    【审题专用】重排序函数
+    :param timeout: 单次请求超时 (秒)，None 表示一直等待
+    """
+    if not config.LOCAL_API_URL_CHAT or not config.LOCAL_RERANK_MODEL or not documents:
+        return []
+
+    task = {"query": query, "documents": documents, "target_subject": target_subject}
+    try:
+        return call_ai_rerank_review_packed([task], top_n=top_n, timeout=timeout)[0]
     except Exception as e:
         print(f"❌ 审题Rerank异常: {str(e)}")
-        return [{"text": doc, "score": 0.0, "index": i} for i, doc in enumerate(documents[:top_n])]
\ No newline at end of file
+        return [{"text": doc, "score": 0.0, "index": i} for i, doc in enumerate(documents[:top_n])]
+
+
+def call_ai_rerank_review_packed(tasks: List[Dict], top_n: int = 3, timeout: Optional[float] = None) -> List[List[Dict]]:
+    """
+    【审题专用】多任务合并重排：把几个小的重排任务打包进同一个 Prompt，一次请求打完分
+    :param tasks: [{"query": ..., "documents": [...], "target_subject": ...}, ...]
+    :return: 与 tasks 一一对应的结果列表
+    异常 (超时、解析失败) 直接抛出，由调用方决定回退策略
+    """
+    if not config.LOCAL_API_URL_CHAT or not config.LOCAL_RERANK_MODEL:
+        raise ValueError("本地重排模型配置缺失")
+
+    if len(tasks) == 1:
+        # 单任务沿用原有 Prompt
+        documents = tasks[0]['documents']
+        system_prompt = f"""
+    你是考试题目校验专家。请判断以下 {len(documents)} 个药典片段中，哪些最能验证查询语句（题干或选项）的正确性。
+    请打分（0-10分）。
+    输出格式：仅返回JSON数组：[{{"index": 0, "score": 9.5}}, ...]
+    """
+        user_content = f"查询验证点：{tasks[0]['query']}\n待验证片段列表：{documents}"
+    else:
+        system_prompt = f"""
+    你是考试题目校验专家。下面有 {len(tasks)} 组任务，每组包含一个查询语句（题干或选项）和若干药典片段。
+    请对每组内的每个片段判断它能否验证该组的查询语句，并打分（0-10分）。
+    输出格式：仅返回一个JSON数组：[{{"group": 0, "index": 0, "score": 9.5}}, ...]
+    """
+        user_content = "\n\n".join(
+            f"【第{g}组】查询验证点：{task['query']}\n待验证片段列表：{task['documents']}"
+            for g, task in enumerate(tasks)
+        )
+
+    messages = [  # ✅ 已修复：必须是 "messages"
+        {"role": "system", "content": system_prompt.strip()},
+        {"role": "user", "content": user_content}
+    ]
+
+    raw_content = _post_rerank(messages, timeout)
+    json_str = _extract_json_array(raw_content)
+    if not json_str:
+        raise ValueError("重排结果中未找到 JSON 数组")
+
+    grouped: List[List[Dict]] = [[] for _ in tasks]
+    for item in json.loads(json_str):
+        g = item.get("group", 0) if len(tasks) > 1 else 0
+        if isinstance(g, int) and 0 <= g < len(tasks):
+            grouped[g].append(item)
+
+    return [
+        apply_rerank_scores(grouped[g], task['documents'], top_n, task.get('target_subject'))
+        for g, task in enumerate(tasks)
+    ]
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class EmbeddingCache:
+    """
+    查询向量缓存 (两级)
+    - 内存层：按内容哈希做键的 LRU，超出容量淘汰最久未用的
+    - 磁盘层 (可选)：SQLite 文件，进程重启后仍可命中；内存未命中时回查并回填内存
+    键 = sha256(模型名 | 维度 | 文本)，换模型或换维度不会串用旧向量
+    """
+
+    def __init__(self, max_entries: int = 2048, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._disk = None
+        if disk_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute("CREATE TABLE IF NOT EXISTS emb_cache (k TEXT PRIMARY KEY, v BLOB)")
+                self._disk.commit()
+            except Exception as e:
+                print(f"⚠️ [EmbCache] 磁盘缓存不可用，仅使用内存缓存: {e}")
+                self._disk = None
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        raw = f"{model}|{dimensions or ''}|{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _mem_put(self, key: str, emb: List[float]):
+        self._mem[key] = emb
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            emb = self._mem.get(key)
+            if emb is not None:
+                self._mem.move_to_end(key)
+                self._stats["hits"] += 1
+                return list(emb)
+
+            if self._disk is not None:
+                try:
+                    row = self._disk.execute("SELECT v FROM emb_cache WHERE k = ?", (key,)).fetchone()
+                except Exception:
+                    row = None
+                if row:
+                    emb = array("f", row[0]).tolist()
+                    self._mem_put(key, emb)
+                    self._stats["disk_hits"] += 1
+                    return list(emb)
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, emb: List[float]):
+        if not emb: return
+        with self._lock:
+            self._mem_put(key, list(emb))
+            if self._disk is not None:
+                try:
+                    self._disk.execute("INSERT OR REPLACE INTO emb_cache (k, v) VALUES (?, ?)",
+                                       (key, array("f", emb).tobytes()))
+                    self._disk.commit()
+                except Exception as e:
+                    print(f"⚠️ [EmbCache] 磁盘缓存写入失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM emb_cache")
+                self._disk.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hit_total = self._stats["hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "size": len(self._mem),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._disk is not None,
+                "hit_rate": round(hit_total / lookups, 4) if lookups else 0.0,
+            }
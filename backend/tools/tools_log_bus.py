@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+from backend.tools.global_context import log_queue_ctx
+
+
+# ==================== 线程 -> asyncio 日志通道 ====================
+# 审题、导入、编题这些耗时任务仍在工作线程里跑，但推流不再占用线程池：
+# 工作线程像用 queue.Queue 一样 put，put 通过 loop.call_soon_threadsafe 投递到事件循环里的 asyncio.Queue，
+# 流式接口的 async 生成器 await 读取，等待期间只占一个协程。
+
+CLOSED = object()  # 通道结束标记 (close() 之后投递)
+
+
+class AsyncLogQueue:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """必须在事件循环里创建 (例如流式接口的 async 生成器内)"""
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    def put(self, item: Any):
+        """线程安全；客户端断开、事件循环已关闭时静默丢弃"""
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            pass
+
+    put_nowait = put  # 兼容 queue.Queue 接口
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        self.put(CLOSED)
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """取一条；超时返回 None (用于心跳)"""
+        if timeout is None:
+            return await self._queue.get()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_nowait(self) -> Any:
+        """仅限事件循环线程调用，队列为空时抛 asyncio.QueueEmpty"""
+        return self._queue.get_nowait()
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    async def iter(self, heartbeat: Optional[float] = None) -> AsyncIterator[Any]:
+        """逐条产出直到 close()；设置 heartbeat 时空闲超过该秒数产出 None"""
+        while True:
+            item = await self.get(heartbeat)
+            if item is CLOSED: return
+            yield item
+
+
+async def merge(*logs: AsyncLogQueue, heartbeat: Optional[float] = None) -> AsyncIterator[Tuple[Optional[int], Any]]:
+    """
+    同时等待多个通道 (类似 select)：谁先有数据先产出 (通道序号, 内容)，同时就绪时序号小的优先
+    设置 heartbeat 时所有通道空闲超过该秒数产出 (None, None)；全部 close() 后结束
+    """
+    pending = {i: asyncio.ensure_future(log.get()) for i, log in enumerate(logs)}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending.values(), timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                yield None, None
+                continue
+            for i in sorted(i for i, task in pending.items() if task in done):
+                item = pending.pop(i).result()
+                if item is CLOSED: continue
+                pending[i] = asyncio.ensure_future(logs[i].get())
+                yield i, item
+    finally:
+        for task in pending.values():
+            task.cancel()
+
+
+def start_worker(target: Callable, log: AsyncLogQueue, *args, name: Optional[str] = None) -> threading.Thread:
+    """
+    在独立线程里运行 target(*args)，线程内 log_queue_ctx 指向 log (各业务模块的 emit 照常工作)；
+    结束 (含异常) 后关闭通道。异常需要推给前端的，由 target 自己捕获并 put。
+    """
+    def run():
+        token = log_queue_ctx.set(log)
+        try:
+            target(*args)
+        finally:
+            log.close()
+            try: log_queue_ctx.reset(token)
+            except: pass
+
+    t = threading.Thread(target=run, name=name, daemon=True)
+    t.start()
+    return t
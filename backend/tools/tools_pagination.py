@@ -0,0 +1,26 @@
+import json
+import base64
+from typing import Dict, Optional
+
+
+# ==================== 游标分页 (keyset) ====================
+# 列表接口不再用 LIMIT/OFFSET 翻页：每页返回 next_cursor，前端下一页原样带回。
+# 游标里记录的是上一页最后一条的排序键 (如 {"id": 123} 或 {"s": 1.25, "id": 123})，
+# 查询时用 WHERE 排序键 < 游标值 直接定位，深页耗时与第一页相同。
+# 对前端来说游标是不透明字符串 (urlsafe base64 的 JSON)。
+
+def encode_cursor(data: Optional[Dict]) -> Optional[str]:
+    if not data: return None
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict]:
+    """解析游标，格式不对返回 None (按第一页处理)"""
+    if not cursor: return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return data if isinstance(data, dict) else None
+    except Exception:
+        return None
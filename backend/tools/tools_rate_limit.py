@@ -0,0 +1,237 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+# ==================== 基础配置 ====================
+MAX_SLEEP = 1.0         # 单次等待上限 (秒)，等待期间额度变化能及时感知
+BACKOFF_BASE = 2.0      # 429 且没有 Retry-After 时的初始退避 (秒)，之后指数翻倍
+BACKOFF_MAX = 60.0      # 退避上限 (秒)
+DECREASE_FACTOR = 0.7   # 每次 429 把速率乘以该系数
+RECOVER_STEP = 0.05     # 每次成功把速率系数加回该值 (直到 1.0)
+MIN_SCALE = 0.1         # 速率系数下限
+TRANSIENT_RETRIES = 2   # 网络错误 / 超时 / 5xx 的重试次数 (与 429 分开计数，不触发冷却降速)
+TRANSIENT_BACKOFF = 1.0 # 上述错误的初始退避 (秒)，之后指数翻倍
+RETRYABLE_STATUS = {408, 409, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """令牌桶：容量 = 每分钟额度，按秒匀速回填；per_minute <= 0 表示不限"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute or 0)
+        self.tokens = self.per_minute
+        self._last = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def refill(self, now: float, scale: float = 1.0):
+        if not self.enabled: return
+        self.tokens = min(self.per_minute, self.tokens + (now - self._last) * self.per_minute * scale / 60.0)
+        self._last = now
+
+    def wait_time(self, amount: float, scale: float = 1.0) -> float:
+        """还需等待多少秒才能取出 amount (超过桶容量的请求按满桶计算，否则永远等不到)"""
+        if not self.enabled: return 0.0
+        deficit = min(amount, self.per_minute) - self.tokens
+        return 0.0 if deficit <= 0 else deficit * 60.0 / (self.per_minute * scale)
+
+    def consume(self, amount: float):
+        # 允许透支：实际用量超出预估时记为负数，后续请求自然会等待回填
+        if self.enabled: self.tokens -= amount
+
+    def refund(self, amount: float):
+        """退回未实际使用的额度 (不超过桶容量)"""
+        if self.enabled: self.tokens = min(self.per_minute, self.tokens + amount)
+
+
+class ProviderRateLimiter:
+    """
+    单个服务商的限流器
+    - 请求数/分钟 (RPM) 与 token 数/分钟 (TPM) 两个令牌桶，发请求前按预估 token 数同时扣减
+    - 响应返回后按 usage.total_tokens 多退少补
+    - 遇到 429：按 Retry-After (没有则指数退避) 冷却，同时把速率系数下调；成功后逐步恢复 (AIMD)
+    - 网络错误 / 超时 / 5xx：短暂退避后有限次重试，不影响速率
+    - 请求失败 (429、网络错误等) 时退回预占的 TPM 额度
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, max_retries: int = 5):
+        self.name = name
+        self.max_retries = max_retries
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._scale = 1.0
+        self._cooldown_until = 0.0
+        self._backoff_n = 0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "rate_limited": 0, "retries": 0, "transient_errors": 0, "tokens_used": 0,
+                       "waited_s": 0.0}
+
+    def acquire(self, est_tokens: int = 0):
+        """阻塞直到 RPM / TPM 额度都足够且不在冷却期"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._requests.refill(now, self._scale)
+                self._tokens.refill(now, self._scale)
+                wait = max(
+                    self._cooldown_until - now,
+                    self._requests.wait_time(1, self._scale),
+                    self._tokens.wait_time(est_tokens, self._scale),
+                )
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(est_tokens)
+                    self._stats["requests"] += 1
+                    self._stats["waited_s"] += waited
+                    return
+            step = min(wait, MAX_SLEEP)
+            time.sleep(step)
+            waited += step
+
+    def settle(self, est_tokens: int, used_tokens: int):
+        """请求成功：按实际用量修正 TPM 桶，并逐步恢复速率"""
+        with self._lock:
+            self._tokens.consume(used_tokens - est_tokens)
+            self._stats["tokens_used"] += used_tokens
+            self._scale = min(1.0, self._scale + RECOVER_STEP)
+            self._backoff_n = 0
+
+    def release(self, est_tokens: int):
+        """请求失败：退回发请求前预占的 TPM 额度 (RPM 不退，请求确实发出去了)"""
+        with self._lock:
+            self._tokens.refund(est_tokens)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """收到 429：进入冷却并下调速率，返回冷却秒数"""
+        with self._lock:
+            self._stats["rate_limited"] += 1
+            self._backoff_n += 1
+            self._scale = max(MIN_SCALE, self._scale * DECREASE_FACTOR)
+            if retry_after is None:
+                retry_after = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._backoff_n - 1))
+                retry_after *= 1 + random.random() * 0.25  # 抖动，避免多个线程同时醒来
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + retry_after)
+            return retry_after
+
+    def call(self, fn: Callable, est_tokens: int = 0):
+        """
+        在限流保护下执行 fn()
+        - 429 时冷却后重试 (最多 max_retries 次)
+        - 网络错误 / 超时 / 5xx 退避后重试 (最多 TRANSIENT_RETRIES 次)
+        - 其他异常直接抛出
+        fn 的返回值若带 usage.total_tokens (OpenAI SDK 响应)，用于修正 TPM 计数
+        """
+        limited = transient = 0
+        while True:
+            self.acquire(est_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release(est_tokens)
+                if _is_rate_limited(e):
+                    delay = self.on_rate_limited(_retry_after(e))
+                    if limited >= self.max_retries:
+                        raise
+                    limited += 1
+                    with self._lock:
+                        self._stats["retries"] += 1
+                    print(f"⏳ [RateLimit] {self.name} 触发限流 (429)，{delay:.1f}s 后重试 ({limited}/{self.max_retries})")
+                    continue
+                if _is_transient(e) and transient < TRANSIENT_RETRIES:
+                    transient += 1
+                    delay = TRANSIENT_BACKOFF * 2 ** (transient - 1) * (1 + random.random() * 0.25)
+                    with self._lock:
+                        self._stats["transient_errors"] += 1
+                    print(f"⏳ [RateLimit] {self.name} 请求失败 ({type(e).__name__})，{delay:.1f}s 后重试 "
+                          f"({transient}/{TRANSIENT_RETRIES})")
+                    time.sleep(delay)
+                    continue
+                raise
+
+            usage = getattr(result, "usage", None)
+            used = getattr(usage, "total_tokens", None) or est_tokens
+            self.settle(est_tokens, used)
+            return result
+
+    def state(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now, self._scale)
+            self._tokens.refill(now, self._scale)
+            return {
+                "rpm_limit": self._requests.per_minute,
+                "tpm_limit": self._tokens.per_minute,
+                "rpm_available": round(self._requests.tokens, 1) if self._requests.enabled else None,
+                "tpm_available": round(self._tokens.tokens, 1) if self._tokens.enabled else None,
+                "rate_scale": round(self._scale, 3),
+                "cooldown_s": round(max(0.0, self._cooldown_until - now), 1),
+                **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in self._stats.items()},
+            }
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    return _status_code(e) == 429
+
+
+def _is_transient(e: Exception) -> bool:
+    """可重试的临时错误：连接失败、超时 (OpenAI SDK 的 APIConnectionError / APITimeoutError) 与 5xx 等"""
+    status = _status_code(e)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(e, (ConnectionError, TimeoutError)) or \
+        type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """从异常携带的响应头解析 Retry-After (秒数或 HTTP 日期)，解析不到返回 None"""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers: return None
+
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+# ==================== 全局注册表 ====================
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rpm: float = 0, tpm: float = 0, max_retries: int = 5) -> ProviderRateLimiter:
+    """按服务商名获取限流器 (首次调用时按参数创建，之后复用同一个实例)"""
+    with _registry_lock:
+        if name not in _limiters:
+            _limiters[name] = ProviderRateLimiter(name, rpm=rpm, tpm=tpm, max_retries=max_retries)
+        return _limiters[name]
+
+
+def rate_limiter_states() -> Dict[str, Dict]:
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {l.name: l.state() for l in limiters}
@@ -11,6 +11,10 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 # ======================
 
+import threading
+import time
+from collections import deque
+
 import pymysql
 from pymysql.cursors import DictCursor
 # === 导入配置 (增加开源容错) ===
@@ -23,6 +27,223 @@ except ImportError:
     sys.exit(1)
 
 
+# ==================== 连接池配置 ====================
+# 使用 getattr 兜底，旧版 config.py 没有这些字段也能正常运行
+POOL_SIZE = getattr(config, "DB_POOL_SIZE", 5)                    # 常驻连接数
+POOL_MAX_OVERFLOW = getattr(config, "DB_POOL_MAX_OVERFLOW", 10)   # 高峰期允许额外创建的连接数
+POOL_TIMEOUT = getattr(config, "DB_POOL_TIMEOUT", 30)             # 等待空闲连接的最长秒数
+POOL_IDLE_TIMEOUT = getattr(config, "DB_POOL_IDLE_TIMEOUT", 300)  # 空闲超过该秒数的连接直接淘汰
+POOL_PING_INTERVAL = getattr(config, "DB_POOL_PING_INTERVAL", 30) # 空闲超过该秒数的连接，借出前先 ping 一次
+
+
+class PooledConnection:
+    """
+    连接池借出的连接包装
+    用法与 pymysql 连接完全一致，区别是 close() 不会真正断开，而是归还给连接池
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._conn = raw_conn
+
+    def __getattr__(self, name):
+        # 其余属性/方法 (cursor, commit, rollback...) 全部透传给底层连接
+        return getattr(self._conn, name)
+
+    def close(self):
+        """归还连接 (重复调用无副作用)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # 兜底：调用方忘记 close() 时，对象回收时自动归还，防止连接泄漏
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    线程安全的有界连接池
+    - 常驻 pool_size 个连接，高峰期最多再溢出 max_overflow 个，溢出连接归还时直接关闭
+    - 借出前做健康检查：空闲过久的连接淘汰，空闲较久的连接 ping 一次
+    - 归还时顺带 (每 ping_interval 秒最多一次) 清理栈底空闲超时的冷连接，LIFO 复用不会借出它们
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, timeout=30,
+                 idle_timeout=300, ping_interval=30):
+        self._creator = creator
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+
+        self._idle = deque()  # [(raw_conn, 归还时间), ...]
+        self._size = 0        # 当前已创建 (空闲 + 借出) 的连接总数
+        # 使用 RLock：PooledConnection.__del__ 可能在持锁期间被 GC 触发
+        self._cond = threading.Condition(threading.RLock())
+        self._last_evict = time.monotonic()  # 上次清理空闲连接的时间
+
+        # 监控指标
+        self._stats = {
+            "checkouts": 0,        # 累计借出次数
+            "created": 0,          # 累计新建连接数
+            "closed": 0,           # 累计关闭连接数 (淘汰/溢出/损坏)
+            "timeouts": 0,         # 等待超时次数
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    # ---------- 内部工具 ----------
+    def _close_raw(self, raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, raw_conn, idle_seconds):
+        if not raw_conn.open:
+            return False
+        if idle_seconds > self.idle_timeout:
+            return False
+        if idle_seconds > self.ping_interval:
+            try:
+                raw_conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    # ---------- 借出 / 归还 ----------
+    def acquire(self):
+        """借出一个连接，池满时阻塞等待，超时抛出 TimeoutError"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            raw_conn = None
+            need_create = False
+
+            with self._cond:
+                while True:
+                    if self._idle:
+                        raw_conn, returned_at = self._idle.pop()  # LIFO：优先复用最热的连接
+                        break
+                    if self._size < self.pool_size + self.max_overflow:
+                        self._size += 1  # 先占位，锁外再建连接
+                        need_create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise TimeoutError(f"等待数据库连接超时 ({self.timeout}s)")
+                    self._cond.wait(remaining)
+
+            if need_create:
+                try:
+                    raw_conn = self._creator()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+                break
+
+            # 复用的空闲连接，做健康检查 (锁外进行，ping 可能耗时)
+            if self._is_healthy(raw_conn, time.monotonic() - returned_at):
+                break
+            self._close_raw(raw_conn)
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+
+        return PooledConnection(self, raw_conn)
+
+    def release(self, raw_conn):
+        """归还连接：回滚未提交事务，溢出或损坏的连接直接关闭"""
+        try:
+            if not raw_conn.open:
+                raise ConnectionError("连接已断开")
+            raw_conn.rollback()
+        except Exception:
+            self._close_raw(raw_conn)
+            return
+
+        pooled = evict_due = False
+        with self._cond:
+            if len(self._idle) < self.pool_size:
+                now = time.monotonic()
+                self._idle.append((raw_conn, now))
+                self._cond.notify()
+                pooled = True
+                if now - self._last_evict >= self.ping_interval:
+                    self._last_evict = now
+                    evict_due = True
+        if not pooled:
+            self._close_raw(raw_conn)
+        elif evict_due:
+            self.evict_idle()
+
+    def evict_idle(self):
+        """主动淘汰空闲超时的连接，返回淘汰数量"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            kept = deque()
+            for raw_conn, returned_at in self._idle:
+                if now - returned_at > self.idle_timeout:
+                    expired.append(raw_conn)
+                else:
+                    kept.append((raw_conn, returned_at))
+            self._idle = kept
+        for raw_conn in expired:
+            self._close_raw(raw_conn)
+        return len(expired)
+
+    def dispose(self):
+        """关闭所有空闲连接 (借出中的连接归还时按正常逻辑处理)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw_conn, _ in idle:
+            self._close_raw(raw_conn)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "overflow": max(0, self._size - self.pool_size),
+                "checkouts": checkouts,
+                "created": self._stats["created"],
+                "closed": self._stats["closed"],
+                "timeouts": self._stats["timeouts"],
+                "wait_time_avg_ms": round(self._stats["wait_time_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_time_max_ms": round(self._stats["wait_time_max"] * 1000, 3),
+            }
+
+
 class DatabaseManager:
     def __init__(self):
         self.host = config.DB_HOST
@@ -31,23 +252,52 @@ class DatabaseManager:
         self.password = config.DB_PASSWORD
         self.db_name = config.DB_NAME
 
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _create_raw_connection(self):
+        """创建一条真实的 pymysql 连接 (仅供连接池调用)"""
+        return pymysql.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.db_name,
+            charset='utf8mb4',
+            cursorclass=DictCursor  # 让查询结果返回字典格式 {'id': 1, 'title': '...'}
+        )
+
+    @property
+    def pool(self) -> ConnectionPool:
+        # 懒加载：首次使用时才创建连接池
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        self._create_raw_connection,
+                        pool_size=POOL_SIZE,
+                        max_overflow=POOL_MAX_OVERFLOW,
+                        timeout=POOL_TIMEOUT,
+                        idle_timeout=POOL_IDLE_TIMEOUT,
+                        ping_interval=POOL_PING_INTERVAL,
+                    )
+        return self._pool
+
     def get_connection(self):
-        """获取数据库连接"""
+        """
+        从连接池借出连接
+        用完调用 conn.close() (或使用 with 语句) 即归还连接池，而不是断开
+        """
         try:
-            conn = pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.db_name,
-                charset='utf8mb4',
-                cursorclass=DictCursor  # 让查询结果返回字典格式 {'id': 1, 'title': '...'}
-            )
-            return conn
+            return self.pool.acquire()
         except Exception as e:
             print(f"❌ 数据库连接失败: {e}")
             return None
 
+    def get_pool_stats(self):
+        """连接池监控指标 (借出次数、等待耗时、连接数等)"""
+        return self.pool.stats()
+
     def execute_update(self, sql, params=None):
         """
         执行 增/删/改 操作
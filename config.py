@@ -55,6 +55,36 @@ class Config:
     LOCAL_API_URL_EMB = "http://127.0.0.1:6324/v1/embeddings"           # 本地LMstudio嵌入模型调用地址
     LOCAL_EMB_MODEL = "text-embedding-qwen3-embedding-8b@q4_k_m"        # 本地LMstudio文本向量化模型
     LOCAL_EMB_VI_MODEL = "gme-varco-vision-embedding"                   # 本地LMstudio图片向量化模型
+    EMB_CACHE_SIZE = 2048                                               # 查询向量内存缓存条数 (LRU)
+    EMB_CACHE_DISK_PATH = ""                                            # 查询向量磁盘缓存文件 (SQLite)，留空则只用内存
+    IMPORT_GPU_CONCURRENCY = 1                                          # 导入调度：同时运行的 GPU 步骤数 (AI 处理、向量入库)
+    IMPORT_CPU_CONCURRENCY = 2                                          # 导入调度：同时运行的 CPU 步骤数 (切分)
+    BOOK_SPLIT_WRITE_CHUNK = 1000                                       # 书本切分时分段写库的每批条数 (边解析边写)
+    BOOK_PROCESS_CONCURRENCY = 1                                        # 书本 AI 处理的章节并行数，1=整本书顺序处理 (按 L1/L2 标题切章节)
+    BOOK_PROCESS_WINDOW_RETRIES = 2                                     # 书本 AI 处理单个窗口调用异常的重试次数，仍失败则进入重试队列
+    BOOK_PROCESS_RETRY_BATCH = 0                                        # 重试失败窗口时每批分段数，0=书本 batch_size 的三分之一
+    BOOK_PROCESS_RETRY_LIMIT = 3                                        # 同一失败窗口最多重试轮数
+    EMBED_IMPORT_WORKERS = 2                                            # 书本入库时并发的向量化请求数
+    EMBED_BATCH_SIZE = 32                                               # 书本入库单次向量化的初始条数 (运行中按耗时自适应)
+    EMBED_BATCH_MIN = 4                                                 # 自适应批大小下限
+    EMBED_BATCH_MAX = 128                                               # 自适应批大小上限
+    EMBED_BATCH_TARGET_SECONDS = 8                                      # 单批向量化的目标耗时 (秒)，快则加大批次，慢则减小
+    EMBED_FETCH_PAGE = 200                                              # 书本入库从 MySQL 预取片段的每页条数
+    EMBED_WRITE_BATCH = 256                                             # 书本入库写入 Chroma 的每批条数
+    RAG_RECALL_WORKERS = 4                                              # RAG 召回时多集合并发查询的线程数
+    RERANK_CONCURRENCY = 2                                              # 审题重排并发请求数 (本地 GPU 建议 1-4)
+    RERANK_TIMEOUT = 60                                                 # 单次重排请求超时 (秒)，超时回退为向量召回顺序
+    RERANK_PACK_MAX_DOCS = 0                                            # 小任务合并为一次重排请求的片段总数上限，0=不合并
+
+    # 重排后端：llm (对话模型打分，质量高但慢) / embedding (复用库内向量算余弦，几乎零成本) / http (/v1/rerank 打分服务)
+    DINGCHUN_RERANK_BACKEND = "llm"                                     # 定春审题 RAG 使用的重排后端
+    QUESTION_AGENT_RERANK_BACKEND = "none"                              # 编题 Agent 知识检索使用的重排后端，none=不重排
+    QUESTION_AGENT_RECALL_FACTOR = 3                                    # 编题 Agent 重排前召回 top_k 的倍数
+    QUESTION_CHAIN_CONCURRENCY = 3                                      # 编题一次生成多道题时，干扰项(C)→终审(D) 链的并发数，1=逐题顺序
+    QUESTION_BATCH_CONCURRENCY = 2                                      # 批量编题任务同时处理的考点数 (可按任务单独指定)
+    QUESTION_BATCH_WRITE_SIZE = 20                                      # 批量编题 PASS 题目攒够多少道一起写入题库
+    RERANK_HTTP_URL = "http://127.0.0.1:6325/v1/rerank"                 # http 重排后端地址
+    RERANK_HTTP_MODEL = "qwen3-reranker-8b"                             # http 重排后端模型名
 
     # ==================== 新增：模型选择配置（方便切换默认模型）====================
     DEFAULT_CHAT_MODEL = "local"    # 可选：local/dashscope/gpt/deepseek/volcengine
@@ -66,6 +96,17 @@ class Config:
     # 可选值: "LOCAL" (使用本地Qwen) / "KIMI" (使用云端Kimi)
     DINGCHUN_DEFAULT_CORE = "LOCAL"
 
+    # ==================== 批量审题调度配置 ====================
+    # 每个 AI 同时处理的题目数：本地 GPU 建议 1，远程 API 可按账号并发额度调大
+    BATCH_REVIEW_CONCURRENCY = {"dingchun": 1, "qwen": 4, "kimi": 4, "doubao": 4}
+    # 远程审题服务商限流：rpm=每分钟请求数，tpm=每分钟 token 数，0=不限 (按各平台账号额度填写，略低于上限)
+    REVIEW_RATE_LIMITS = {
+        "qwen": {"rpm": 60, "tpm": 100000},
+        "kimi": {"rpm": 20, "tpm": 64000},
+        "doubao": {"rpm": 60, "tpm": 100000},
+    }
+    REVIEW_RATE_LIMIT_RETRIES = 5   # 429 后最多重试次数
+
     # ==================== 数据库配置 ====================
     DB_HOST = "localhost"
     DB_PORT = 3306
@@ -73,6 +114,13 @@ class Config:
     DB_PASSWORD = ""          # 您的数据库密码
     DB_NAME = "pharmacist_question_bank"  # 您的业务数据库名
 
+    # ==================== 数据库连接池配置 ====================
+    DB_POOL_SIZE = 5                # 常驻连接数
+    DB_POOL_MAX_OVERFLOW = 10       # 高峰期允许额外创建的连接数 (归还后自动关闭)
+    DB_POOL_TIMEOUT = 30            # 等待空闲连接的最长时间 (秒)
+    DB_POOL_IDLE_TIMEOUT = 300      # 空闲超过该时间的连接直接淘汰 (秒)，需小于 MySQL wait_timeout
+    DB_POOL_PING_INTERVAL = 30      # 空闲超过该时间的连接，借出前先 ping 检查 (秒)；也是归还时清理空闲超时连接的最小间隔
+
 
 
 
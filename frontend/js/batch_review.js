@@ -6,7 +6,8 @@
 const API = {
     START: '/api/batch/start',
     STOP: '/api/batch/stop',
-    PROGRESS: '/api/batch/progress'
+    PROGRESS: '/api/batch/progress',
+    PROGRESS_WAIT: '/api/batch/progress/wait'
 };
 
 // 状态对应的 CSS 类名和文本 (对应 common.css)
@@ -21,7 +22,9 @@ const STATUS_CONFIG = {
 // 全局状态管理
 const state = {
     isTaskActive: false, // 是否有任务数据显示在界面上
-    timer: null,         // 轮询定时器
+    polling: false,      // 长轮询是否在运行
+    pollAbort: null,     // 用于中断挂起中的长轮询请求
+    version: '',         // 最近一次拿到的进度版本号
     page: 1,             // 当前页码
     pageSize: 20,        // 每页条数
     total: 0             // 总任务数
@@ -151,15 +154,33 @@ async function stopBatchTask() {
 // ================= 数据轮询与渲染 =================
 
 function startPolling() {
-    if (state.timer) clearInterval(state.timer);
-    // 每 1.5 秒轮询一次
-    state.timer = setInterval(() => fetchProgress(), 1500);
+    // 长轮询：进度有变化时后端立即返回，没有变化时挂起，最长 25 秒后重新发起
+    if (state.polling) return;
+    state.polling = true;
+    longPollLoop();
 }
 
 function stopPolling() {
-    if (state.timer) {
-        clearInterval(state.timer);
-        state.timer = null;
+    state.polling = false;
+    if (state.pollAbort) {
+        state.pollAbort.abort();
+        state.pollAbort = null;
+    }
+}
+
+async function longPollLoop() {
+    while (state.polling) {
+        try {
+            state.pollAbort = new AbortController();
+            const url = `${API.PROGRESS_WAIT}?since=${encodeURIComponent(state.version)}&timeout=25&page=${state.page}&page_size=${state.pageSize}`;
+            const res = await fetch(url, { signal: state.pollAbort.signal });
+            const json = await res.json();
+            applyProgress(json);
+        } catch (e) {
+            if (e.name === 'AbortError') break;
+            console.error("轮询失败:", e);
+            await new Promise(r => setTimeout(r, 3000)); // 网络异常时稍后重试
+        }
     }
 }
 
@@ -169,35 +190,40 @@ async function fetchProgress(isFirstLoad = false) {
         const url = `${API.PROGRESS}?page=${state.page}&page_size=${state.pageSize}`;
         const res = await fetch(url);
         const json = await res.json();
-
-        if (json.status === 'success') {
-            state.total = json.total;
-
-            // 逻辑判定：
-            // 如果后端 batch_task_progress 表里有数据 (total > 0)，说明系统处于“任务模式”
-            if (state.total > 0) {
-                if (!state.isTaskActive) {
-                    state.isTaskActive = true;
-                    // 如果是首次加载发现有任务，或者中途发现有任务，开启轮询
-                    startPolling();
-                }
-                updateUIState(true);
-                renderTable(json.rows);
-                renderStats(state.total, json.stats);
-                renderPagination();
-            } else {
-                // 表里没数据 (可能是被 truncate 了)
-                state.isTaskActive = false;
-                stopPolling();
-                updateUIState(false);
-                renderTable([]); // 清空表格
-            }
-        }
+        applyProgress(json);
     } catch (e) {
         console.error("轮询失败:", e);
     }
 }
 
+function applyProgress(json) {
+    // unchanged = 长轮询超时无变化；page 不一致说明是翻页前发出的旧请求
+    if (json.status !== 'success' || json.page !== state.page) return;
+
+    state.version = json.version;
+    state.total = json.total;
+
+    // 逻辑判定：
+    // 如果后端 batch_task_progress 表里有数据 (total > 0)，说明系统处于“任务模式”
+    if (state.total > 0) {
+        if (!state.isTaskActive) {
+            state.isTaskActive = true;
+            // 如果是首次加载发现有任务，或者中途发现有任务，开启轮询
+            startPolling();
+        }
+        updateUIState(true);
+        renderTable(json.rows);
+        renderStats(state.total, json.stats);
+        renderPagination();
+    } else {
+        // 表里没数据 (可能是被 truncate 了)
+        state.isTaskActive = false;
+        stopPolling();
+        updateUIState(false);
+        renderTable([]); // 清空表格
+    }
+}
+
 // ================= UI 渲染细节 =================
 
 function updateUIState(active) {
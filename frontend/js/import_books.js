@@ -4,8 +4,12 @@
 
 window.initImportBooks = function() {
     loadBookList();
+    reattachImportJob();
 }
 
+const IMPORT_JOB_KEY = 'importJobId';
+let importJobSource = null;
+
 window.loadBookList = async function() {
     const tbody = document.getElementById('book-list-body');
     if (!tbody) return;
@@ -69,7 +73,11 @@ window.loadBookList = async function() {
                         <span class="sep">|</span>
                         <span class="btn-link" onclick="window.runTask('process', ${item.book_id})">处理</span>
                         <span class="sep">|</span>
+                        <span class="btn-link" title="从上次中断处继续，并重试失败的窗口" onclick="window.runTask('resume', ${item.book_id})">续跑</span>
+                        <span class="sep">|</span>
                         <span class="btn-link" onclick="window.runTask('embed', ${item.book_id})">入库</span>
+                        <span class="sep">|</span>
+                        <span class="btn-link" title="切分 -> AI处理 -> 入库，后台排队执行" onclick="window.runImportChain(${item.book_id})">一键导入</span>
                         <span class="sep" style="margin:0 10px; border-left:1px solid #ddd; height:12px;"></span>
                         <span class="btn-link" style="color:#666" onclick='window.openBookModal(${itemJson})'>编辑</span>
                         <span class="sep">|</span>
@@ -87,22 +95,54 @@ window.loadBookList = async function() {
 }
 
 // 2. 执行任务 (流式)
-window.runTask = async function(step, id) {
+function appendImportLog(text, cls = '') {
     const logBox = document.getElementById('import-log-box');
-    const stepName = { 'split': '机械切分', 'process': 'AI结构化', 'embed': '向量入库' }[step];
+    if (!logBox) return null;
+    const div = document.createElement('div');
+    div.className = cls ? `log-line ${cls}` : 'log-line';
+    div.innerText = text;
+    logBox.appendChild(div);
+    logBox.scrollTop = logBox.scrollHeight;
+    return div;
+}
+
+// 处理一行任务日志 ("JOB: id" / "LOG: ..." / "DATA: {...}")，DATA 表示任务结束
+function handleImportLine(line) {
+    if (line.startsWith('JOB: ')) {
+        localStorage.setItem(IMPORT_JOB_KEY, line.substring(5).trim());
+    } else if (line.startsWith('LOG: ')) {
+        appendImportLog(`  ${line.substring(5)}`);
+    } else if (line.startsWith('DATA: ')) {
+        const data = JSON.parse(line.substring(6));
+        if (data.status === 'success') {
+            appendImportLog(`> ✅ 任务完成！`, 'success');
+        } else if (data.status === 'cancelled') {
+            appendImportLog(`> 🛑 任务已取消`, 'error');
+        } else {
+            appendImportLog(`> ❌ 任务出错: ${data.msg}`, 'error');
+        }
+        localStorage.removeItem(IMPORT_JOB_KEY);
+        window.loadBookList(); // 刷新进度
+    }
+}
 
+function logTaskStart(stepName, id) {
     // 插入一条开始日志
-    const startDiv = document.createElement('div');
-    startDiv.className = 'log-line info';
+    const startDiv = appendImportLog(`> [${new Date().toLocaleTimeString()}] 启动任务: [${stepName}] (BookID: ${id})...`, 'info');
+    if (!startDiv) return;
     startDiv.style.borderTop = "1px solid #bae7ff"; // 醒目分隔线
     startDiv.style.marginTop = "10px";
     startDiv.style.paddingTop = "10px";
-    startDiv.innerText = `> [${new Date().toLocaleTimeString()}] 启动任务: [${stepName}] (BookID: ${id})...`;
-    logBox.appendChild(startDiv);
-    logBox.scrollTop = logBox.scrollHeight;
+}
+
+// 2. 执行任务 (流式)
+window.runTask = async function(step, id) {
+    const stepName = { 'split': '机械切分', 'process': 'AI结构化', 'resume': '断点续跑', 'embed': '向量入库' }[step];
+    logTaskStart(stepName, id);
 
     try {
-        const res = await fetch(`/api/import/task/run?step=${step}`, {
+        const url = step === 'resume' ? '/api/import/task/resume' : `/api/import/task/run?step=${step}`;
+        const res = await fetch(url, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ book_id: id, ai_type: 'none' })
@@ -110,45 +150,77 @@ window.runTask = async function(step, id) {
 
         const reader = res.body.getReader();
         const decoder = new TextDecoder();
+        let buffer = '';
 
         while (true) {
             const { done, value } = await reader.read();
             if (done) break;
 
-            const text = decoder.decode(value, { stream: true });
-            const lines = text.split('\n');
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
 
             for (const line of lines) {
                 if (!line.trim()) continue;
-
-                if (line.startsWith('LOG: ')) {
-                    const msg = line.substring(5);
-                    const div = document.createElement('div');
-                    div.className = 'log-line';
-                    div.innerText = `  ${msg}`;
-                    logBox.appendChild(div);
-                    logBox.scrollTop = logBox.scrollHeight;
-                } else if (line.startsWith('DATA: ')) {
-                    const data = JSON.parse(line.substring(6));
-                    const div = document.createElement('div');
-                    if (data.status === 'success') {
-                        div.className = 'log-line success';
-                        div.innerText = `> ✅ 任务完成！`;
-                    } else {
-                        div.className = 'log-line error';
-                        div.innerText = `> ❌ 任务出错: ${data.msg}`;
-                    }
-                    logBox.appendChild(div);
-                    logBox.scrollTop = logBox.scrollHeight;
-                    window.loadBookList(); // 刷新进度
-                }
+                handleImportLine(line);
             }
         }
     } catch (e) {
-        const div = document.createElement('div');
-        div.className = 'log-line error';
-        div.innerText = `> ❌ 请求异常: ${e}`;
-        logBox.appendChild(div);
+        appendImportLog(`> ❌ 请求异常: ${e}`, 'error');
+    }
+}
+
+// 一键导入：切分 -> AI处理 -> 入库，由后台调度器排队执行
+window.runImportChain = async function(id) {
+    logTaskStart('一键导入', id);
+    try {
+        const res = await fetch('/api/import/jobs/submit', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ book_id: id })
+        });
+        const json = await res.json();
+        if (json.status !== 'success') {
+            appendImportLog(`> ❌ ${json.msg}`, 'error');
+            return;
+        }
+        followImportJob(json.job_id);
+    } catch (e) {
+        appendImportLog(`> ❌ 请求异常: ${e}`, 'error');
+    }
+}
+
+// 订阅任务日志 (SSE)；断线时 EventSource 会带 Last-Event-ID 自动续读
+function followImportJob(jobId, offset = 0) {
+    if (importJobSource) importJobSource.close();
+    localStorage.setItem(IMPORT_JOB_KEY, jobId);
+
+    const es = new EventSource(`/api/import/jobs/${jobId}/stream?offset=${offset}`);
+    importJobSource = es;
+    es.onmessage = (evt) => {
+        handleImportLine(evt.data);
+        if (evt.data.startsWith('DATA: ')) {
+            es.close();
+            if (importJobSource === es) importJobSource = null;
+        }
+    };
+}
+
+// 页面刷新后重新连上未结束的任务
+async function reattachImportJob() {
+    const jobId = localStorage.getItem(IMPORT_JOB_KEY);
+    if (!jobId || importJobSource) return;
+    try {
+        const res = await fetch(`/api/import/jobs/${jobId}`);
+        const json = await res.json();
+        if (json.status !== 'success' || !['queued', 'running'].includes(json.data.status)) {
+            localStorage.removeItem(IMPORT_JOB_KEY);
+            return;
+        }
+        appendImportLog(`> [${new Date().toLocaleTimeString()}] 重新连接任务 #${jobId} (BookID: ${json.data.book_id})...`, 'info');
+        followImportJob(jobId);
+    } catch (e) {
+        console.error(e);
     }
 }
 
@@ -195,6 +267,7 @@ window.deleteBook = async function(id) {
 window.initImportBooks = initImportBooks;
 window.loadBookList = loadBookList;
 window.runTask = runTask;
+window.runImportChain = runImportChain;
 window.openBookModal = openBookModal;
 window.closeBookModal = closeBookModal;
 window.saveBook = saveBook;
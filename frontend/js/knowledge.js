@@ -49,7 +49,7 @@ window.loadMetadataConfig = async function() {
             <div class="filter-item">
                 <span class="filter-label">${label}</span>
                 <input type="text" class="filter-input" data-key="${key}"
-                       placeholder="搜索..." onkeypress="if(event.key==='Enter') loadKnowledgeList(1)">
+                       placeholder="搜索... (=精确 ^前缀)" onkeypress="if(event.key==='Enter') loadKnowledgeList(1)">
             </div>`;
     });
     filterDiv.innerHTML = html;
@@ -58,6 +58,8 @@ window.loadMetadataConfig = async function() {
 
 // 4. 加载列表
 window.loadKnowledgeList = async function(page) {
+    // 回到第一页 (新查询/切换集合) 时清空游标；kbCursors[i] = 第 i+1 页的游标
+    if (page === 1 || !window.kbCursors) window.kbCursors = [null];
     window.currentKbPage = page;
     const colName = document.getElementById('collection-select').value;
     const tbody = document.getElementById('knowledge-list-body');
@@ -79,10 +81,13 @@ window.loadKnowledgeList = async function(page) {
                 collection_name: colName,
                 page: window.currentKbPage,
                 page_size: window.currentKbPageSize,
-                filters: filters
+                filters: filters,
+                cursor: window.kbCursors[page - 1] || null
             })
         });
         const data = await res.json();
+        window.kbCursors[page] = data.next_cursor || null;
+        window.kbHasMore = data.has_more;
         tbody.innerHTML = '';
         if(!data.data || data.data.length === 0) {
             tbody.innerHTML = '<tr><td colspan="3" class="loading-text">暂无数据</td></tr>';
@@ -144,6 +149,7 @@ window.loadKnowledgeList = async function(page) {
 window.changeKbPage = function(delta) {
     const newPage = window.currentKbPage + delta;
     if(newPage < 1) return;
+    if(delta > 0 && window.kbHasMore === false) return; // 已是最后一页
     window.loadKnowledgeList(newPage);
 }
 
@@ -16,6 +16,14 @@ window.loadQuestionList = async function() {
     const searchInput = document.getElementById('search-input');
     const searchText = searchInput ? searchInput.value.trim() : '';
 
+    // 搜索词变化时回到第一页，并清空游标
+    if (searchText !== window.listSearchText) {
+        window.listSearchText = searchText;
+        window.listCursors = [null];
+        window.currentPage = 1;
+    }
+    if (!window.listCursors) window.listCursors = [null];
+
     tbody.innerHTML = '<tr><td colspan="10" class="loading-text">🚀 数据加载中...</td></tr>';
 
     try {
@@ -25,10 +33,14 @@ window.loadQuestionList = async function() {
             body: JSON.stringify({
                 page: window.currentPage,
                 page_size: window.pageSize,
-                search_text: searchText
+                search_text: searchText,
+                // listCursors[i] = 第 i+1 页的游标 (由上一页的 next_cursor 得到)
+                cursor: window.listCursors[window.currentPage - 1] || null
             })
         });
         const data = await res.json();
+        window.listCursors[window.currentPage] = data.next_cursor || null;
+        window.listHasMore = data.has_more;
 
         tbody.innerHTML = '';
         if(!data.data || data.data.length === 0) {
@@ -39,11 +51,15 @@ window.loadQuestionList = async function() {
         data.data.forEach(item => {
             const tr = document.createElement('tr');
             const statusHtml = (st) => `<div class="status-cell"><span class="status-dot ${window.getStatusClass(st)}"></span><span>${st||'未执行'}</span></div>`;
+            // 搜索时显示命中摘要 (后端已转义，只保留 <mark> 高亮)
+            const stemHtml = item.snippet
+                ? `<span class="badge">${item.snippet.field}</span> ${item.snippet.html}`
+                : window.escapeHtml(item.stem);
 
             tr.innerHTML = `
                 <td>${item.question_id}</td>
                 <td><span class="badge">${item.question_type}</span></td>
-                <td class="text-truncate" title="${window.escapeHtml(item.stem)}">${window.escapeHtml(item.stem)}</td>
+                <td class="text-truncate" title="${window.escapeHtml(item.stem)}">${stemHtml}</td>
                 <td class="font-bold">${window.escapeHtml(item.answer)}</td>
                 <td>${item.source}</td>
                 <td>${statusHtml(item.status_dingchun)}</td>
@@ -71,6 +87,7 @@ window.loadQuestionList = async function() {
 window.changePage = function(delta) {
     const newPage = window.currentPage + delta;
     if (newPage < 1) return;
+    if (delta > 0 && window.listHasMore === false) return; // 已是最后一页
     window.currentPage = newPage;
     window.loadQuestionList();
 }
@@ -129,7 +129,7 @@ async function startGeneration() {
                 }
 
                 if (parsed.completion) {
-                    appendSingleQuestion(parsed.completion, parsed.data);
+                    appendSingleQuestion(parsed.completion, parsed.data, parsed.index);
                 }
             }
         }
@@ -150,7 +150,7 @@ async function startGeneration() {
 /**
  * 核心：向界面追加一道新生成的题目
  */
-function appendSingleQuestion(status, data) {
+function appendSingleQuestion(status, data, index) {
     const resultContainer = document.getElementById('final_content');
     const placeholder = document.getElementById('result_placeholder');
     if(placeholder) placeholder.style.display = 'none';
@@ -203,8 +203,12 @@ function appendSingleQuestion(status, data) {
         </div>
     `;
 
-    // 4. 追加到容器
-    resultContainer.appendChild(card);
+    // 4. 追加到容器 (多题并行时完成先后不定，按题号 index 插入)
+    card.dataset.index = index || 0;
+    const next = index
+        ? Array.from(resultContainer.querySelectorAll('.qa-card')).find(c => Number(c.dataset.index) > index)
+        : null;
+    resultContainer.insertBefore(card, next || null);
 
     // 滚动到底部
     const scrollBox = document.getElementById('final_result_area');
@@ -14,7 +14,11 @@ from backend.routers import (
     api_batch_review,
     api_AI_search,
     api_question_agent,
+    api_question_batch,  # 批量编题任务
 )
+from backend.books.import_scheduler import import_scheduler
+from backend.question_agent.batch_generate import question_batch
+from backend.search.question_search import start_fulltext_index_build
 
 app = FastAPI()
 
@@ -27,6 +31,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_import_scheduler():
+    # 导入任务调度器：上次退出时未完成的任务会重新排队
+    import_scheduler.start()
+    # 批量编题任务：中断的任务重新排队，已完成的考点不会重跑
+    question_batch.start()
+    # 题库全文索引：后台检查/创建，建好之前搜索回退为 LIKE
+    start_fulltext_index_build()
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     return Response(content=b"", media_type="image/x-icon")
@@ -40,6 +53,7 @@ app.include_router(api_common.router)
 app.include_router(api_batch_review.router)
 app.include_router(api_AI_search.router)
 app.include_router(api_question_agent.router, prefix="")
+app.include_router(api_question_batch.router)
 
 # === 静态资源挂载 ===
 if os.path.exists("resource"):